@@ -3,6 +3,7 @@ import logging
 import os
 import sys
 import json
+import pickle
 from logging.config import dictConfig
 
 import numpy as np
@@ -24,15 +25,55 @@ from .gibberish_detector.gibberish_singleton import gib_detector
 
 from . import string_classifier
 
+from . import classifier_singleton
 from . import words_finder_singleton
-from .detector import filter_api_keys
-from .detector import detect_api_keys
+from . import words_index
+from .bundle import compile_bundle
+from .detector import detect_api_keys_within
+from .scan_job import ScanJob, DEFAULT_CHUNK_SIZE
+from .literal_lexer import scan_sources
+from . import subspan
+from . import model_benchmark
+from . import surrogate
+from . import profiles
+from . import parallel_detector
+from . import output_writers
+from .detector import score_api_keys_batch
+from .string_batch import StringBatch
+from . import distributed_scan
+from . import git_scan
+from . import archive_scanner
+from . import feature_matrix
+from . import hyperparameter_search
+from . import redactor
+from .classifier_backends import create_backend, DEFAULT_BACKEND, MiniBatchMLPBackend
+
+
+# number of lines of the standard input detected (and written) at once
+OUTPUT_CHUNK_SIZE = 65536
 
 
 def generate_training_set(api_key_files, generic_text_files, dump_file):
-    matrix = string_classifier.generate_training_set(api_key_files, generic_text_files)
-    np.save(dump_file, matrix)
-    logging.info("Training set saved to {0}".format(dump_file))
+    # like np.save, that wrote the training set before
+    if not dump_file.endswith(".npy"):
+        dump_file += ".npy"
+    rows = feature_matrix.write_training_set(api_key_files, generic_text_files, dump_file)
+    logging.info("Training set ({0} rows) saved to {1}".format(rows, dump_file))
+
+
+def train_from_matrix(matrix_file, dump_file, epochs, batch_size):
+    backend_config = getattr(config, "classifier_backend", None) or {}
+    backend = create_backend(backend_config.get("name", DEFAULT_BACKEND), backend_config.get("params"))
+    if not hasattr(backend.model, "partial_fit"):
+        logging.info("The {0} backend can't be trained on mini-batches: using {1}".format(
+            backend.name, MiniBatchMLPBackend.name))
+        backend = MiniBatchMLPBackend()
+    classifier = string_classifier.StringBinaryClassifier(backend=backend)
+    classifier.train_out_of_core(matrix_file, classifier_singleton.good_test, classifier_singleton.bad_test, epochs,
+                                 batch_size)
+    with open(dump_file, "wb") as f:
+        pickle.dump(classifier, f)
+    logging.info("Object saved to {0}".format(dump_file))
 
 
 def test_string(string):
@@ -58,6 +99,41 @@ def test(sort_index):
         print(result)
 
 
+def iter_stdin_chunks(chunk_size=OUTPUT_CHUNK_SIZE):
+    """
+    Reads the standard input in chunks of lines
+
+    :return: a generator over (stripped lines, byte offset of each line) pairs
+    """
+    strings = []
+    offsets = []
+    offset = 0
+    for line in sys.stdin.buffer:
+        strings.append(line.strip())
+        offsets.append(offset)
+        offset += len(line)
+        if len(strings) >= chunk_size:
+            yield strings, offsets
+            strings, offsets = [], []
+    if strings:
+        yield strings, offsets
+
+
+def write_detection(output_format, results_file, api_keys_only):
+    """
+    Detects the API keys in the standard input, chunk by chunk, writing the results of each chunk at once
+    """
+    kwargs = {"verdicts": not api_keys_only} if output_format == "lines" else {}
+    with output_writers.create_writer(output_format, results_file, **kwargs) as writer:
+        first_index = 0
+        for strings, offsets in iter_stdin_chunks():
+            batch = StringBatch.from_strings(strings)
+            detection, scores = score_api_keys_batch(batch)
+            writer.write_batch(batch, detection, scores, offsets, first_index=first_index,
+                               indices=np.flatnonzero(detection) if api_keys_only else None)
+            first_index += len(batch)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='A python program that detects API Keys', add_help=True
@@ -110,12 +186,141 @@ def main():
                         help='List of files containing generic text examples that DOESN\'T contain any Api Key',
                         dest='generic_text_files')
     group2.add_argument('--output-file', action="store", dest='dump_file',
-                        help='Where to output the training set file')
+                        help='Where to output the training set file (the trained classifier, with --train-matrix)')
+    group2.add_argument('--train-matrix', action="store", dest='train_matrix_file',
+                        help='Train a classifier on the TRAIN_MATRIX_FILE training set (see --generate-training-set) '
+                             'in mini-batches read from disk, so that it needs not fit in memory, and save it to '
+                             '--output-file. The configured backend is used if it supports mini-batches, '
+                             'mlp_minibatch otherwise')
+    group2.add_argument('--epochs', action="store", dest='epochs', type=int, default=5,
+                        help='Number of passes over the training set, with --train-matrix')
+    group2.add_argument('--batch-size', action="store", dest='batch_size', type=int, default=1024,
+                        help='Number of rows of each mini-batch, with --train-matrix')
     group3 = parser.add_argument_group()
     group3.add_argument('--filter-apikeys', action='store_true', dest='boolean_filter',
                         help='Filter potential apikeys from strings in stdin.')
     group3.add_argument('--detect-apikeys', action='store_true', dest='boolean_detect',
                         help='Detect potential apikeys from strings in stdin.')
+    group3.add_argument('--time-budget', action='store', dest='time_budget', type=float,
+                        help='Time budget in seconds for --filter-apikeys and --detect-apikeys. The most promising '
+                             'strings are classified first; with --detect-apikeys, strings that could not be '
+                             'evaluated before the deadline are reported as None.')
+    group3.add_argument('--sub-spans', action='store_true', dest='boolean_sub_spans',
+                        help='Look for API keys embedded inside longer strings (e.g. URLs, JSON blobs) with '
+                             'sliding windows. With --filter-apikeys, prints the keys found; with --detect-apikeys, '
+                             'prints the (start, end) offsets of the keys inside each string.')
+    group3.add_argument('--output-format', action='store', dest='output_format', default='lines',
+                        choices=output_writers.OUTPUT_FORMATS,
+                        help='Output of --filter-apikeys and --detect-apikeys: the bare strings or verdicts (lines), '
+                             'or records with index, source, byte offset, classifier score, verdict and string '
+                             '(jsonl, csv), or a compact binary columnar file with index, score, verdict, source '
+                             'and offset (columnar, needs --results-file)')
+    group3.add_argument('--results-file', action='store', dest='results_file',
+                        help='Where to write the output of --filter-apikeys, --detect-apikeys and --redact, '
+                             'instead of the standard output')
+    group3.add_argument('--threads', action='store', dest='threads', type=int,
+                        help='Number of threads for --filter-apikeys, --detect-apikeys and --redact, that share '
+                             'the same models')
+    group3.add_argument('--profiles', nargs='+', dest='profiles',
+                        help='Names of the detection profiles (see the profiles key of config.yml, "default" is '
+                             'the global settings) to evaluate the strings against, at once. With '
+                             '--filter-apikeys, prints the profile name and the key for each key found; with '
+                             '--detect-apikeys, prints the results of all the profiles for each string.')
+    group3.add_argument('--redact', action='store_true', dest='boolean_redact',
+                        help='Copy the standard input to the standard output (or to --results-file), replacing the '
+                             'API keys inside each line with a mask')
+    group3.add_argument('--redaction-mask', action='store', dest='redaction_mask', default=redactor.DEFAULT_MASK,
+                        help='What --redact replaces API keys with, defaults to "{0}"'.format(redactor.DEFAULT_MASK))
+    group3.add_argument('--redaction-hash', action='store_true', dest='boolean_redaction_hash',
+                        help='Follow the mask of --redact with "#" and a hash of the API key, so that the '
+                             'occurrences of the same key can be correlated')
+    group3.add_argument('--redaction-hash-key', action='store', dest='redaction_hash_key',
+                        help='Secret key of the --redaction-hash hashes (HMAC-SHA256), so that they cannot be '
+                             'checked against guessed keys')
+    group4 = parser.add_argument_group()
+    group4.add_argument('--scan-job', action='store', dest='scan_job_dir',
+                        help='Run (or resume) a checkpointed scan of the files specified with --inputs, storing '
+                             'the progress journal and the findings inside the SCAN_JOB_DIR directory')
+    group4.add_argument('--scan-sources', action='store_true', dest='boolean_scan_sources',
+                        help='Detect API keys inside the string literals of the source files (Java, Kotlin, '
+                             'JavaScript, Python, smali, XML) specified with --inputs, printing file, line and '
+                             'column of each one')
+    group4.add_argument('--scan-archives', action='store_true', dest='boolean_scan_archives',
+                        help='Detect API keys inside the files and the archives (zip, jar, aar, apk, tar, tar.gz...) '
+                             'specified with --inputs, recursing into nested archives without extracting them, '
+                             'printing the nested path and the position of each one')
+    group4.add_argument('--archive-depth', action='store', dest='archive_depth', type=int,
+                        default=archive_scanner.DEFAULT_MAX_DEPTH,
+                        help='Maximum nesting depth of the archives opened by --scan-archives')
+    group4.add_argument('--archive-member-size', action='store', dest='archive_member_size', type=int,
+                        default=archive_scanner.DEFAULT_MAX_MEMBER_BYTES,
+                        help='Archive members larger than ARCHIVE_MEMBER_SIZE bytes, once uncompressed, are skipped')
+    group4.add_argument('--scan-git', action='store', dest='git_repository',
+                        help='Detect API keys inside the history of the GIT_REPOSITORY git repository, printing '
+                             'commit, path, line and column of each one. Each blob is scanned once: results are '
+                             'kept in a store, so that later runs only scan the blobs of the new commits')
+    group4.add_argument('--git-store', action='store', dest='git_store',
+                        help='Path of the results store of --scan-git, defaults to {0} inside the .git '
+                             'directory'.format(git_scan.STORE_FILE))
+    group4.add_argument('--watch', action='store_true', dest='boolean_watch',
+                        help='Scan the files and directories specified with --inputs (one string for each line), '
+                             'then keep watching them and print the API keys of created and modified files as they '
+                             'appear; files that are only appended to are scanned from where they were left')
+    group4.add_argument('--debounce', action='store', dest='debounce', type=float, default=0.5,
+                        help='Seconds without changes after which a modified file is rescanned, with --watch')
+    group4.add_argument('--inputs', nargs='+', dest='inputs',
+                        help='List of files and/or directories to be scanned, one string for each line '
+                             '(source files, with --scan-sources)')
+    group4.add_argument('--chunk-size', action='store', dest='chunk_size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Number of lines processed between two checkpoints')
+    group5 = parser.add_argument_group()
+    group5.add_argument('--coordinator', action='store', dest='coordinator_queue',
+                        help='Split the files specified with --inputs into work units, put them on the '
+                             'COORDINATOR_QUEUE SQLite work queue, wait for the workers and print the merged report')
+    group5.add_argument('--worker', action='store', dest='worker_queue',
+                        help='Process work units from the WORKER_QUEUE SQLite work queue until it is empty')
+    group5.add_argument('--unit-size', action='store', dest='unit_size', type=int,
+                        default=distributed_scan.DEFAULT_UNIT_BYTES, help='Size in bytes of each work unit')
+    group5.add_argument('--report-file', action='store', dest='report_file',
+                        help='Where to save the coordinator report, instead of printing it')
+    group6 = parser.add_argument_group()
+    group6.add_argument('--build-words-index', action='store_true', dest='boolean_build_words_index',
+                        help='(Re)build the memory-mapped dictionary index from the wordlists in config.yml')
+    group6.add_argument('--build-surrogate', action='store_true', dest='boolean_build_surrogate',
+                        help='(Re)build the lookup-grid surrogate of the classifier, set by the surrogate key of '
+                             'config.yml')
+    group6.add_argument('--compile-bundle', action='store', dest='bundle_file',
+                        help='Compile models, indexes, tables and thresholds into a single deployment bundle, '
+                             'to be referenced by the bundle key of config.yml')
+    group6.add_argument('--benchmark-models', action='store', dest='benchmark_file',
+                        help='Train and measure candidate classifiers (accuracy, errors, size, load time, single '
+                             'and batched inference latency) on the training/test set matrices in datasets, saving '
+                             'the results and the Pareto front to BENCHMARK_FILE (CSV if it ends with .csv, '
+                             'JSON otherwise)')
+    group6.add_argument('--search-hyperparameters', action='store', dest='search_report_file',
+                        help='Train classifier backend configurations in parallel worker processes (with early '
+                             'stopping and a time budget) on the training set matrix in datasets, saving accuracy, '
+                             'train time and inference latency of each one, and the best classifier_backend setting, '
+                             'to the SEARCH_REPORT_FILE JSON file. The best classifier is saved to --output-file, '
+                             'if specified')
+    group6.add_argument('--search-space', action='store', dest='search_space_file',
+                        help='JSON file with the configurations tried by --search-hyperparameters, a list of '
+                             '{"name": backend, "params": {...}} objects')
+    group6.add_argument('--search-workers', action='store', dest='search_workers', type=int,
+                        help='Number of worker processes of --search-hyperparameters, defaults to the CPUs count')
+    group6.add_argument('--search-budget', action='store', dest='search_budget', type=float,
+                        default=hyperparameter_search.DEFAULT_TIME_BUDGET,
+                        help='Maximum training seconds of each configuration of --search-hyperparameters')
+    group6.add_argument('--benchmark-threads', action='store', dest='threads_benchmark_file',
+                        help='Measure the throughput of the thread-parallel detector with 1, 2, 4 and 8 threads on '
+                             'the test sets of config.yml, saving the results (and whether the GIL is enabled) to '
+                             'the THREADS_BENCHMARK_FILE JSON file')
+    group6.add_argument('--benchmark-redaction', action='store', dest='redaction_benchmark_file',
+                        help='Measure the throughput of --redact with 1, 2 and 4 threads on a synthetic log that '
+                             'leaks the API keys of the test sets of config.yml, saving the results to the '
+                             'REDACTION_BENCHMARK_FILE JSON file')
+    group6.add_argument('--bundle-version', action='store', dest='bundle_version',
+                        help='Version label of the compiled bundle, defaults to the current UTC timestamp')
     results = parser.parse_args()
 
     # functions that don't need gibberish detector
@@ -131,26 +336,194 @@ def main():
             test(results.sort_index)
             return
 
+    if results.boolean_build_words_index:
+        if not words_finder_singleton.index_path:
+            parser.error("words_index is not set in config.yml")
+        words_index.load_or_create_index(words_finder_singleton.wordlists, words_finder_singleton.index_path, True)
+        return
+
+    if results.boolean_build_surrogate:
+        if not classifier_singleton.surrogate_path:
+            parser.error("surrogate is not set in config.yml")
+        surrogate.load_or_create_surrogate(classifier_singleton.classifier.classifier,
+                                           classifier_singleton.surrogate_path, True)
+        return
+
+    if results.benchmark_file:
+        model_benchmark.dump_results(model_benchmark.run_benchmark(), results.benchmark_file)
+        return
+
+    if results.search_report_file:
+        search_space = hyperparameter_search.load_search_space(results.search_space_file) \
+            if results.search_space_file else None
+        search_results, test_result, best = hyperparameter_search.run_search(
+            search_space, workers=results.search_workers, time_budget=results.search_budget)
+        hyperparameter_search.dump_results(search_results, test_result, best, results.search_report_file)
+        logging.info("Best configuration: {0}, test set: {1}".format(
+            json.dumps(hyperparameter_search.best_configuration(best)), json.dumps(test_result)))
+        if results.dump_file:
+            with open(results.dump_file, "wb") as f:
+                pickle.dump(best, f)
+            logging.info("Object saved to {0}".format(results.dump_file))
+        return
+
+    if results.threads_benchmark_file:
+        strings = []
+        for file_path in classifier_singleton.good_test + classifier_singleton.bad_test:
+            strings.extend(string_classifier.read_lines(file_path))
+        with open(results.threads_benchmark_file, "w", encoding="utf-8") as f:
+            json.dump(parallel_detector.benchmark_threads(strings), f, indent=2)
+        return
+
+    if results.redaction_benchmark_file:
+        api_keys = []
+        for file_path in classifier_singleton.good_test:
+            api_keys.extend(string_classifier.read_lines(file_path))
+        words = []
+        for file_path in classifier_singleton.bad_test:
+            words.extend(string_classifier.read_lines(file_path))
+        with open(results.redaction_benchmark_file, "w", encoding="utf-8") as f:
+            json.dump(redactor.benchmark_redaction(api_keys, words), f, indent=2)
+        return
+
+    if results.boolean_redact:
+        output = open(results.results_file, "wb") if results.results_file else sys.stdout.buffer
+        try:
+            stats = redactor.redact_stream(sys.stdin.buffer, output,
+                                           redactor.Redactor(results.redaction_mask, results.boolean_redaction_hash,
+                                                             results.redaction_hash_key),
+                                           results.threads or 1)
+        finally:
+            if results.results_file:
+                output.close()
+        logging.info("Redaction: {0}".format(stats))
+        return
+
+    if results.bundle_file:
+        manifest = compile_bundle(results.bundle_file, results.bundle_version)
+        print("{0} {1}".format(manifest["version"], manifest["checksum"]))
+        return
+
+    if results.scan_job_dir:
+        if not results.inputs:
+            parser.error("--scan-job needs --inputs to be specified")
+        ScanJob(results.inputs, results.scan_job_dir, results.chunk_size).run()
+        return
+
+    if results.boolean_scan_sources:
+        if not results.inputs:
+            parser.error("--scan-sources needs --inputs to be specified")
+        for literal in scan_sources(results.inputs):
+            print(literal)
+        return
+
+    if results.boolean_watch:
+        if not results.inputs:
+            parser.error("--watch needs --inputs to be specified")
+        # imported here, since it needs the models to be loaded
+        from . import watcher
+        for finding in watcher.watch(results.inputs, results.debounce):
+            print(finding, flush=True)
+        return
+
+    if results.boolean_scan_archives:
+        if not results.inputs:
+            parser.error("--scan-archives needs --inputs to be specified")
+        for finding in archive_scanner.scan_archives(results.inputs, results.archive_depth,
+                                                     results.archive_member_size):
+            print(finding)
+        return
+
+    if results.git_repository:
+        for finding in git_scan.scan_git_history(results.git_repository, results.git_store, results.chunk_size):
+            print(finding)
+        return
+
+    if results.coordinator_queue:
+        coordinator = distributed_scan.Coordinator(distributed_scan.SQLiteWorkQueue(results.coordinator_queue))
+        if results.inputs:
+            coordinator.submit(results.inputs, results.unit_size)
+        coordinator.wait()
+        report = coordinator.report()
+        if results.report_file:
+            distributed_scan.dump_report(report, results.report_file)
+        else:
+            print(json.dumps(report, indent=2))
+        return
+
+    if results.worker_queue:
+        worker = distributed_scan.Worker(distributed_scan.SQLiteWorkQueue(results.worker_queue))
+        logging.info("Work units completed: {0}".format(worker.run(wait_for_units=True)))
+        return
+
     if results.boolean_entropy or results.boolean_sequentiality or results.boolean_charset or \
             results.boolean_gibberish or results.boolean_wordspercentage or results.boolean_filter or \
             results.boolean_detect:
-        print("Enter a list of string, one for each line. Press CTRL+D when finished")
+        detection_options = [option for option, value in (
+            ("--sub-spans", results.boolean_sub_spans), ("--time-budget", results.time_budget is not None),
+            ("--profiles", results.profiles), ("--threads", results.threads)) if value]
+        if (results.boolean_filter or results.boolean_detect) and detection_options and (
+                results.output_format != "lines" or results.results_file):
+            parser.error("--output-format and --results-file can't be combined with {0}".format(
+                ", ".join(detection_options)))
+        # structured output must start with its first record: the prompt goes to the standard error
+        print("Enter a list of string, one for each line. Press CTRL+D when finished",
+              file=sys.stdout if results.output_format == "lines" and not results.results_file else sys.stderr)
+        if (results.boolean_filter or results.boolean_detect) and not detection_options:
+            if results.output_format == "columnar" and not results.results_file:
+                parser.error("--output-format columnar needs --results-file to be specified")
+            write_detection(results.output_format, results.results_file, results.boolean_filter)
+            return
         strings = []
-        for line in sys.stdin:
-            strings.append(line.strip())
+        if results.boolean_filter or results.boolean_detect:
+            # the detector consumes raw bytes directly, skipping the decoding of ASCII strings
+            for line in sys.stdin.buffer:
+                strings.append(line.strip())
+        else:
+            for line in sys.stdin:
+                strings.append(line.strip())
 
         values = []
-        if results.boolean_filter:
-            values = filter_api_keys(strings)
-            for string in values:
-                print(string)
+        if results.boolean_sub_spans and (results.boolean_filter or results.boolean_detect):
+            if results.boolean_filter:
+                values = subspan.extract_api_keys(strings)
+            else:
+                values = subspan.detect_api_key_spans(strings)
+            for value in values:
+                print(value)
+            return
+        if results.profiles and (results.boolean_filter or results.boolean_detect):
+            available = profiles.load_profiles()
+            unknown = [name for name in results.profiles if name not in available]
+            if unknown:
+                parser.error("Unknown profiles: {0}".format(", ".join(unknown)))
+            detections = profiles.detect_api_keys_profiles(strings, [available[name] for name in results.profiles])
+            if results.boolean_filter:
+                for name, detection in detections.items():
+                    for string, is_api_key in zip(strings, detection):
+                        if is_api_key:
+                            print("{0}\t{1}".format(name, string.decode(errors="replace")))
+            else:
+                print("\t".join(detections))
+                for values in zip(*detections.values()):
+                    print("\t".join(str(value) for value in values))
             return
-        if results.boolean_detect:
-            values = detect_api_keys(strings)
-            for string in values:
-                print(string)
+        if results.time_budget is not None and (results.boolean_filter or results.boolean_detect):
+            scan = detect_api_keys_within(strings, results.time_budget)
+            logging.info("Scan coverage: {0}".format(scan))
+            values = scan.api_keys if results.boolean_filter else scan.detection
+            for value in values:
+                print(value)
             return
-        elif results.boolean_entropy:
+        if results.threads and (results.boolean_filter or results.boolean_detect):
+            if results.boolean_filter:
+                values = parallel_detector.filter_api_keys_parallel(strings, max_workers=results.threads)
+            else:
+                values = parallel_detector.detect_api_keys_parallel(strings, max_workers=results.threads)
+            for value in values:
+                print(value)
+            return
+        if results.boolean_entropy:
             for string in strings:
                 values.append(entropy.normalized_entropy(string, cset.get_narrower_charset(string)))
         elif results.boolean_sequentiality:
@@ -172,6 +545,11 @@ def main():
             print("{0} {1}".format(value, line))
         return
 
+    elif results.train_matrix_file:
+        if not results.dump_file:
+            parser.error("--train-matrix needs --output-file to be specified")
+        train_from_matrix(results.train_matrix_file, results.dump_file, results.epochs, results.batch_size)
+        return
     elif results.boolean_generate_training:
         if results.api_key_files and results.generic_text_files and results.dump_file:
             generate_training_set(results.api_key_files, results.generic_text_files, results.dump_file)
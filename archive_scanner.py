@@ -0,0 +1,241 @@
+"""
+Scan of archives (jar, aar, apk, zip, tar, tar.gz...) without extracting them to disk.
+Archives are read as streams: tar files member after member, zip files through their central directory, gzip files
+by decompressing them on the fly. Members that are archives themselves are read into memory and walked in turn,
+up to a maximum nesting depth; members larger than a maximum size (once uncompressed) are skipped, so that a
+malicious archive cannot exhaust memory. The strings of the other members (see git_scan.iter_blob_strings, and
+the printable runs of binary members, e.g. class and dex files) are packed into StringBatch chunks and detected
+at once. Findings carry the full nested path, the archive paths being joined by NESTED_SEPARATOR, e.g.
+"app.apk!/lib/sdk.aar!/classes.jar!/com/sdk/Config.class".
+"""
+import gzip
+import io
+import logging
+import os
+import re
+import tarfile
+import zipfile
+
+from . import config
+from .git_scan import BINARY_SNIFF_BYTES, TOKEN_RE, family_of, iter_blob_strings
+from .scan_job import list_input_files
+from .string_batch import StringBatch
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_MAX_DEPTH = 5
+DEFAULT_MAX_MEMBER_BYTES = 64 << 20
+NESTED_SEPARATOR = "!/"
+
+ZIP = "zip"
+TAR = "tar"
+GZIP = "gzip"
+ZIP_EXTENSIONS = (".zip", ".jar", ".aar", ".apk", ".war", ".ear", ".xapk", ".apks")
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+GZIP_EXTENSIONS = (".gz",)
+ZIP_MAGIC = b"PK\x03\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+TAR_MAGIC = b"ustar"
+TAR_MAGIC_OFFSET = 257
+# errors of corrupted (or unsupported) archives, that are skipped
+ARCHIVE_ERRORS = (zipfile.BadZipFile, zipfile.LargeZipFile, tarfile.TarError, EOFError, OSError, NotImplementedError)
+
+PRINTABLE_RUN_RE = re.compile(rb"[\x21-\x7e]+")
+BYTES_TOKEN_RE = re.compile(TOKEN_RE.pattern.encode("ascii"))
+
+
+class ArchiveFinding(object):
+    def __init__(self, path, line, column, value):
+        """
+        :param path: nested path of the member, starting from the scanned file
+        :param line: line of the API key inside the member, 1-based; None for binary members
+        :param column: column of the API key inside the member, 1-based; its byte offset for binary members
+        :param value: the API key
+        """
+        self.path = path
+        self.line = line
+        self.column = column
+        self.value = value
+
+    def __str__(self):
+        if self.line is None:
+            return "{0}@{1}: {2}".format(self.path, self.column, self.value)
+        return "{0}:{1}:{2}: {3}".format(self.path, self.line, self.column, self.value)
+
+
+def archive_kind(name, head=b""):
+    """
+    :param name: name of the file
+    :param head: the first bytes of the file, if available, to recognize archives with other extensions
+    :return: one of ZIP, TAR and GZIP, None if the file is not an archive
+    :rtype: str
+    """
+    lower = name.lower()
+    if lower.endswith(ZIP_EXTENSIONS) or head.startswith(ZIP_MAGIC):
+        return ZIP
+    if lower.endswith(TAR_EXTENSIONS) or head[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + len(TAR_MAGIC)] == TAR_MAGIC:
+        return TAR
+    if lower.endswith(GZIP_EXTENSIONS) or head.startswith(GZIP_MAGIC):
+        return GZIP
+    return None
+
+
+def iter_binary_strings(data, min_length=None):
+    """
+    :param data: the contents of a binary file
+    :param min_length: shorter strings are skipped; defaults to the min_key_length of config.yml
+    :return: a generator over the (byte offset, string) of the tokens of the printable runs of data, as bytes
+    """
+    if min_length is None:
+        min_length = config.min_key_length
+    for run in PRINTABLE_RUN_RE.finditer(data):
+        if run.end() - run.start() < min_length:
+            continue
+        for match in BYTES_TOKEN_RE.finditer(data, run.start(), run.end()):
+            if match.end() - match.start() >= min_length:
+                yield match.start(), match.group()
+
+
+class ArchiveScanner(object):
+    def __init__(self, max_depth=DEFAULT_MAX_DEPTH, max_member_bytes=DEFAULT_MAX_MEMBER_BYTES, min_length=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param max_depth: archives nested deeper are skipped; 0 means that no archive is opened
+        :param max_member_bytes: larger members (once uncompressed) are skipped
+        :param min_length: shorter strings are skipped; defaults to the min_key_length of config.yml
+        :param chunk_size: number of strings submitted to the detector at once
+        """
+        self.max_depth = max_depth
+        self.max_member_bytes = max_member_bytes
+        self.min_length = min_length
+        self.chunk_size = chunk_size
+
+    def iter_members(self, path):
+        """
+        :param path: path of a file, either an archive or not
+        :return: a generator over the (nested path, contents) of the files inside path, recursively;
+                 path itself if it is not an archive
+        """
+        with open(path, "rb") as f:
+            kind = archive_kind(path, f.read(TAR_MAGIC_OFFSET + len(TAR_MAGIC)))
+            if kind is None or self.max_depth < 1:
+                if os.fstat(f.fileno()).st_size > self.max_member_bytes:
+                    logging.info("Skipping {0}: larger than {1} bytes".format(path, self.max_member_bytes))
+                    return
+                f.seek(0)
+                yield path, f.read()
+                return
+            f.seek(0)
+            yield from self._walk_archive(kind, f, path, 1)
+
+    def _walk_archive(self, kind, fileobj, path, depth):
+        try:
+            for name, data in self._read_members(kind, fileobj, path):
+                member_path = path + NESTED_SEPARATOR + name
+                member_kind = archive_kind(name, data[:TAR_MAGIC_OFFSET + len(TAR_MAGIC)])
+                if member_kind is None:
+                    yield member_path, data
+                elif depth < self.max_depth:
+                    yield from self._walk_archive(member_kind, io.BytesIO(data), member_path, depth + 1)
+                else:
+                    logging.info("Skipping {0}: nested deeper than {1} archives".format(member_path, self.max_depth))
+        except ARCHIVE_ERRORS as e:
+            logging.warning("Skipping the rest of {0}: {1}".format(path, e))
+
+    def _read_limited(self, fileobj, path):
+        data = fileobj.read(self.max_member_bytes + 1)
+        if len(data) > self.max_member_bytes:
+            logging.info("Skipping {0}: larger than {1} bytes".format(path, self.max_member_bytes))
+            return None
+        return data
+
+    def _read_members(self, kind, fileobj, path):
+        """
+        :return: a generator over the (name, contents) of the regular files of an archive, in archive order
+        """
+        if kind == ZIP:
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > self.max_member_bytes:
+                        logging.info("Skipping {0}{1}{2}: larger than {3} bytes".format(
+                            path, NESTED_SEPARATOR, info.filename, self.max_member_bytes))
+                        continue
+                    with archive.open(info) as member:
+                        # the declared size may be forged
+                        data = self._read_limited(member, path + NESTED_SEPARATOR + info.filename)
+                    if data is not None:
+                        yield info.filename, data
+        elif kind == TAR:
+            # "r|*" reads the members sequentially, without seeking, whatever the compression
+            with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+                for info in archive:
+                    if not info.isfile():
+                        continue
+                    if info.size > self.max_member_bytes:
+                        logging.info("Skipping {0}{1}{2}: larger than {3} bytes".format(
+                            path, NESTED_SEPARATOR, info.name, self.max_member_bytes))
+                        continue
+                    yield info.name, archive.extractfile(info).read()
+        else:
+            with gzip.GzipFile(fileobj=fileobj) as archive:
+                data = self._read_limited(archive, path)
+            if data is not None:
+                name = os.path.basename(path.rsplit(NESTED_SEPARATOR, 1)[-1])
+                yield (name[:-len(".gz")] if name.lower().endswith(".gz") else name), data
+
+    def iter_strings(self, path, data):
+        """
+        :param path: nested path of a member
+        :param data: the contents of the member
+        :return: a generator over the (line, column, string) of the member, see ArchiveFinding
+        """
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            for offset, string in iter_binary_strings(data, self.min_length):
+                yield None, offset, string
+        else:
+            # members are already limited by max_member_bytes
+            yield from iter_blob_strings(data, family_of(path), self.min_length, self.max_member_bytes, path)
+
+    def scan(self, inputs):
+        """
+        Detects API keys inside files and archives
+
+        :param inputs: paths of files and/or directories, the latter are walked recursively
+        :return: a generator over the ArchiveFinding objects
+        """
+        # imported here, so that walking archives doesn't need the models to be loaded
+        from .detector import detect_api_keys_batch
+
+        chunk = []
+        for path in list_input_files(inputs):
+            for member_path, data in self.iter_members(path):
+                for line, column, string in self.iter_strings(member_path, data):
+                    chunk.append((member_path, line, column, string))
+                    if len(chunk) >= self.chunk_size:
+                        yield from self._detect(chunk, detect_api_keys_batch)
+                        chunk = []
+        if chunk:
+            yield from self._detect(chunk, detect_api_keys_batch)
+
+    @staticmethod
+    def _detect(chunk, detect_api_keys_batch):
+        batch = StringBatch.from_strings([item[3] for item in chunk])
+        for index in detect_api_keys_batch(batch).nonzero()[0].tolist():
+            path, line, column, _ = chunk[index]
+            yield ArchiveFinding(path, line, column, batch[index])
+
+
+def scan_archives(inputs, max_depth=DEFAULT_MAX_DEPTH, max_member_bytes=DEFAULT_MAX_MEMBER_BYTES, min_length=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Detects API keys inside files and archives, recursing into nested archives
+
+    :param inputs: paths of files and/or directories, the latter are walked recursively
+    :param max_depth: archives nested deeper are skipped
+    :param max_member_bytes: larger members (once uncompressed) are skipped
+    :param min_length: shorter strings are skipped; defaults to the min_key_length of config.yml
+    :param chunk_size: number of strings submitted to the detector at once
+    :return: a generator over the ArchiveFinding objects
+    """
+    return ArchiveScanner(max_depth, max_member_bytes, min_length, chunk_size).scan(inputs)
@@ -0,0 +1,117 @@
+"""
+asyncio-native version of the detector API.
+Feature extraction and prediction run inside an executor (the event loop's default one if not specified),
+one chunk of strings at a time, so that the event loop is never blocked for a whole batch.
+Up to max_in_flight chunks are processed concurrently; the underlying models are loaded once, at import time,
+and are only read afterwards, so they are shared by all the executor threads.
+"""
+import asyncio
+import collections
+import itertools
+
+from .detector import detect_api_keys
+from .detector import filter_api_keys
+
+DEFAULT_CHUNK_SIZE = 1024
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+def _chunks(strings, chunk_size):
+    iterator = iter(strings)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _achunks(strings, chunk_size):
+    if not hasattr(strings, '__aiter__'):
+        for chunk in _chunks(strings, chunk_size):
+            yield chunk
+        return
+    chunk = []
+    async for string in strings:
+        chunk.append(string)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _map_chunks(function, strings, executor, chunk_size, max_in_flight):
+    """
+    Applies function to each chunk of strings inside the executor, with at most max_in_flight concurrent chunks.
+    Strings are read lazily, as chunks complete, so that only max_in_flight chunks are pending at once
+
+    :return: the results of each chunk, in order
+    :rtype: list
+    """
+    loop = asyncio.get_running_loop()
+    results = []
+    pending = collections.deque()
+    for chunk in _chunks(strings, chunk_size):
+        pending.append(loop.run_in_executor(executor, function, chunk))
+        if len(pending) >= max_in_flight:
+            results.append(await pending.popleft())
+    while pending:
+        results.append(await pending.popleft())
+    return results
+
+
+async def adetect_api_keys(strings, executor=None, chunk_size=DEFAULT_CHUNK_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Async version of detector.detect_api_keys
+
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param executor: the concurrent.futures.Executor where detection runs; None for the loop's default executor
+    :param chunk_size: number of strings processed by each executor job
+    :param max_in_flight: maximum number of chunks processed concurrently
+    :return: a list of booleans, True for each string that is an API key
+    :rtype: list
+    """
+    results = await _map_chunks(detect_api_keys, strings, executor, chunk_size, max_in_flight)
+    return list(itertools.chain.from_iterable(results))
+
+
+async def afilter_api_keys(strings, executor=None, chunk_size=DEFAULT_CHUNK_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Async version of detector.filter_api_keys
+
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param executor: the concurrent.futures.Executor where detection runs; None for the loop's default executor
+    :param chunk_size: number of strings processed by each executor job
+    :param max_in_flight: maximum number of chunks processed concurrently
+    :return: the strings that are API keys, decoded
+    :rtype: list
+    """
+    results = await _map_chunks(filter_api_keys, strings, executor, chunk_size, max_in_flight)
+    return list(itertools.chain.from_iterable(results))
+
+
+async def aiter_detect_api_keys(strings, executor=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                                max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Async iterator version of detector.detect_api_keys, suited for unbounded streams of strings.
+    Strings are read lazily, so that at most max_in_flight chunks are kept in memory
+
+    :param strings: an iterable or an async iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param executor: the concurrent.futures.Executor where detection runs; None for the loop's default executor
+    :param chunk_size: number of strings processed by each executor job
+    :param max_in_flight: maximum number of chunks processed concurrently
+    :return: an async iterator over (string, is_api_key) pairs, in input order
+    """
+    loop = asyncio.get_running_loop()
+    pending = collections.deque()
+    async for chunk in _achunks(strings, chunk_size):
+        pending.append((chunk, loop.run_in_executor(executor, detect_api_keys, chunk)))
+        if len(pending) >= max_in_flight:
+            chunk, future = pending.popleft()
+            for pair in zip(chunk, await future):
+                yield pair
+    while pending:
+        chunk, future = pending.popleft()
+        for pair in zip(chunk, await future):
+            yield pair
+
@@ -0,0 +1,179 @@
+"""
+Single-file deployment bundle of every runtime artifact: trained classifier, gibberish transition matrix,
+dictionary and blacklist indexes, charset distance tables and thresholds.
+The bundle is a small header, a JSON manifest and a list of 64-bytes aligned sections, each with its own
+SHA-256 checksum. It is loaded with a single read-only mmap, and written with a rename, so that a rollout
+either sees the whole new bundle or the whole old one.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+
+import numpy as np
+
+from . import charset as cset
+from .gibberish_detector.gibberish_detector import GibberishDetector
+from .words_index import WordsIndex, atomic_writer, build_index, strip_line_terminators
+
+MAGIC = b"AKDBUNDL"
+FORMAT_VERSION = 1
+# magic, format version, manifest length
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 64
+
+CLASSIFIER = "classifier"
+GIBBERISH_MATRIX = "gibberish_matrix"
+WORDS_INDEX = "words_index"
+BLACKLIST_INDEX = "blacklist_index"
+CHARSET_DISTANCES = "charset_distances"
+
+
+def _align(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _charset_distances_section():
+    """
+    Serializes the distance distribution of every charset as (charset index, distance, probability) rows,
+    keeping the order of the distribution keys, which the sequentiality computation depends on
+    """
+    rows = []
+    for charset_id, charset in enumerate(cset.Charset):
+        for distance, probability in cset.get_char_distance_distribution(str(charset)).items():
+            rows.append((charset_id, distance, probability))
+    return np.array(rows, dtype=np.float64).tobytes()
+
+
+def compile_bundle(bundle_path, version=None):
+    """
+    Compiles the currently configured models and settings into a bundle
+
+    :param bundle_path: where to save the bundle
+    :param version: a version label for the bundle, defaults to the current UTC timestamp
+    :return: the bundle manifest
+    :rtype: dict
+    """
+    # imported here, since the singletons themselves may load a bundle
+    from . import config
+    from .classifier_singleton import classifier
+    from .gibberish_detector.gibberish_singleton import gib_detector
+    from .strings_filter_singleton import blacklists
+    from .surrogate import SurrogateClassifier
+    from .words_finder_singleton import wordlists
+
+    if isinstance(classifier, SurrogateClassifier):
+        # the surrogate grid is derived from the trained classifier, and kept next to the bundle
+        classifier = classifier.classifier
+    sections = [(CLASSIFIER, pickle.dumps(classifier, protocol=pickle.HIGHEST_PROTOCOL)),
+                (GIBBERISH_MATRIX, np.array(gib_detector.log_prob_mat, dtype=np.float64).tobytes()),
+                (WORDS_INDEX, build_index(wordlists)),
+                (BLACKLIST_INDEX, build_index(blacklists, strip_line_terminators)),
+                (CHARSET_DISTANCES, _charset_distances_section())]
+    manifest = {"version": version or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()),
+                "settings": {"min_key_length": config.min_key_length,
+                             "max_key_length": config.max_key_length,
+                             "word_content_threshold": config.word_content_threshold,
+                             "gibberish_threshold": gib_detector.threshold},
+                "sections": {}}
+    # sections follow the manifest, so their offsets depend on its length: the manifest is padded to a
+    # fixed-point length, since offsets may only grow while it is being filled
+    manifest_length = 0
+    while True:
+        offset = _align(HEADER.size + manifest_length)
+        digest = hashlib.sha256()
+        for name, data in sections:
+            manifest["sections"][name] = {"offset": offset, "size": len(data),
+                                          "sha256": hashlib.sha256(data).hexdigest()}
+            digest.update(data)
+            offset = _align(offset + len(data))
+        manifest["checksum"] = digest.hexdigest()
+        encoded = json.dumps(manifest, sort_keys=True).encode("utf-8")
+        if len(encoded) <= manifest_length:
+            break
+        manifest_length = _align(len(encoded))
+    encoded = encoded.ljust(manifest_length, b" ")
+
+    with atomic_writer(bundle_path) as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+        f.write(encoded)
+        for name, data in sections:
+            f.seek(manifest["sections"][name]["offset"])
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    logging.info("Bundle {0} saved to {1}".format(manifest["version"], bundle_path))
+    return manifest
+
+
+class Bundle(object):
+    def __init__(self, bundle_path, verify=True):
+        """
+        Memory-maps a bundle
+
+        :param bundle_path: path of the bundle file
+        :param verify: if True, the checksum of every section is verified
+        """
+        with open(bundle_path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, manifest_length = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("{0} is not a valid bundle (or its format is not supported)".format(bundle_path))
+        self.manifest = json.loads(self.buffer[HEADER.size:HEADER.size + manifest_length].decode("utf-8"))
+        self.version = self.manifest["version"]
+        self.settings = self.manifest["settings"]
+        if verify:
+            self.verify()
+        logging.info("Bundle {0} loaded from {1}".format(self.version, bundle_path))
+
+    def section(self, name):
+        """
+        :return: a zero-copy view over the section
+        :rtype: memoryview
+        """
+        section = self.manifest["sections"][name]
+        return memoryview(self.buffer)[section["offset"]:section["offset"] + section["size"]]
+
+    def verify(self):
+        digest = hashlib.sha256()
+        for name in self.manifest["sections"]:
+            data = self.section(name)
+            if hashlib.sha256(data).hexdigest() != self.manifest["sections"][name]["sha256"]:
+                raise ValueError("Bundle section {0} is corrupted".format(name))
+        for name in sorted(self.manifest["sections"], key=lambda n: self.manifest["sections"][n]["offset"]):
+            digest.update(self.section(name))
+        if digest.hexdigest() != self.manifest["checksum"]:
+            raise ValueError("Bundle checksum mismatch")
+
+    def load_classifier(self):
+        return pickle.loads(self.section(CLASSIFIER))
+
+    def load_gibberish_detector(self):
+        detector = GibberishDetector()
+        matrix = np.frombuffer(self.section(GIBBERISH_MATRIX), dtype=np.float64)
+        side = int(round(len(matrix) ** 0.5))
+        detector.log_prob_mat = matrix.reshape(side, side).tolist()
+        detector.threshold = self.settings["gibberish_threshold"]
+        return detector
+
+    def words_index(self):
+        return WordsIndex(self.buffer, self.manifest["sections"][WORDS_INDEX]["offset"])
+
+    def blacklist_index(self):
+        return WordsIndex(self.buffer, self.manifest["sections"][BLACKLIST_INDEX]["offset"])
+
+    def preload_charset_distances(self):
+        """
+        Fills the cache of charset.get_char_distance_distribution with the precomputed tables
+        """
+        charsets = [str(charset) for charset in cset.Charset]
+        tables = {}
+        rows = np.frombuffer(self.section(CHARSET_DISTANCES), dtype=np.float64).reshape(-1, 3)
+        for charset_id, distance, probability in rows.tolist():
+            tables.setdefault(charsets[int(charset_id)], {})[int(distance)] = probability
+        for charset, table in tables.items():
+            cset.get_char_distance_distribution.cache[(charset,)] = table
@@ -0,0 +1,14 @@
+"""
+Singleton implementation for the deployment bundle. None if no bundle is configured
+"""
+import os
+
+from . import config
+from .bundle import Bundle
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+bundle = None
+if config.bundle:
+    bundle = Bundle(os.path.join(__location__, config.bundle))
+    bundle.preload_charset_distances()
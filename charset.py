@@ -2,6 +2,8 @@ import math
 import sys
 from enum import Enum
 
+import numpy as np
+
 from .my_tools.memoized import Memoized
 
 
@@ -20,14 +22,27 @@ class Charset(Enum):
         return str(self.value)
 
 
+# (charset, ASCII encoded charset) pairs, used by the byte-level fast path
+CHARSETS_BYTES = [(str(charset), str(charset).encode('ascii')) for charset in Charset]
+# for each charset, a 256 elements boolean mask that is True for the byte values outside the charset
+CHARSETS_EXCLUDED_BYTES = np.array([[chr(b) not in charset for b in range(256)] for charset, _ in CHARSETS_BYTES])
+
+
 def get_narrower_charset(string):
     """
     Return the narrowest charset (among those defined) for the submitted string
 
-    :param string: the string of which should be find the charset
+    :param string: the string of which should be find the charset; if bytes, it takes a faster path
+    :type string: Union[str, bytes]
     :return: the narrowest charset
     :rtype: str
     """
+    if isinstance(string, bytes):
+        for charset, charset_bytes in CHARSETS_BYTES:
+            # all the bytes are deleted only if every one of them belongs to the charset
+            if not string.translate(None, charset_bytes):
+                return charset
+        return None
     for charset in Charset:
         charset = str(charset)
         charset_found = True
@@ -40,6 +55,19 @@ def get_narrower_charset(string):
     return None
 
 
+def get_narrower_charset_ids(histograms):
+    """
+    Vectorized version of get_narrower_charset, working on byte histograms
+
+    :param histograms: a n x 256 matrix, where each row contains the byte counts of a string
+    :return: for each string, the index of its narrowest charset inside Charset, or -1 if none fits
+    :rtype: np.array
+    """
+    # fits[i, k] is True if the k-th charset contains all the bytes of the i-th string
+    fits = (histograms @ CHARSETS_EXCLUDED_BYTES.T.astype(histograms.dtype)) == 0
+    return np.where(fits.any(axis=1), fits.argmax(axis=1), -1)
+
+
 @Memoized
 def get_charset_intervals(charset):
     """
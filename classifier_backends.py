@@ -0,0 +1,188 @@
+"""
+Pluggable models behind StringBinaryClassifier. A backend wraps a (scikit-learn) model working on the
+standardized string features; StringBinaryClassifier takes care of the standardization.
+Backends are selected by name through BACKENDS, e.g. from the classifier_backend setting of config.yml.
+"""
+import inspect
+import pickle
+
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import PolynomialFeatures
+
+CLASSES = (0.0, 1.0)
+
+
+def _normalize(value):
+    # lists (e.g. read from config.yml) become tuples
+    if isinstance(value, list):
+        return tuple(_normalize(item) for item in value)
+    return value
+
+
+class ClassifierBackend(object):
+    """
+    Interface of a classifier backend. Subclasses create their model in create_model, from the keyword arguments
+    they were initialized with; these, together with the backend name, identify the backend configuration
+    """
+    name = None
+
+    def __init__(self, **params):
+        # the defaults of create_model are stored too, so that equivalent configurations compare equal
+        defaults = {name: parameter.default
+                    for name, parameter in inspect.signature(self.create_model).parameters.items()}
+        defaults.update(params)
+        self.params = {name: _normalize(value) for name, value in defaults.items()}
+        self.model = self.create_model(**self.params)
+
+    def create_model(self, **params):
+        raise NotImplementedError
+
+    def describe(self):
+        """
+        :return: backend name and parameters
+        :rtype: dict
+        """
+        return {"name": self.name, "params": self.params}
+
+    def train(self, inputs, outputs):
+        """
+        :param inputs: matrix where each row contains the (standardized) input features
+        :param outputs: the expected class of each row, 0 or 1
+        """
+        self.model.fit(inputs, outputs)
+
+    def partial_train(self, inputs, outputs):
+        """
+        Trains the model on a mini-batch, for out-of-core training
+
+        :param inputs: matrix where each row contains the (standardized) input features
+        :param outputs: the expected class of each row, 0 or 1
+        """
+        if not hasattr(self.model, "partial_fit"):
+            raise ValueError("The {0} backend can't be trained on mini-batches".format(self.name))
+        self.model.partial_fit(inputs, outputs, classes=CLASSES)
+
+    def predict(self, inputs):
+        """
+        :param inputs: matrix where each row contains the (standardized) input features
+        :return: the class prediction for each row
+        :rtype: np.array
+        """
+        return self.model.predict(inputs)
+
+    def predict_proba(self, inputs):
+        """
+        :param inputs: matrix where each row contains the (standardized) input features
+        :return: the class 1 probability for each row
+        :rtype: np.array
+        """
+        return self.model.predict_proba(inputs)[:, 1]
+
+    def serialize(self):
+        """
+        :return: the backend configuration and its trained model, serialized
+        :rtype: bytes
+        """
+        return pickle.dumps((self.name, self.params, self.model), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def deserialize(data):
+        """
+        :param data: the output of serialize
+        :return: the backend, ready to be used
+        :rtype: ClassifierBackend
+        """
+        name, params, model = pickle.loads(data)
+        backend = BACKENDS[name].__new__(BACKENDS[name])
+        backend.params = params
+        backend.model = model
+        return backend
+
+    def __getstate__(self):
+        # pickling a backend (e.g. as part of a StringBinaryClassifier) goes through serialize
+        return {"data": self.serialize()}
+
+    def __setstate__(self, state):
+        backend = ClassifierBackend.deserialize(state["data"])
+        self.params = backend.params
+        self.model = backend.model
+
+
+class MLPBackend(ClassifierBackend):
+    """
+    Multilayer perceptron, the historical (and default) backend
+    """
+    name = "mlp"
+
+    def create_model(self, hidden_layer_sizes=(100, 100), max_iter=100):
+        return MLPClassifier(hidden_layer_sizes=tuple(hidden_layer_sizes), solver='lbfgs', max_iter=max_iter)
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Wraps an already trained MLPClassifier
+        """
+        backend = cls.__new__(cls)
+        backend.params = {"hidden_layer_sizes": tuple(model.hidden_layer_sizes), "max_iter": model.max_iter}
+        backend.model = model
+        return backend
+
+
+class MiniBatchMLPBackend(ClassifierBackend):
+    """
+    Multilayer perceptron trained with Adam, that (unlike lbfgs) supports training on mini-batches: the backend
+    for training sets that don't fit in memory
+    """
+    name = "mlp_minibatch"
+
+    def create_model(self, hidden_layer_sizes=(100, 100), learning_rate_init=0.001, alpha=0.0001):
+        return MLPClassifier(hidden_layer_sizes=tuple(hidden_layer_sizes), solver='adam',
+                             learning_rate_init=learning_rate_init, alpha=alpha)
+
+
+class LogisticRegressionBackend(ClassifierBackend):
+    """
+    Logistic regression on the polynomial expansion of the features, i.e. a quadratic (by default) decision surface
+    """
+    name = "logistic_regression"
+
+    def create_model(self, degree=2, C=100.0, max_iter=1000):
+        return make_pipeline(PolynomialFeatures(degree), LogisticRegression(C=C, max_iter=max_iter))
+
+
+class RandomForestBackend(ClassifierBackend):
+    """
+    Ensemble of shallow decision trees
+    """
+    name = "random_forest"
+
+    def create_model(self, n_estimators=10, max_depth=5):
+        return RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth)
+
+
+class GradientBoostingBackend(ClassifierBackend):
+    name = "gradient_boosting"
+
+    def create_model(self, n_estimators=50, max_depth=3):
+        return GradientBoostingClassifier(n_estimators=n_estimators, max_depth=max_depth)
+
+
+BACKENDS = {backend.name: backend for backend in [MLPBackend, MiniBatchMLPBackend, LogisticRegressionBackend,
+                                                  RandomForestBackend, GradientBoostingBackend]}
+DEFAULT_BACKEND = MLPBackend.name
+
+
+def create_backend(name=DEFAULT_BACKEND, params=None):
+    """
+    :param name: one of the BACKENDS names
+    :param params: keyword arguments of the backend model, None for its defaults
+    :return: a not yet trained backend
+    :rtype: ClassifierBackend
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown classifier backend '{0}', available ones are: {1}".format(
+            name, ", ".join(sorted(BACKENDS))))
+    return BACKENDS[name](**(params or {}))
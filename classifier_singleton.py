@@ -5,6 +5,9 @@ import os
 
 from . import string_classifier
 from . import config
+from .classifier_backends import create_backend, DEFAULT_BACKEND
+from .surrogate import load_or_create_surrogate
+from .bundle_singleton import bundle
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
@@ -21,10 +24,20 @@ bad_test = []
 for path in config.bad_test:
     bad_test.append(os.path.join(__location__, path))
 dump = os.path.join(__location__, config.dump)
+surrogate_path = os.path.join(__location__, config.surrogate) if getattr(config, "surrogate", None) else None
 
-classifier = string_classifier.load_or_create_trained_instance(api_learnsets,
-                                                               text_learnsets,
-                                                               good_test,
-                                                               bad_test,
-                                                               dump,
-                                                               config.re_train)
+if bundle is not None:
+    classifier = bundle.load_classifier()
+else:
+    backend_config = getattr(config, "classifier_backend", None) or {}
+    backend = create_backend(backend_config.get("name", DEFAULT_BACKEND), backend_config.get("params"))
+    classifier = string_classifier.load_or_create_trained_instance(api_learnsets,
+                                                                   text_learnsets,
+                                                                   good_test,
+                                                                   bad_test,
+                                                                   dump,
+                                                                   config.re_train,
+                                                                   backend)
+
+if surrogate_path:
+    classifier = load_or_create_surrogate(classifier, surrogate_path)
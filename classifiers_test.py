@@ -1,6 +1,5 @@
 import itertools
 import logging
-import math
 import os
 from collections import OrderedDict
 
@@ -19,6 +18,8 @@ from sklearn.neural_network import MLPClassifier
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
 
+from decision_surface import classifier_scores, decision_surfaces, grid_ranges
+
 """
 Comparison between different SciKit classifiers and a custom neural network implementation.
 Designed for multidimensional inputs. 
@@ -66,28 +67,15 @@ train_inputs /= input_stdev
 test_inputs -= input_mean
 test_inputs /= input_stdev
 
-# we have multidimensional input and we want to print the 2d projections,
-# so let's get the min of max of each dimension
-dim_min = np.array(train_inputs.min(axis=0))
-dim_max = np.array(train_inputs.max(axis=0))
-# add some margin
-dim_min = dim_min - (dim_max - dim_min) / 20
-dim_max = dim_max + (dim_max - dim_min) / 20
-
-# first create a multidimensional meshgrid to calculate the values for
-# a set of all possible combinations of x,y,z...
-ranges = tuple([np.arange(mn, mx, h) for mn, mx in zip(dim_min, dim_max)])
+# we have multidimensional input and we want to print the 2d projections:
+# the grid spans each dimension (plus some margin), but it is never materialized
+ranges = grid_ranges(train_inputs, h)
 
-# create a meshgrid
-meshgrid = np.meshgrid(*ranges)
-
-# then, for each projection (pair of dimensions) we should create another meshgrid, 2d this time
-# the next variable should contain a list of 2d mesh, it's quite complex to imagine it
+# for each projection (pair of dimensions) we should create a 2d meshgrid
 meshes2d = []
 pairs = list(itertools.combinations(range(N_DIMS), 2))
 for pair in pairs:
-    mesh2d = np.meshgrid(np.arange(dim_min[pair[0]], dim_max[pair[0]], h),
-                         np.arange(dim_min[pair[1]], dim_max[pair[1]], h))
+    mesh2d = np.meshgrid(ranges[pair[0]], ranges[pair[1]])
     meshes2d.append(mesh2d)
 
 # let's choose a colormap. Red-Blue seems nice for binary classification
@@ -118,57 +106,23 @@ for i in range(len(pairs)):
             axarr[i, j].scatter(test_inputs[:, pairs[i][0]], test_inputs[:, pairs[i][1]], c=test_outputs[:, 0],
                                 cmap=cm_bright, s=1)
 
-# iterate over classifiers
-for index, name in enumerate(classifiers.keys()):
-    clf = classifiers.get(name)
+# train the classifiers, then test them
+scores = OrderedDict()
+for name, clf in classifiers.items():
     print("Computing {0} ...".format(name))
-
-    # train the classifier, then test it
     clf.fit(train_inputs, train_outputs[:, 0])
-    score = clf.score(test_inputs, test_outputs[:, 0])
-
-    print("Score: {0} ({1} wrong)".format(score, round((1 - score) * (test_inputs.shape[0]))))
-
-    # calculate the decision boundary
-    raveled_meshgrid = []
-    for m in meshgrid:
-        # noinspection PyUnresolvedReferences
-        raveled_meshgrid.append(m.ravel())
-    raveled_meshgrid = np.array(raveled_meshgrid)
-    arguments = raveled_meshgrid.T
-    arguments_splitted = np.array_split(arguments, math.ceil(len(arguments) / 100))
-    Z = None
-    for argument in arguments_splitted:
-        if hasattr(clf, "decision_function"):
-            results = clf.decision_function(argument)
-        else:
-            results = clf.predict_proba(argument)[:, 1]
-        if Z is None:
-            Z = results
-        else:
-            Z = np.concatenate((Z, results))
-
-    # reduce the dimensionality and plot the colored area for each projection
-    for index2, (pair, mesh2d) in enumerate(zip(pairs, meshes2d)):
-        dims = []
-        for i in range(N_DIMS):
-            if i not in pair:
-                dims.append(i)
-        reshaped = Z.reshape(meshgrid[0].shape)
-        # TODO: GENERALIZE THIS!!!!!
-        if index2 == 0:
-            zprojection = reshaped.mean(axis=(2, 3))
-        elif index2 == 1:
-            zprojection = reshaped.mean(axis=(0, 3)).T
-        elif index2 == 2:
-            zprojection = reshaped.mean(axis=(0, 2)).T
-        elif index2 == 3:
-            zprojection = reshaped.mean(axis=(1, 3)).T
-        elif index2 == 4:
-            zprojection = reshaped.mean(axis=(1, 2)).T
-        else:
-            zprojection = reshaped.mean(axis=(0, 1)).T
-        axarr[pairs.index(pair), index + 1].set_title("{0}\n{1:.5f}".format(name, score))
+    scores[name] = clf.score(test_inputs, test_outputs[:, 0])
+    print("Score: {0} ({1} wrong)".format(scores[name], round((1 - scores[name]) * (test_inputs.shape[0]))))
+
+# calculate the decision boundaries, streaming the grid through all the classifiers at once,
+# already reduced to the 2d projections
+surfaces = decision_surfaces(OrderedDict((name, classifier_scores(clf)) for name, clf in classifiers.items()), ranges)
+
+# plot the colored area for each classifier and projection
+for index, name in enumerate(classifiers.keys()):
+    for pair, mesh2d in zip(pairs, meshes2d):
+        zprojection = surfaces[name][pair]
+        axarr[pairs.index(pair), index + 1].set_title("{0}\n{1:.5f}".format(name, scores[name]))
         axarr[pairs.index(pair), index + 1].contourf(mesh2d[0], mesh2d[1], zprojection, cmap=cm, alpha=.8)
         axarr[pairs.index(pair), index + 1].scatter(train_inputs[:, pair[0]], train_inputs[:, pair[1]],
                                                     c=train_outputs[:, 0],
@@ -0,0 +1,324 @@
+"""
+Generates large synthetic corpora of API keys (from the provider patterns of api_key_generator.regs) and of
+strings that are not API keys (from the text corpora and the wordlists), for training and benchmarks.
+Each pattern is parsed once into a sampler: a list of segments, each one being an alphabet and a repetition
+range, so that a whole block of keys is drawn with a few NumPy calls (a random index inside the alphabet for each
+character, a random length for each segment) instead of one xeger call for each key.
+The corpus is split into shards, generated in parallel by worker processes and streamed, block by block, to
+keys-NNNNN.txt and text-NNNNN.txt (one string for each line, like the other dataset files). Each shard has its own
+seed, spawned from the corpus seed, so that the output does not depend on the number of workers.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+try:
+    import re._parser as sre_parse
+    from re._constants import MAXREPEAT
+except ImportError:
+    import sre_parse
+    from sre_constants import MAXREPEAT
+
+from api_key_generator import regs
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+UNIFORM = "uniform"
+NORMAL = "normal"
+LENGTH_DISTRIBUTIONS = (UNIFORM, NORMAL)
+# maximum number of repetitions added to the minimum of "*", "+" and "{n,}"
+MAX_UNBOUNDED = 32
+BLOCK_ROWS = 1 << 16
+NEWLINE = ord("\n")
+PRINTABLE = np.arange(0x20, 0x7f, dtype=np.uint8)
+CATEGORIES = {"CATEGORY_DIGIT": b"0123456789", "CATEGORY_SPACE": b" \t",
+              "CATEGORY_WORD": b"0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_"}
+TEXT_FILES = os.path.join(__location__, "..", "text", "*.txt")
+WORDLISTS = [os.path.join(__location__, "..", "english_wordlist.txt"),
+             os.path.join(__location__, "..", "computer_wordlist.txt")]
+WORD_SEPARATORS = ["", "_", "-", "."]
+MANIFEST_FILE = "manifest.json"
+
+
+def _alphabet(op, av):
+    """
+    :return: the characters matched by a single character item of a parsed pattern
+    :rtype: np.array
+    """
+    name = str(op)
+    if name == "LITERAL":
+        return np.array([av], dtype=np.uint8)
+    if name == "ANY":
+        return PRINTABLE
+    if name == "CATEGORY":
+        return np.frombuffer(CATEGORIES[str(av)], dtype=np.uint8)
+    if name == "IN":
+        chars = set()
+        negate = False
+        for item_op, item_av in av:
+            item_name = str(item_op)
+            if item_name == "NEGATE":
+                negate = True
+            elif item_name == "RANGE":
+                chars.update(range(item_av[0], item_av[1] + 1))
+            else:
+                chars.update(_alphabet(item_op, item_av).tolist())
+        if negate:
+            chars = set(PRINTABLE.tolist()) - chars
+        if not chars or max(chars) > 0xff:
+            raise ValueError("Unsupported character set")
+        return np.array(sorted(chars), dtype=np.uint8)
+    raise ValueError("Unsupported pattern item {0}".format(name))
+
+
+class PatternSampler(object):
+    """
+    Draws random strings matching a regular expression made of (repeated) characters and character sets,
+    e.g. "sk_live_[0-9a-zA-Z]{24}". Alternations, groups under repetitions and backreferences are not supported
+    """
+
+    def __init__(self, pattern, length_distribution=UNIFORM):
+        """
+        :param pattern: the regular expression
+        :param length_distribution: how the length of each repetition is drawn inside its range, one of
+                                    LENGTH_DISTRIBUTIONS
+        """
+        if length_distribution not in LENGTH_DISTRIBUTIONS:
+            raise ValueError("Unknown length distribution '{0}'".format(length_distribution))
+        self.pattern = pattern
+        self.length_distribution = length_distribution
+        self.segments = []
+        self._compile(sre_parse.parse(pattern))
+
+    def _compile(self, items):
+        for op, av in items:
+            name = str(op)
+            if name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+                low, high, sub = av
+                if len(sub) != 1:
+                    raise ValueError("Unsupported repetition of a group in {0}".format(self.pattern))
+                high = low + MAX_UNBOUNDED if high == MAXREPEAT else high
+                self.segments.append((_alphabet(*sub[0]), low, high))
+            elif name == "SUBPATTERN":
+                self._compile(av[-1])
+            elif name != "AT":
+                self.segments.append((_alphabet(op, av), 1, 1))
+
+    @property
+    def max_length(self):
+        return sum(high for _, _, high in self.segments)
+
+    def _lengths(self, rng, low, high, count):
+        if low == high:
+            return np.full(count, low)
+        if self.length_distribution == NORMAL:
+            return np.clip(np.rint(rng.normal((low + high) / 2, (high - low) / 4, count)), low, high).astype(np.int64)
+        return rng.integers(low, high + 1, count)
+
+    def sample(self, rng, count):
+        """
+        :param rng: the random generator
+        :type rng: np.random.Generator
+        :param count: number of strings to be drawn
+        :return: a count x max_length matrix of characters, and the mask of the characters that belong to the
+                 strings (each row is a string, its characters are the masked ones, from left to right)
+        :rtype: (np.array, np.array)
+        """
+        chars = []
+        mask = []
+        for alphabet, low, high in self.segments:
+            chars.append(alphabet[rng.integers(0, len(alphabet), (count, high))])
+            mask.append(np.arange(high) < self._lengths(rng, low, high, count)[:, None])
+        return np.hstack(chars), np.hstack(mask)
+
+
+def pack_rows(chars, mask):
+    """
+    :return: the strings of a sample, one for each line
+    :rtype: bytes
+    """
+    chars = np.hstack([chars, np.full((len(chars), 1), NEWLINE, dtype=np.uint8)])
+    mask = np.hstack([mask, np.ones((len(mask), 1), dtype=bool)])
+    return chars[mask].tobytes()
+
+
+def sample_keys(samplers, rng, count):
+    """
+    Draws count keys, the same number (plus or minus one) from each sampler, in random order
+
+    :return: the keys, one for each line
+    :rtype: bytes
+    """
+    counts = np.full(len(samplers), count // len(samplers))
+    counts[rng.permutation(len(samplers))[:count % len(samplers)]] += 1
+    width = max(sampler.max_length for sampler in samplers)
+    chars = np.zeros((count, width), dtype=np.uint8)
+    mask = np.zeros((count, width), dtype=bool)
+    row = 0
+    for sampler, sampler_count in zip(samplers, counts.tolist()):
+        sampler_chars, sampler_mask = sampler.sample(rng, sampler_count)
+        chars[row:row + sampler_count, :sampler_chars.shape[1]] = sampler_chars
+        mask[row:row + sampler_count, :sampler_mask.shape[1]] = sampler_mask
+        row += sampler_count
+    order = rng.permutation(count)
+    return pack_rows(chars[order], mask[order])
+
+
+class TextPool(object):
+    """
+    Strings that are not API keys: the lines of the text corpora (test sets excluded) and identifiers made of
+    dictionary words
+    """
+
+    def __init__(self, min_length, max_length):
+        """
+        :param min_length: shorter strings are never drawn
+        :param max_length: longer strings are never drawn
+        """
+        self.min_length = min_length
+        self.max_length = max_length
+        lines = set()
+        for path in sorted(glob.glob(TEXT_FILES)):
+            if "test" in os.path.basename(path):
+                continue
+            with open(path, "rb") as f:
+                lines.update(line.strip() for line in f)
+        self.lines = sorted(line for line in lines if min_length <= len(line) <= max_length and b"\r" not in line)
+        words = set()
+        for path in WORDLISTS:
+            with open(path, "rb") as f:
+                words.update(line.strip() for line in f)
+        self.words = sorted(word for word in words if word.isalnum())
+
+    def sample(self, rng, count, identifier_ratio):
+        """
+        :param identifier_ratio: fraction of the strings that are identifiers, the others are corpus lines
+        :return: the strings, one for each line
+        :rtype: bytes
+        """
+        identifiers = int(rng.binomial(count, identifier_ratio)) if self.lines else count
+        strings = [self.lines[i] for i in rng.integers(0, len(self.lines), count - identifiers).tolist()] \
+            if count > identifiers else []
+        targets = rng.integers(self.min_length, self.max_length + 1, identifiers).tolist()
+        separators = rng.integers(0, len(WORD_SEPARATORS), identifiers).tolist()
+        words = rng.integers(0, len(self.words), (identifiers, 8))
+        capitalize = rng.random((identifiers, 8)) < 0.5
+        for target, separator, row, row_capitalize in zip(targets, separators, words.tolist(), capitalize.tolist()):
+            parts = []
+            length = 0
+            for word, upper in zip(row, row_capitalize):
+                word = self.words[word]
+                parts.append(word.capitalize() if upper and parts else word)
+                length += len(word) + len(WORD_SEPARATORS[separator])
+                if length >= target:
+                    break
+            strings.append(WORD_SEPARATORS[separator].encode("ascii").join(parts)[:self.max_length])
+        order = rng.permutation(len(strings)).tolist()
+        return b"".join(strings[i] + b"\n" for i in order)
+
+
+_pool = None
+
+
+def _init_worker(min_length, max_length):
+    # every worker process loads the text pool once, for all its shards
+    global _pool
+    _pool = TextPool(min_length, max_length)
+
+
+def generate_shard(task):
+    """
+    Writes the keys and the text files of a shard
+
+    :param task: shard index, seed sequence, output directory, providers, number of keys, number of texts,
+                 length distribution, identifier ratio
+    :return: the shard index and the paths of its files
+    :rtype: (int, list)
+    """
+    index, seed, output_dir, providers, keys, texts, length_distribution, identifier_ratio = task
+    rng = np.random.default_rng(seed)
+    samplers = [PatternSampler(regs[provider], length_distribution) for provider in providers]
+    paths = [os.path.join(output_dir, "keys-{0:05d}.txt".format(index)),
+             os.path.join(output_dir, "text-{0:05d}.txt".format(index))]
+    with open(paths[0], "wb") as f:
+        for start in range(0, keys, BLOCK_ROWS):
+            f.write(sample_keys(samplers, rng, min(BLOCK_ROWS, keys - start)))
+    with open(paths[1], "wb") as f:
+        for start in range(0, texts, BLOCK_ROWS):
+            f.write(_pool.sample(rng, min(BLOCK_ROWS, texts - start), identifier_ratio))
+    return index, paths
+
+
+def _split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def generate_corpus(output_dir, keys, texts, shards=1, workers=None, seed=0, providers=None,
+                    length_distribution=UNIFORM, min_length=8, max_length=64, identifier_ratio=0.5):
+    """
+    :param output_dir: where the shards and the manifest are written
+    :param keys: total number of keys
+    :param texts: total number of strings that are not API keys
+    :param shards: number of shards
+    :param workers: number of worker processes, defaults to the CPUs count
+    :param seed: seed of the whole corpus
+    :param providers: names of the patterns of regs to be used, all of them by default
+    :param length_distribution: one of LENGTH_DISTRIBUTIONS, for the repetitions of the patterns
+    :param min_length: minimum length of the strings that are not API keys
+    :param max_length: maximum length of the strings that are not API keys
+    :param identifier_ratio: fraction of the strings that are not API keys made of dictionary words
+    :return: the manifest of the corpus, also saved to MANIFEST_FILE
+    :rtype: dict
+    """
+    providers = sorted(regs) if providers is None else list(providers)
+    for provider in providers:
+        # fail early on unknown providers and unsupported patterns
+        PatternSampler(regs[provider], length_distribution)
+    os.makedirs(output_dir, exist_ok=True)
+    seeds = np.random.SeedSequence(seed).spawn(shards)
+    tasks = [(index, shard_seed, output_dir, providers, shard_keys, shard_texts, length_distribution,
+              identifier_ratio)
+             for index, (shard_seed, shard_keys, shard_texts) in enumerate(zip(seeds, _split(keys, shards),
+                                                                                 _split(texts, shards)))]
+    files = {}
+    with Pool(workers or os.cpu_count(), initializer=_init_worker, initargs=(min_length, max_length)) as pool:
+        for index, paths in pool.imap_unordered(generate_shard, tasks):
+            files[index] = paths
+            print("Shard {0} written".format(index))
+    manifest = {"seed": seed, "providers": providers, "length_distribution": length_distribution,
+                "min_length": min_length, "max_length": max_length, "identifier_ratio": identifier_ratio,
+                "shards": [{"keys": os.path.basename(files[index][0]), "texts": os.path.basename(files[index][1]),
+                            "keys_count": task[4], "texts_count": task[5]}
+                           for index, task in enumerate(tasks)]}
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generates sharded corpora of synthetic API keys and texts")
+    parser.add_argument("output_dir", help="Where the shards are written")
+    parser.add_argument("--keys", type=int, default=1000000, help="Total number of keys")
+    parser.add_argument("--texts", type=int, default=1000000, help="Total number of strings that are not keys")
+    parser.add_argument("--shards", type=int, default=1, help="Number of shards")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, defaults to the CPUs count")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus")
+    parser.add_argument("--providers", nargs="+", choices=sorted(regs), help="Key patterns, all of them by default")
+    parser.add_argument("--length-distribution", choices=LENGTH_DISTRIBUTIONS, default=UNIFORM,
+                        help="How the length of variable-length keys is drawn")
+    parser.add_argument("--min-length", type=int, default=8, help="Minimum length of the strings that are not keys")
+    parser.add_argument("--max-length", type=int, default=64, help="Maximum length of the strings that are not keys")
+    parser.add_argument("--identifier-ratio", type=float, default=0.5,
+                        help="Fraction of the strings that are not keys made of dictionary words")
+    args = parser.parse_args(argv[1:])
+    generate_corpus(args.output_dir, args.keys, args.texts, args.shards, args.workers, args.seed, args.providers,
+                    args.length_distribution, args.min_length, args.max_length, args.identifier_ratio)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,96 @@
+"""
+Decision surfaces of classifiers over a multidimensional feature grid, reduced to their 2-D marginal projections
+(the mean score over the other dimensions, for each pair of dimensions), as plotted by classifiers_test.py and
+neuralnets_test.py.
+The grid is never materialized: its points are enumerated in blocks of consecutive flat indices, each block is
+scored by every classifier in a thread pool (the models run NumPy and compiled code, that mostly release the GIL) and
+its scores are added, with a bincount, to running sums for each projection. Memory is bounded by the block size and
+by the projections, whatever the number of dimensions and the resolution of the grid.
+"""
+import itertools
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 1 << 16
+# fraction of each range added on both sides of the data
+DEFAULT_MARGIN = 1 / 20
+
+
+def grid_ranges(inputs, step, margin=DEFAULT_MARGIN):
+    """
+    :param inputs: matrix where each row contains the (standardized) features of a sample
+    :param step: distance between two grid points, along each dimension
+    :param margin: fraction of the range of each dimension added below its minimum and above its maximum
+    :return: the coordinates of the grid points along each dimension
+    :rtype: list
+    """
+    dim_min = np.array(inputs.min(axis=0))
+    dim_max = np.array(inputs.max(axis=0))
+    dim_min = dim_min - (dim_max - dim_min) * margin
+    dim_max = dim_max + (dim_max - dim_min) * margin
+    return [np.arange(low, high, step) for low, high in zip(dim_min, dim_max)]
+
+
+def classifier_scores(classifier):
+    """
+    :return: a function that scores a matrix of inputs: the decision function of classifier if available, its
+             class 1 probability otherwise
+    """
+    if hasattr(classifier, "decision_function"):
+        return classifier.decision_function
+    return lambda inputs: classifier.predict_proba(inputs)[:, 1]
+
+
+def _block_sums(score_functions, ranges, pairs, start, end):
+    shape = tuple(len(axis) for axis in ranges)
+    indices = np.unravel_index(np.arange(start, end), shape)
+    points = np.column_stack([axis[index] for axis, index in zip(ranges, indices)])
+    sums = []
+    for score_function in score_functions:
+        scores = np.asarray(score_function(points), dtype=np.float64)
+        # projection (i, j) is a len(j) x len(i) matrix, like np.meshgrid(ranges[i], ranges[j])
+        sums.append([np.bincount(indices[j] * shape[i] + indices[i], weights=scores, minlength=shape[i] * shape[j])
+                     for i, j in pairs])
+    return sums
+
+
+def decision_surfaces(score_functions, ranges, block_size=DEFAULT_BLOCK_SIZE, max_workers=None):
+    """
+    :param score_functions: name => function that scores a matrix of inputs (see classifier_scores)
+    :type score_functions: OrderedDict
+    :param ranges: the coordinates of the grid points along each dimension, see grid_ranges
+    :param block_size: number of grid points scored at once
+    :param max_workers: number of threads, defaults to the CPUs count
+    :return: name => OrderedDict (i, j) => mean score over the other dimensions, as a len(ranges[j]) x
+             len(ranges[i]) matrix, for each pair of dimensions i < j
+    :rtype: OrderedDict
+    """
+    names = list(score_functions)
+    functions = [score_functions[name] for name in names]
+    pairs = list(itertools.combinations(range(len(ranges)), 2))
+    shape = tuple(len(axis) for axis in ranges)
+    total = int(np.prod(shape))
+    totals = [[np.zeros(shape[i] * shape[j]) for i, j in pairs] for _ in names]
+    workers = max_workers or os.cpu_count()
+    blocks = ((start, min(start + block_size, total)) for start in range(0, total, block_size))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # a bounded number of blocks in flight, so that memory doesn't grow with the grid
+        futures = [executor.submit(_block_sums, functions, ranges, pairs, start, end)
+                   for start, end in itertools.islice(blocks, 2 * workers)]
+        while futures:
+            block = futures.pop(0).result()
+            for classifier_totals, classifier_block in zip(totals, block):
+                for pair_totals, pair_block in zip(classifier_totals, classifier_block):
+                    pair_totals += pair_block
+            for start, end in itertools.islice(blocks, 1):
+                futures.append(executor.submit(_block_sums, functions, ranges, pairs, start, end))
+    surfaces = OrderedDict()
+    for name, classifier_totals in zip(names, totals):
+        surfaces[name] = OrderedDict()
+        for (i, j), pair_totals in zip(pairs, classifier_totals):
+            # every cell of a projection sums the same number of grid points
+            surfaces[name][(i, j)] = pair_totals.reshape(shape[j], shape[i]) / (total // (shape[i] * shape[j]))
+    return surfaces
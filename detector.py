@@ -1,31 +1,201 @@
 import os
 import sys
+import time
+
+import numpy as np
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 sys.path.append(__location__)
 from .classifier_singleton import classifier
 from .strings_filter_singleton import s_filter
+from .string_batch import StringBatch
+from .string_classifier import calculate_features_batch
+from . import charset as cset
+
+# candidates are classified in chunks, so that the deadline is checked often enough
+DEADLINE_CHUNK_SIZE = 256
+RANKING_CHUNK_SIZE = 4096
 
 
 def filter_api_keys(strings):
-    apikeys = [string for string in strings if s_filter.pre_filter(string)]
-    classification = classifier.predict_strings(apikeys)
-    apikeys = [apikeys[i] for i in range(len(apikeys)) if classification[i] > 0.5]
-    apikeys = [string for string in apikeys if s_filter.post_filter(string)]
-    return apikeys
+    """
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :return: the strings that are API keys, decoded
+    :rtype: list
+    """
+    batch = StringBatch.from_strings(strings)
+    return batch.select(detect_api_keys_batch(batch))
 
 
 def detect_api_keys(strings):
-    detection = []
-    for string in strings:
-        detection.append(s_filter.pre_filter(string))
-    apikeys = [strings[i] for i in range(len(strings)) if detection[i]]
-    classification = classifier.predict_strings(apikeys)
-    j = 0
-    for i in range(len(detection)):
-        if detection[i]:
-            detection[i] = classification[j] > 0.5
-            j += 1
-            if detection[i]:
-                detection[i] = s_filter.post_filter(strings[i])
-    return detection
+    """
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :return: a list of booleans, True for each string that is an API key
+    :rtype: list
+    """
+    return detect_api_keys_batch(StringBatch.from_strings(strings)).tolist()
+
+
+def detect_api_keys_batch(batch):
+    """
+    Detects API keys inside a batch of strings, see score_api_keys_batch
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :return: a boolean mask, True for each string of the batch that is an API key
+    :rtype: np.array
+    """
+    return score_api_keys_batch(batch)[0]
+
+
+def score_api_keys_batch(batch):
+    """
+    Detects API keys inside a batch of strings, returning the classifier scores too. Each stage narrows down the
+    array of indices of the strings that can still be API keys, so that only the final verdicts are materialized
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :return: a boolean mask, True for each string of the batch that is an API key, and the class 1 probability
+             of each string according to the classifier (0 for the strings discarded before classification)
+    :rtype: (np.array, np.array)
+    """
+    detection = np.zeros(len(batch), dtype=bool)
+    scores = np.zeros(len(batch))
+    indices = s_filter.pre_filter_batch(batch)
+    inputs, valid = calculate_features_batch(batch, indices)
+    indices = indices[valid]
+    if not len(indices):
+        return detection, scores
+    scores[indices] = classifier.predict_proba(inputs)
+    indices = indices[scores[indices] > 0.5]
+    indices = indices[s_filter.post_filter_batch(batch, indices)]
+    detection[indices] = True
+    return detection, scores
+
+
+class DeadlineScanResult(object):
+    """
+    Outcome of a scan with a time budget, i.e. partial results plus a coverage report
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+        # True/False for the strings that were fully evaluated (or discarded by the pre-filter),
+        # None for the candidates that were skipped because the deadline was hit
+        self.detection = [False] * len(batch)
+        self.total = len(batch)
+        self.candidates = 0
+        self.evaluated = 0
+        self.elapsed = 0.0
+        self.deadline_hit = False
+
+    @property
+    def skipped(self):
+        return self.candidates - self.evaluated
+
+    @property
+    def coverage(self):
+        """
+        Fraction of the candidates (strings that passed the pre-filter) that were fully evaluated
+        """
+        if not self.candidates:
+            return 1.0
+        return self.evaluated / self.candidates
+
+    @property
+    def api_keys(self):
+        return self.batch.select([detected is True for detected in self.detection])
+
+    def __str__(self):
+        return "{0} strings, {1} candidates: {2} evaluated, {3} skipped ({4:.1%} coverage) in {5:.3f}s".format(
+            self.total, self.candidates, self.evaluated, self.skipped, self.coverage, self.elapsed)
+
+
+def candidate_priors(batch, indices):
+    """
+    Cheap estimate of how likely the candidates are API keys, used to decide the order in which they are
+    classified when scanning with a time budget. It's the strings entropy relative to the maximum entropy
+    reachable with their length and charset, computed at once from the byte histograms; printable text
+    (i.e. strings with spaces) is deprioritized
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :param indices: the indices of the candidates inside the batch
+    :return: the priors, higher is more promising; -inf for the strings that can't be API keys
+    :rtype: np.array
+    """
+    histograms = batch.byte_histograms(indices)
+    charset_ids = cset.get_narrower_charset_ids(histograms)
+    lengths = histograms.sum(axis=1)
+    charset_lengths = np.array([len(charset) for charset, _ in cset.CHARSETS_BYTES])[charset_ids]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = histograms / lengths[:, None]
+        entropy = -np.where(histograms > 0, probabilities * np.log2(probabilities), 0).sum(axis=1)
+        max_entropy = np.log2(np.minimum(lengths, charset_lengths))
+        priors = np.where(max_entropy > 0, entropy / max_entropy, 0.0)
+    priors[charset_ids == list(cset.Charset).index(cset.Charset.PRINT_CHARS)] -= 1
+    priors[charset_ids < 0] = -np.inf
+    return priors
+
+
+def detect_api_keys_within(strings, time_budget, chunk_size=DEADLINE_CHUNK_SIZE):
+    """
+    Detects API keys within a time budget. Candidates that pass the pre-filter are ranked by
+    candidate_priors and classified most promising first, until the deadline is hit
+
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param time_budget: time budget in seconds
+    :param chunk_size: maximum number of candidates classified between two deadline checks
+    :return: the (possibly partial) detection and its coverage
+    :rtype: DeadlineScanResult
+    """
+    start = time.perf_counter()
+    deadline = start + time_budget
+    batch = StringBatch.from_strings(strings)
+    result = DeadlineScanResult(batch)
+    indices = s_filter.pre_filter_batch(batch)
+    result.candidates = len(indices)
+    for i in indices.tolist():
+        result.detection[i] = None
+
+    # rank the candidates, dropping those that can't be API keys
+    priors = np.full(len(indices), np.nan)
+    for position in range(0, len(indices), RANKING_CHUNK_SIZE):
+        if time.perf_counter() > deadline:
+            break
+        priors[position:position + RANKING_CHUNK_SIZE] = candidate_priors(
+            batch, indices[position:position + RANKING_CHUNK_SIZE])
+    discarded = np.isneginf(priors)
+    for i in indices[discarded].tolist():
+        result.detection[i] = False
+    result.evaluated += int(discarded.sum())
+    ranked = np.isfinite(priors)
+    indices = indices[ranked][np.argsort(-priors[ranked], kind='stable')]
+
+    # classify, shrinking the chunks so that they are likely to complete before the deadline
+    seconds_per_candidate = 0.0
+    position = 0
+    while position < len(indices):
+        now = time.perf_counter()
+        remaining = deadline - now
+        size = chunk_size
+        if seconds_per_candidate > 0:
+            size = min(chunk_size, int(remaining / seconds_per_candidate))
+        if remaining <= 0 or size <= 0:
+            result.deadline_hit = True
+            break
+        chunk = indices[position:position + size]
+        position += len(chunk)
+        inputs, valid = calculate_features_batch(batch, chunk)
+        detected = np.zeros(len(chunk), dtype=bool)
+        if valid.any():
+            positives = np.flatnonzero(valid)[classifier.predict(inputs) > 0.5]
+            detected[positives[s_filter.post_filter_batch(batch, chunk[positives])]] = True
+        for i, is_api_key in zip(chunk.tolist(), detected.tolist()):
+            result.detection[i] = is_api_key
+        result.evaluated += len(chunk)
+        seconds_per_candidate = (time.perf_counter() - now) / len(chunk)
+    if result.skipped:
+        result.deadline_hit = True
+    result.elapsed = time.perf_counter() - start
+    return result
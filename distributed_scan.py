@@ -0,0 +1,357 @@
+"""
+Sharded scanning of files (one string for each line) across several processes or hosts.
+A Coordinator splits the inputs into work units (byte ranges of a file, aligned to lines while being read) and
+puts them on a WorkQueue; Workers pull units, run detect_api_keys on them and push the findings back.
+Units are leased: if a worker dies, its lease expires and the unit goes back to the queue, up to max_attempts times.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+from .detector import detect_api_keys
+from .scan_job import list_input_files, model_fingerprint, read_chunk
+
+DEFAULT_UNIT_BYTES = 64 << 20
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 1.0
+# lines read between two lease renewals
+WORKER_CHUNK_SIZE = 10000
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class WorkUnit(object):
+    def __init__(self, unit_id, path, start, end, attempts=0):
+        """
+        :param unit_id: unique identifier of the unit
+        :param path: path of the file to be scanned
+        :param start: byte offset where the unit starts; the unit owns the lines starting inside [start, end)
+        :param end: byte offset where the unit ends
+        :param attempts: how many times the unit has been leased so far
+        """
+        self.unit_id = unit_id
+        self.path = path
+        self.start = start
+        self.end = end
+        self.attempts = attempts
+
+    def __str__(self):
+        return "{0}[{1}:{2}]".format(self.path, self.start, self.end)
+
+
+class WorkQueue(object):
+    """
+    Interface of the queue shared by coordinator and workers
+    """
+
+    def put_units(self, units, fingerprint):
+        """
+        Adds work units to the queue. Units already in the queue (same path and byte range) are skipped, so that
+        submitting the same inputs again doesn't scan them twice
+
+        :param units: an iterable of WorkUnit
+        :param fingerprint: the configuration and models fingerprint that workers must match
+        :return: the number of units added
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def fingerprint(self):
+        raise NotImplementedError
+
+    def claim(self, worker_id, lease_seconds):
+        """
+        :return: a pending unit, leased to worker_id, or None if no unit is pending
+        :rtype: WorkUnit
+        """
+        raise NotImplementedError
+
+    def renew(self, unit, worker_id, lease_seconds):
+        """
+        :return: False if the lease was lost (i.e. the unit was given to another worker)
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def complete(self, unit, worker_id, findings):
+        """
+        Stores the findings of a unit, unless its lease was lost meanwhile
+
+        :param findings: list of (line offset, string) pairs
+        :return: False if the lease was lost and the findings were discarded
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def requeue_expired(self, max_attempts):
+        """
+        Puts back to the queue the units whose lease expired, marking as failed those leased max_attempts times
+
+        :return: the number of requeued units
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def counts(self):
+        """
+        :return: the number of units for each status
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def findings(self):
+        """
+        :return: a generator over the (path, line offset, string) findings of every completed unit, sorted
+        """
+        raise NotImplementedError
+
+    def failed_units(self):
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    WorkQueue backed by a SQLite database, suited for workers running on the same host (or sharing
+    a filesystem with reliable locking)
+    """
+
+    def __init__(self, db_path, timeout=60.0):
+        self.connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS units (
+                id INTEGER PRIMARY KEY, path TEXT, start INTEGER, "end" INTEGER, status TEXT,
+                worker TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0);
+            CREATE INDEX IF NOT EXISTS units_status ON units (status);
+            CREATE UNIQUE INDEX IF NOT EXISTS units_range ON units (path, start, "end");
+            CREATE TABLE IF NOT EXISTS findings (unit_id INTEGER, path TEXT, line_offset INTEGER, string TEXT);
+        """)
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock upfront, so that two workers can't claim the same unit
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def put_units(self, units, fingerprint):
+        connection = self._transaction()
+        try:
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+            added = connection.executemany(
+                'INSERT OR IGNORE INTO units (path, start, "end", status) VALUES (?, ?, ?, ?)',
+                ((unit.path, unit.start, unit.end, PENDING) for unit in units)).rowcount
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def fingerprint(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        return row[0] if row else None
+
+    def claim(self, worker_id, lease_seconds):
+        connection = self._transaction()
+        try:
+            row = connection.execute('SELECT id, path, start, "end", attempts FROM units WHERE status = ? '
+                                     'ORDER BY id LIMIT 1', (PENDING,)).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute("UPDATE units SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                               "WHERE id = ?", (LEASED, worker_id, time.time() + lease_seconds, row[0]))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return WorkUnit(row[0], row[1], row[2], row[3], row[4] + 1)
+
+    def renew(self, unit, worker_id, lease_seconds):
+        cursor = self.connection.execute("UPDATE units SET lease_expires = ? "
+                                         "WHERE id = ? AND worker = ? AND status = ?",
+                                         (time.time() + lease_seconds, unit.unit_id, worker_id, LEASED))
+        return cursor.rowcount == 1
+
+    def complete(self, unit, worker_id, findings):
+        connection = self._transaction()
+        try:
+            cursor = connection.execute("UPDATE units SET status = ? WHERE id = ? AND worker = ? AND status = ?",
+                                        (DONE, unit.unit_id, worker_id, LEASED))
+            if cursor.rowcount != 1:
+                connection.execute("ROLLBACK")
+                return False
+            connection.executemany("INSERT INTO findings VALUES (?, ?, ?, ?)",
+                                   ((unit.unit_id, unit.path, offset, string) for offset, string in findings))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return True
+
+    def requeue_expired(self, max_attempts):
+        connection = self._transaction()
+        try:
+            now = time.time()
+            connection.execute("UPDATE units SET status = ?, worker = NULL WHERE status = ? AND lease_expires < ? "
+                               "AND attempts >= ?", (FAILED, LEASED, now, max_attempts))
+            cursor = connection.execute("UPDATE units SET status = ?, worker = NULL WHERE status = ? "
+                                        "AND lease_expires < ?", (PENDING, LEASED, now))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def counts(self):
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(self.connection.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+        return counts
+
+    def findings(self):
+        for row in self.connection.execute("SELECT path, line_offset, string FROM findings "
+                                           "ORDER BY path, line_offset"):
+            yield row
+
+    def failed_units(self):
+        return [WorkUnit(*row) for row in self.connection.execute(
+            'SELECT id, path, start, "end", attempts FROM units WHERE status = ? ORDER BY id', (FAILED,))]
+
+
+def split_into_units(inputs, unit_bytes=DEFAULT_UNIT_BYTES):
+    """
+    Splits files into work units of (about) unit_bytes bytes
+
+    :param inputs: paths of files and/or directories, the latter are walked recursively
+    :param unit_bytes: size of each unit
+    :return: a generator over WorkUnit objects, not yet identified
+    """
+    for path in list_input_files(inputs):
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        for start in range(0, size, unit_bytes):
+            yield WorkUnit(None, path, start, min(start + unit_bytes, size))
+
+
+class Coordinator(object):
+    def __init__(self, queue, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        :param queue: the WorkQueue shared with the workers
+        :param lease_seconds: how long a worker can hold a unit without renewing its lease
+        :param max_attempts: how many times a unit can be leased before being marked as failed
+        """
+        self.queue = queue
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def submit(self, inputs, unit_bytes=DEFAULT_UNIT_BYTES):
+        added = self.queue.put_units(split_into_units(inputs, unit_bytes), model_fingerprint())
+        logging.info("Work units submitted: {0} ({1} pending)".format(added, self.queue.counts()[PENDING]))
+
+    def wait(self, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        Waits until every unit has been completed (or has failed), giving back to the queue the units of lost workers
+        """
+        while True:
+            requeued = self.queue.requeue_expired(self.max_attempts)
+            if requeued:
+                logging.warning("{0} work units were lost by their workers and have been requeued".format(requeued))
+            counts = self.queue.counts()
+            if not counts[PENDING] and not counts[LEASED]:
+                return
+            time.sleep(poll_interval)
+
+    def report(self):
+        """
+        Merges the results of all the workers
+
+        :return: units counts, failed units and findings, sorted by file and offset
+        :rtype: dict
+        """
+        findings = [{"path": path, "offset": offset, "string": string}
+                    for path, offset, string in self.queue.findings()]
+        return {"units": self.queue.counts(),
+                "failed_units": [str(unit) for unit in self.queue.failed_units()],
+                "findings": findings}
+
+
+class Worker(object):
+    def __init__(self, queue, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        :param queue: the WorkQueue shared with the coordinator
+        :param worker_id: unique name of the worker, defaults to host name and pid
+        :param lease_seconds: how long the worker can hold a unit without renewing its lease
+        """
+        self.queue = queue
+        self.worker_id = worker_id or "{0}-{1}".format(socket.gethostname(), os.getpid())
+        self.lease_seconds = lease_seconds
+        # the models are loaded once, at import time: their fingerprint can't change afterwards
+        self.fingerprint = model_fingerprint()
+        self.check_fingerprint()
+
+    def check_fingerprint(self):
+        """
+        :raise ValueError: if the units of the queue were submitted with other configuration or models
+        """
+        fingerprint = self.queue.fingerprint()
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            raise ValueError("Worker {0} configuration or models differ from the coordinator ones".format(
+                self.worker_id))
+
+    def run(self, wait_for_units=False, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        Processes units until the queue is empty. The fingerprint of the queue is checked before each unit is claimed,
+        since units may be submitted (or resubmitted, with other models) after the worker started
+
+        :param wait_for_units: if True, keeps polling the queue until no unit is pending nor leased,
+                               so that requeued units get processed too
+        :return: the number of completed units
+        :rtype: int
+        """
+        completed = 0
+        while True:
+            self.check_fingerprint()
+            unit = self.queue.claim(self.worker_id, self.lease_seconds)
+            if unit is None:
+                counts = self.queue.counts()
+                if not wait_for_units or (not counts[PENDING] and not counts[LEASED]):
+                    return completed
+                time.sleep(poll_interval)
+                continue
+            findings = self.process(unit)
+            if findings is None or not self.queue.complete(unit, self.worker_id, findings):
+                logging.warning("Lease of work unit {0} lost, results discarded".format(unit))
+                continue
+            completed += 1
+
+    def process(self, unit):
+        """
+        :return: the (line offset, string) findings of the unit, None if the lease was lost meanwhile
+        :rtype: list
+        """
+        findings = []
+        with open(unit.path, "rb") as f:
+            if unit.start > 0:
+                # the line crossing unit.start belongs to the previous unit
+                f.seek(unit.start - 1)
+                f.readline()
+            while True:
+                lines = read_chunk(f, WORKER_CHUNK_SIZE, unit.end)
+                if not lines:
+                    break
+                detection = detect_api_keys([line for _, line in lines])
+                findings.extend((offset, line.decode("utf-8", errors="replace"))
+                                for (offset, line), is_api_key in zip(lines, detection) if is_api_key)
+                if not self.queue.renew(unit, self.worker_id, self.lease_seconds):
+                    return None
+        return findings
+
+
+def dump_report(report, file_path):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
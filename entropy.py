@@ -6,13 +6,16 @@ def shannon_entropy(item, itemset):
     """
     Calculates the [String] Shannon Entropy of an item
 
-    :param item: the item [string] of which should be computed the entropy
+    :param item: the item [string] of which should be computed the entropy; can be ASCII bytes
     :param itemset: an iterable representing the item set [charset as a string]
     :return: the item's entropy
     :rtype: float
     """
     if not item:
         return 0
+    if isinstance(item, bytes) and isinstance(itemset, str):
+        # iterating over bytes yields ints, that bytes.count accepts as well
+        itemset = itemset.encode('ascii')
     entropy = 0.0
     for x in itemset:
         p_x = float(item.count(x)) / len(item)
@@ -0,0 +1,169 @@
+"""
+Out-of-core training sets: feature matrices that are written to .npy files incrementally, block by block, and read
+back as memory maps, so that their size is bounded by the disk rather than by RAM.
+A NpyMatrixWriter reserves a fixed-size .npy header, appends the rows as they are computed and writes the final
+shape into the header when closed; the file is then a regular .npy file, to be opened with
+np.load(path, mmap_mode="r"). Normalization statistics are accumulated block by block (RunningStatistics) and
+mini-batches are drawn by iter_shuffled_batches, that reads a few contiguous blocks at a time (in random order)
+and shuffles their rows, instead of reading single rows scattered over the whole file.
+"""
+import itertools
+import logging
+import struct
+
+import numpy as np
+
+from .string_batch import StringBatch
+from .string_classifier import N_FEATURES, calculate_features_batch
+
+BLOCK_ROWS = 1 << 16
+# blocks shuffled together
+SHUFFLE_BLOCKS = 8
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+# magic, header length and header: enough for any 2-D shape, and a multiple of 64 as the format requires
+NPY_HEADER_BYTES = 128
+
+
+def _npy_header(shape, dtype):
+    header = "{{'descr': '{0}', 'fortran_order': False, 'shape': ({1}, {2}), }}".format(
+        np.dtype(dtype).str, shape[0], shape[1])
+    length = NPY_HEADER_BYTES - len(NPY_MAGIC) - 2
+    return NPY_MAGIC + struct.pack("<H", length) + header.ljust(length - 1).encode("latin1") + b"\n"
+
+
+class NpyMatrixWriter(object):
+    """
+    Writes a 2-D .npy file whose number of rows is not known in advance
+    """
+
+    def __init__(self, file_path, columns, dtype=np.float64):
+        """
+        :param file_path: path of the .npy file
+        :param columns: number of columns of the matrix
+        :param dtype: type of the elements of the matrix
+        """
+        self.file_path = file_path
+        self.columns = columns
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.file = open(file_path, "wb")
+        self.file.write(_npy_header((0, columns), self.dtype))
+
+    def write(self, rows):
+        """
+        :param rows: a matrix with the same number of columns, appended to the file
+        """
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.ndim != 2 or rows.shape[1] != self.columns:
+            raise ValueError("Expected rows of {0} columns, got shape {1}".format(self.columns, rows.shape))
+        self.file.write(rows.tobytes())
+        self.rows += len(rows)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(_npy_header((self.rows, self.columns), self.dtype))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RunningStatistics(object):
+    """
+    Mean and standard deviation of the columns of a matrix, accumulated block by block (Chan et al. parallel
+    algorithm, that is numerically stable)
+    """
+
+    def __init__(self, columns):
+        self.count = 0
+        self.mean = np.zeros(columns)
+        self.m2 = np.zeros(columns)
+
+    def update(self, block):
+        """
+        :param block: a matrix, whose rows are added to the statistics
+        """
+        if not len(block):
+            return
+        block = np.asarray(block, dtype=np.float64)
+        count = len(block)
+        mean = block.mean(axis=0)
+        m2 = ((block - mean) ** 2).sum(axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    @property
+    def std(self):
+        """
+        :return: the population standard deviation, like np.std
+        """
+        return np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.m2)
+
+
+def matrix_statistics(matrix, columns=None, block_rows=BLOCK_ROWS):
+    """
+    :param matrix: a (memory-mapped) matrix
+    :param columns: number of leading columns whose statistics are computed, None for all of them
+    :param block_rows: number of rows read at once
+    :return: mean and standard deviation of the columns
+    :rtype: (np.array, np.array)
+    """
+    statistics = RunningStatistics(matrix.shape[1] if columns is None else columns)
+    for start in range(0, len(matrix), block_rows):
+        statistics.update(matrix[start:start + block_rows, :columns])
+    return statistics.mean, statistics.std
+
+
+def iter_shuffled_batches(matrix, batch_size, rng, block_rows=BLOCK_ROWS, shuffle_blocks=SHUFFLE_BLOCKS):
+    """
+    One epoch of mini-batches over the rows of a (memory-mapped) matrix. Blocks of contiguous rows are visited in
+    random order; shuffle_blocks of them at a time are read into memory and their rows are shuffled
+
+    :param matrix: a (memory-mapped) matrix
+    :param batch_size: rows of each mini-batch
+    :param rng: the random generator
+    :type rng: np.random.Generator
+    :param block_rows: rows of each block
+    :param shuffle_blocks: number of blocks shuffled together
+    :return: a generator over the mini-batches, in-memory matrices
+    """
+    starts = rng.permutation(np.arange(0, len(matrix), block_rows))
+    for group in range(0, len(starts), shuffle_blocks):
+        rows = np.concatenate([matrix[start:start + block_rows] for start in starts[group:group + shuffle_blocks]])
+        rows = rows[rng.permutation(len(rows))]
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+
+def write_training_set(class_one_files, class_zero_files, file_path, chunk_size=BLOCK_ROWS):
+    """
+    Streaming version of string_classifier.generate_training_set: the features are computed chunk by chunk and
+    appended to a .npy file, that holds the same matrix
+
+    :param class_one_files: path of files where each line is a class 1 string
+    :param class_zero_files: path of files where each line is a class 0 string
+    :param file_path: path of the .npy file
+    :param chunk_size: number of lines whose features are computed at once
+    :return: the number of rows of the matrix
+    :rtype: int
+    """
+    with NpyMatrixWriter(file_path, N_FEATURES + 1) as writer:
+        for expected_class, files in ((1.0, class_one_files), (0.0, class_zero_files)):
+            for input_path in files:
+                with open(input_path) as f:
+                    while True:
+                        lines = [line.replace('\n', '').replace('\r', '') for line in itertools.islice(f, chunk_size)]
+                        if not lines:
+                            break
+                        features, valid = calculate_features_batch(StringBatch.from_strings(lines),
+                                                                   np.arange(len(lines)))
+                        for position in np.flatnonzero(~valid).tolist():
+                            logging.info("Invalid line: {0}".format(lines[position]))
+                        writer.write(np.hstack([features, np.full((len(features), 1), expected_class)]))
+        return writer.rows
@@ -0,0 +1,166 @@
+"""
+Vectorized computation of the string features, for the pure ASCII strings of a StringBatch.
+The strings are never materialized: their bytes are gathered into a single array (plus the row of each byte),
+and each feature is computed for all of them at once with a few NumPy passes over it, e.g. sequentiality
+compares the array with itself shifted by 1, 2... up to the widest distance window. NumPy releases the GIL
+inside these loops, so that several threads can compute features concurrently even on regular CPython.
+Values are the same (to the last bit) computed by string_classifier.calculate_all_features: terms are added up
+in the same order, and the transcendental functions are evaluated with the math module, on the distinct
+values only. Non ASCII strings go through calculate_all_features.
+"""
+import math
+
+import numpy as np
+
+from . import charset as cset
+from .gibberish_detector.gibberish_detector import ACCEPTED_CHARSET
+from .gibberish_detector.gibberish_singleton import gib_detector
+from .string_classifier import calculate_all_features, N_FEATURES
+
+ASCII_CODES = 128
+# strings whose features are computed at once: the byte histograms alone take 2 KiB for each string
+KERNEL_CHUNK_SIZE = 1 << 14
+CHARSET_LENGTHS = np.array([len(charset) for charset, _ in cset.CHARSETS_BYTES])
+# gibberish: byte => position inside the transition matrix (after lowercasing), -1 if not accepted
+GIBBERISH_POSITIONS = np.full(256, -1, dtype=np.int64)
+for _position, _char in enumerate(ACCEPTED_CHARSET):
+    GIBBERISH_POSITIONS[ord(_char)] = _position
+    GIBBERISH_POSITIONS[ord(_char.upper())] = _position
+LOG_PROB_MATRIX = np.array(gib_detector.log_prob_mat, dtype=np.float64)
+
+
+def _map_unique(function, values):
+    """
+    :return: function (a math function) applied to each one of the values, evaluating it once for each distinct one
+    :rtype: np.array
+    """
+    unique, inverse = np.unique(values, return_inverse=True)
+    return np.array([function(value) for value in unique.tolist()], dtype=np.float64)[inverse]
+
+
+def entropy_kernel(histograms, lengths):
+    """
+    :param histograms: a n x 256 matrix, where each row contains the byte counts of a string
+    :param lengths: the length of each string
+    :return: the entropy of each string, divided by its length
+    :rtype: np.array
+    """
+    rows, codes = np.nonzero(histograms[:, :ASCII_CODES])
+    probabilities = histograms[rows, codes] / lengths[rows]
+    terms = np.zeros((len(lengths), ASCII_CODES))
+    terms[rows, codes] = probabilities * _map_unique(lambda p: math.log(p, 2), probabilities)
+    # charsets are sorted, so adding the terms by code is the order of entropy.shannon_entropy
+    entropy = np.zeros(len(lengths))
+    for code in np.unique(codes).tolist():
+        entropy += terms[:, code]
+    return -entropy / lengths
+
+
+def sequentiality_kernel(data, rows, lengths, charset_ids):
+    """
+    :param data: the concatenated bytes of the strings
+    :param rows: for each byte, the index of its string
+    :param lengths: the length of each string
+    :param charset_ids: the index of the narrowest charset of each string, inside charset.Charset
+    :return: the sequentiality index of each string
+    :rtype: np.array
+    """
+    count = len(lengths)
+    window_sizes = np.floor(_map_unique(math.log, np.maximum(lengths, 1))).astype(np.int64)
+    codes = data.astype(np.int64)
+    buckets = np.zeros(count * ASCII_CODES)
+    for distance in range(1, int(window_sizes.max(initial=0)) + 1):
+        pair_rows = rows[:-distance]
+        pairs = (pair_rows == rows[distance:]) & (window_sizes[pair_rows] >= distance)
+        diffs = np.abs(codes[distance:] - codes[:-distance])
+        buckets += np.bincount(pair_rows[pairs] * ASCII_CODES + diffs[pairs], minlength=count * ASCII_CODES)
+    buckets = buckets.reshape(count, ASCII_CODES)
+    counters = buckets.sum(axis=1)
+    sequentiality = np.zeros(count)
+    for charset_id in np.unique(charset_ids).tolist():
+        selected = np.flatnonzero((charset_ids == charset_id) & (lengths > 2))
+        if not len(selected):
+            continue
+        histograms = buckets[selected] / counters[selected, None]
+        charset_buckets = cset.get_char_distance_distribution(cset.CHARSETS_BYTES[charset_id][0])
+        diffs = histograms[:, list(charset_buckets.keys())] - np.array(list(charset_buckets.values()))
+        # "** 2" (i.e. pow) may round differently than NumPy's squaring
+        squares = _map_unique(lambda diff: diff ** 2, diffs.ravel()).reshape(diffs.shape)
+        mse = np.zeros(len(selected))
+        for column in range(len(charset_buckets)):
+            mse += squares[:, column] / len(charset_buckets)
+        sequentiality[selected] = mse
+    return sequentiality
+
+
+def gibberish_kernel(data, rows, count):
+    """
+    :param data: the concatenated bytes of the strings
+    :param rows: for each byte, the index of its string
+    :param count: the number of strings
+    :return: the gibberish index of each string, 0 for strings with less than 2 accepted characters
+    :rtype: np.array
+    """
+    positions = GIBBERISH_POSITIONS[data]
+    accepted = positions >= 0
+    positions, rows = positions[accepted], rows[accepted]
+    transitions = rows[1:] == rows[:-1]
+    log_probs = np.bincount(rows[1:][transitions], LOG_PROB_MATRIX[positions[:-1], positions[1:]][transitions],
+                            minlength=count)
+    transitions_count = np.bincount(rows[1:][transitions], minlength=count)
+    gibberish = _map_unique(math.exp, log_probs / np.maximum(transitions_count, 1))
+    gibberish[transitions_count == 0] = 0
+    return gibberish
+
+
+def calculate_features_vectorized(batch, indices, chunk_size=KERNEL_CHUNK_SIZE):
+    """
+    Vectorized version of string_classifier.calculate_features_batch
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :param indices: the indices of the strings of the batch that should be analyzed
+    :param chunk_size: number of strings whose features are computed at once, that bounds the size of the
+                       intermediate arrays (byte histograms, entropy terms...) whatever the size of the batch
+    :return: a matrix where each row contains the features of a valid string and a boolean mask over
+             indices that tells which strings are valid, i.e. which strings have a row in the matrix
+    :rtype: (np.array, np.array)
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if len(indices) <= chunk_size:
+        return _calculate_features_chunk(batch, indices)
+    chunks = [_calculate_features_chunk(batch, indices[start:start + chunk_size])
+              for start in range(0, len(indices), chunk_size)]
+    return np.concatenate([features for features, _ in chunks]), np.concatenate([valid for _, valid in chunks])
+
+
+def _calculate_features_chunk(batch, indices):
+    features = np.zeros((len(indices), N_FEATURES))
+    valid = np.zeros(len(indices), dtype=bool)
+    ascii = np.flatnonzero(batch.ascii[indices] & (batch.byte_lengths[indices] > 0))
+
+    if len(ascii):
+        data, rows = batch.gather_bytes(indices[ascii])
+        histograms = np.bincount(rows * 256 + data, minlength=len(ascii) * 256).reshape(len(ascii), 256)
+        charset_ids = cset.get_narrower_charset_ids(histograms)
+        kept = charset_ids >= 0
+        if not kept.all():
+            # strings without a charset are invalid: their bytes are dropped
+            ascii, histograms, charset_ids = ascii[kept], histograms[kept], charset_ids[kept]
+            remap = np.cumsum(kept) - 1
+            byte_kept = kept[rows]
+            data, rows = data[byte_kept], remap[rows[byte_kept]]
+        lengths = batch.byte_lengths[indices[ascii]]
+        features[ascii, 0] = entropy_kernel(histograms, lengths)
+        features[ascii, 1] = sequentiality_kernel(data, rows, lengths, charset_ids)
+        features[ascii, 2] = gibberish_kernel(data, rows, len(ascii))
+        features[ascii, 3] = CHARSET_LENGTHS[charset_ids]
+        valid[ascii] = True
+
+    others = np.flatnonzero(~batch.ascii[indices])
+    for position, string in zip(others.tolist(), batch.iter_strings(indices[others])):
+        string_features = calculate_all_features(string)
+        if string_features is not None:
+            features[position] = string_features
+            valid[position] = True
+    return features[valid], valid
@@ -37,6 +37,8 @@ import pickle
 ACCEPTED_CHARSET = "0123456789abcdefghijklmnopqrstuvwxyz"
 
 pos = dict([(char, idx) for idx, char in enumerate(ACCEPTED_CHARSET)])
+# bytes that normalize() discards from (already lowercased) ASCII bytes strings
+REJECTED_BYTES = bytes(b for b in range(256) if chr(b) not in ACCEPTED_CHARSET)
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
@@ -127,7 +129,9 @@ class GibberishDetector(object):
 def normalize(line):
     """ Return only the subset of chars from accepted_chars.
     This helps keep the  my_model relatively small by ignoring punctuation,
-    infrequenty symbols, etc. """
+    infrequenty symbols, etc. ASCII bytes are accepted as well. """
+    if isinstance(line, bytes):
+        return list(line.lower().translate(None, REJECTED_BYTES).decode('ascii'))
     return [c.lower() for c in line if c.lower() in ACCEPTED_CHARSET]
 
 
@@ -5,6 +5,7 @@ import os
 
 from api_key_detector.gibberish_detector import gibberish_detector
 from api_key_detector.gibberish_detector import config
+from api_key_detector.bundle_singleton import bundle
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
@@ -19,8 +20,11 @@ for path in config.bad_test:
     bad_test.append(os.path.join(__location__, path))
 dump = os.path.join(__location__, config.dump)
 
-gib_detector = gibberish_detector.load_or_create_trained_instance(learnsets,
-                                                                  good_test,
-                                                                  bad_test,
-                                                                  dump,
-                                                                  config.re_train)
+if bundle is not None:
+    gib_detector = bundle.load_gibberish_detector()
+else:
+    gib_detector = gibberish_detector.load_or_create_trained_instance(learnsets,
+                                                                      good_test,
+                                                                      bad_test,
+                                                                      dump,
+                                                                      config.re_train)
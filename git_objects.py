@@ -0,0 +1,414 @@
+"""
+Read-only access to the objects of a local git repository, without git itself: loose objects (zlib compressed
+files), pack files (version 2 indexes, with offset and reference deltas) and references (loose and packed).
+Pack files are memory-mapped; the objects that deltas are applied to are kept in a small cache, since long
+delta chains share their bases.
+"""
+import bisect
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+COMMIT = "commit"
+TREE = "tree"
+BLOB = "blob"
+TAG = "tag"
+PACK_TYPES = {1: COMMIT, 2: TREE, 3: BLOB, 4: TAG}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+IDX_MAGIC = b"\377tOc"
+# tree entries modes
+TREE_MODE = 0o040000
+GITLINK_MODE = 0o160000
+SYMLINK_MODE = 0o120000
+# decompression of pack entries, whose compressed size is unknown, goes on by blocks of this size
+INFLATE_BLOCK = 1 << 16
+DELTA_BASE_CACHE_SIZE = 256
+
+
+class GitObjectError(Exception):
+    pass
+
+
+class Commit(object):
+    def __init__(self, sha, tree, parents, committed, summary):
+        """
+        :param sha: hex SHA-1 of the commit
+        :param tree: hex SHA-1 of its root tree
+        :param parents: hex SHA-1 of its parents
+        :param committed: commit timestamp, in seconds since the epoch
+        :param summary: first line of the commit message
+        """
+        self.sha = sha
+        self.tree = tree
+        self.parents = parents
+        self.committed = committed
+        self.summary = summary
+
+
+def parse_commit(sha, data):
+    """
+    :param sha: hex SHA-1 of the commit
+    :param data: the raw commit object
+    :rtype: Commit
+    """
+    headers, _, message = data.partition(b"\n\n")
+    tree = None
+    parents = []
+    committed = 0
+    for line in headers.split(b"\n"):
+        key, _, value = line.partition(b" ")
+        if key == b"tree":
+            tree = value.decode("ascii")
+        elif key == b"parent":
+            parents.append(value.decode("ascii"))
+        elif key == b"committer":
+            # "name <email> timestamp timezone"
+            committed = int(value.rsplit(b" ", 2)[1])
+    summary = message.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+    return Commit(sha, tree, parents, committed, summary)
+
+
+def parse_tree(data):
+    """
+    :param data: the raw tree object
+    :return: a generator over (mode, name, hex SHA-1) entries
+    """
+    position = 0
+    while position < len(data):
+        space = data.index(b" ", position)
+        nul = data.index(b"\0", space)
+        mode = int(data[position:space], 8)
+        name = data[space + 1:nul].decode("utf-8", errors="surrogateescape")
+        yield mode, name, data[nul + 1:nul + 21].hex()
+        position = nul + 21
+
+
+def parse_tag_target(data):
+    """
+    :param data: the raw (annotated) tag object
+    :return: the type and hex SHA-1 of the tagged object
+    :rtype: (str, str)
+    """
+    target = None
+    target_type = None
+    for line in data.split(b"\n\n", 1)[0].split(b"\n"):
+        key, _, value = line.partition(b" ")
+        if key == b"object":
+            target = value.decode("ascii")
+        elif key == b"type":
+            target_type = value.decode("ascii")
+    return target_type, target
+
+
+def apply_delta(base, delta):
+    """
+    :param base: the base object
+    :param delta: a git delta (copy and insert instructions)
+    :return: the target object
+    :rtype: bytes
+    """
+    position = 0
+
+    def varint():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = delta[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    if varint() != len(base):
+        raise GitObjectError("Delta base size mismatch")
+    target_size = varint()
+    target = bytearray()
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:
+            # copy from the base: offset and size bytes are present according to the opcode bits
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if opcode & (1 << (4 + i)):
+                    size |= delta[position] << (8 * i)
+                    position += 1
+            target += base[offset:offset + (size or 0x10000)]
+        elif opcode:
+            target += delta[position:position + opcode]
+            position += opcode
+        else:
+            raise GitObjectError("Invalid delta opcode")
+    if len(target) != target_size:
+        raise GitObjectError("Delta target size mismatch")
+    return bytes(target)
+
+
+class PackFile(object):
+    """
+    A pack file and its (version 2) index
+    """
+
+    def __init__(self, idx_path):
+        with open(idx_path, "rb") as f:
+            idx = f.read()
+        if idx[:4] != IDX_MAGIC or struct.unpack(">I", idx[4:8])[0] != 2:
+            raise GitObjectError("Unsupported pack index {0}".format(idx_path))
+        self.fanout = struct.unpack(">256I", idx[8:8 + 1024])
+        self.count = self.fanout[255]
+        names_start = 8 + 1024
+        offsets_start = names_start + 20 * self.count + 4 * self.count
+        large_start = offsets_start + 4 * self.count
+        self.names = [idx[names_start + 20 * i:names_start + 20 * (i + 1)] for i in range(self.count)]
+        self.offsets = struct.unpack(">{0}I".format(self.count), idx[offsets_start:large_start])
+        self.large_offsets = idx[large_start:]
+        pack_path = idx_path[:-len(".idx")] + ".pack"
+        self.file = open(pack_path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def find(self, sha):
+        """
+        :param sha: binary SHA-1
+        :return: the offset of the object inside the pack, None if not in this pack
+        """
+        low = self.fanout[sha[0] - 1] if sha[0] else 0
+        high = self.fanout[sha[0]]
+        i = bisect.bisect_left(self.names, sha, low, high)
+        if i == high or self.names[i] != sha:
+            return None
+        offset = self.offsets[i]
+        if offset & 0x80000000:
+            large = (offset & 0x7fffffff) * 8
+            offset = struct.unpack(">Q", self.large_offsets[large:large + 8])[0]
+        return offset
+
+    def __iter__(self):
+        """
+        :return: an iterator over the hex SHA-1 of the objects of the pack
+        """
+        return (name.hex() for name in self.names)
+
+    def inflate(self, position, size):
+        decompressor = zlib.decompressobj()
+        chunks = []
+        # compressed data is rarely much larger than the object itself
+        block_size = size + 64
+        while not decompressor.eof:
+            block = self.data[position:position + block_size]
+            if not block:
+                raise GitObjectError("Truncated pack entry")
+            chunks.append(decompressor.decompress(block))
+            position += block_size
+            block_size = INFLATE_BLOCK
+        data = b"".join(chunks)
+        if len(data) != size:
+            raise GitObjectError("Pack entry size mismatch")
+        return data
+
+    def read_entry(self, offset):
+        """
+        :return: the type of the entry, its (inflated) data and, for deltas, the base (offset or binary SHA-1)
+        :rtype: (int, bytes, Union[int, bytes])
+        """
+        data = self.data
+        position = offset
+        byte = data[position]
+        position += 1
+        entry_type = (byte >> 4) & 0x07
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = data[position]
+            position += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        base = None
+        if entry_type == OFS_DELTA:
+            byte = data[position]
+            position += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = data[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = offset - distance
+        elif entry_type == REF_DELTA:
+            base = bytes(data[position:position + 20])
+            position += 20
+        return entry_type, self.inflate(position, size), base
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class GitRepository(object):
+    """
+    A local git repository (either a working copy or a bare one), read directly from its objects directory
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the working copy, its .git directory or a bare repository
+        """
+        git_dir = os.path.join(path, ".git")
+        if os.path.isfile(git_dir):
+            # a linked worktree or a submodule: .git contains "gitdir: <path>"
+            with open(git_dir, "r", encoding="utf-8") as f:
+                git_dir = os.path.join(path, f.read().strip()[len("gitdir:"):].strip())
+        elif not os.path.isdir(git_dir):
+            git_dir = path
+        common_dir_file = os.path.join(git_dir, "commondir")
+        self.git_dir = git_dir
+        self.common_dir = git_dir
+        if os.path.exists(common_dir_file):
+            with open(common_dir_file, "r", encoding="utf-8") as f:
+                self.common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        objects_dir = os.path.join(self.common_dir, "objects")
+        if not os.path.isdir(objects_dir):
+            raise GitObjectError("{0} is not a git repository".format(path))
+        self.objects_dirs = [objects_dir]
+        alternates = os.path.join(objects_dir, "info", "alternates")
+        if os.path.exists(alternates):
+            with open(alternates, "r", encoding="utf-8") as f:
+                self.objects_dirs.extend(os.path.join(objects_dir, line.strip()) for line in f
+                                         if line.strip() and not line.startswith("#"))
+        self.packs = []
+        for directory in self.objects_dirs:
+            pack_dir = os.path.join(directory, "pack")
+            if os.path.isdir(pack_dir):
+                self.packs.extend(PackFile(os.path.join(pack_dir, name)) for name in sorted(os.listdir(pack_dir))
+                                  if name.endswith(".idx"))
+        self.delta_bases = OrderedDict()
+
+    def close(self):
+        for pack in self.packs:
+            pack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read_loose(self, sha):
+        for directory in self.objects_dirs:
+            path = os.path.join(directory, sha[:2], sha[2:])
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    raw = zlib.decompress(f.read())
+                header, _, data = raw.partition(b"\0")
+                object_type, size = header.decode("ascii").split(" ")
+                if int(size) != len(data):
+                    raise GitObjectError("Corrupted object {0}".format(sha))
+                return object_type, data
+        return None
+
+    def _read_packed(self, pack, offset):
+        key = (id(pack), offset)
+        if key in self.delta_bases:
+            self.delta_bases.move_to_end(key)
+            return self.delta_bases[key]
+        entry_type, data, base = pack.read_entry(offset)
+        if entry_type == OFS_DELTA:
+            base_type, base_data = self._read_packed(pack, base)
+        elif entry_type == REF_DELTA:
+            base_type, base_data = self.read_object(base.hex())
+        else:
+            return PACK_TYPES[entry_type], data
+        result = base_type, apply_delta(base_data, data)
+        # deltas' targets are often the bases of other deltas
+        self.delta_bases[key] = result
+        if len(self.delta_bases) > DELTA_BASE_CACHE_SIZE:
+            self.delta_bases.popitem(last=False)
+        return result
+
+    def read_object(self, sha):
+        """
+        :param sha: hex SHA-1 of the object
+        :return: the type and the contents of the object
+        :rtype: (str, bytes)
+        """
+        binary_sha = bytes.fromhex(sha)
+        for pack in self.packs:
+            offset = pack.find(binary_sha)
+            if offset is not None:
+                return self._read_packed(pack, offset)
+        result = self._read_loose(sha)
+        if result is None:
+            raise GitObjectError("Object {0} not found".format(sha))
+        return result
+
+    def read_commit(self, sha):
+        """
+        :rtype: Commit
+        """
+        object_type, data = self.read_object(sha)
+        if object_type != COMMIT:
+            raise GitObjectError("{0} is a {1}, not a commit".format(sha, object_type))
+        return parse_commit(sha, data)
+
+    def read_tree(self, sha):
+        """
+        :return: the (mode, name, hex SHA-1) entries of the tree
+        :rtype: list
+        """
+        object_type, data = self.read_object(sha)
+        if object_type != TREE:
+            raise GitObjectError("{0} is a {1}, not a tree".format(sha, object_type))
+        return list(parse_tree(data))
+
+    def peel(self, sha):
+        """
+        :return: the commit that sha (a commit or an annotated tag) points to, None for tags of other objects
+        :rtype: str
+        """
+        while True:
+            object_type, data = self.read_object(sha)
+            if object_type == COMMIT:
+                return sha
+            if object_type != TAG:
+                return None
+            object_type, sha = parse_tag_target(data)
+
+    def references(self):
+        """
+        :return: reference name => hex SHA-1, for HEAD, branches, tags and remote branches
+        :rtype: OrderedDict
+        """
+        references = OrderedDict()
+        packed_refs = os.path.join(self.common_dir, "packed-refs")
+        if os.path.exists(packed_refs):
+            with open(packed_refs, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith(("#", "^")) or not line.strip():
+                        continue
+                    sha, name = line.split()
+                    references[name] = sha
+        refs_dir = os.path.join(self.common_dir, "refs")
+        for root, dirs, file_names in os.walk(refs_dir):
+            dirs.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(root, file_name)
+                with open(path, "r", encoding="utf-8") as f:
+                    value = f.read().strip()
+                name = os.path.relpath(path, self.common_dir).replace(os.sep, "/")
+                if not value.startswith("ref:"):
+                    # loose references override packed ones
+                    references[name] = value
+        with open(os.path.join(self.git_dir, "HEAD"), "r", encoding="utf-8") as f:
+            head = f.read().strip()
+        if head.startswith("ref:"):
+            head = references.get(head[len("ref:"):].strip())
+        if head:
+            references["HEAD"] = head
+        return references
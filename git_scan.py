@@ -0,0 +1,333 @@
+"""
+Incremental scan of the whole history of a local git repository, read directly from its objects (see git_objects).
+Commits reachable from the references are walked back until an already scanned commit is met; the trees of the
+new commits record, once for each (blob, path) pair, the commit that introduced the blob at that path. Each blob is
+then scanned once, whatever the number of commits and paths it appears at: its strings are the literals of source
+files (see literal_lexer), or the tokens of its lines for the other files. Results are stored by blob SHA-1 inside a
+SQLite database, so that the next runs only scan the blobs of the commits added meanwhile.
+"""
+import logging
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+from . import config
+from .git_objects import BLOB, GITLINK_MODE, SYMLINK_MODE, TREE_MODE, GitRepository
+from .literal_lexer import extract_literals, language_of
+from .scan_job import model_fingerprint
+from .string_batch import StringBatch
+
+STORE_FILE = "api_key_detector.sqlite"
+DEFAULT_CHUNK_SIZE = 10000
+# family of the other files, whose strings are the tokens of their lines
+LINES = "lines"
+# tokens are separated by spaces, quotes, brackets and assignments ("=" at the end of a token is base64 padding)
+TOKEN_RE = re.compile(r"[^\s\"'`,;:=<>()\[\]{}|]+=*")
+# larger blobs (e.g. datasets, minified bundles) and binary blobs are skipped
+MAX_BLOB_BYTES = 8 << 20
+BINARY_SNIFF_BYTES = 8000
+
+
+class GitFinding(object):
+    def __init__(self, commit, path, blob, line, column, value):
+        """
+        :param commit: hex SHA-1 of the commit that introduced the blob at path
+        :param path: path of the file inside the repository
+        :param blob: hex SHA-1 of the blob
+        :param line: line of the API key inside the file, 1-based
+        :param column: column of the API key inside the file, 1-based
+        :param value: the API key
+        """
+        self.commit = commit
+        self.path = path
+        self.blob = blob
+        self.line = line
+        self.column = column
+        self.value = value
+
+    def __str__(self):
+        return "{0} {1}:{2}:{3}: {4}".format(self.commit, self.path, self.line, self.column, self.value)
+
+
+class BlobResultStore(object):
+    """
+    Persistent results of a repository scan: scanned commits, walked trees, where each blob appears and the
+    findings of each blob
+    """
+
+    def __init__(self, db_path, timeout=60.0):
+        self.connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS commits (sha TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS trees (sha TEXT, prefix TEXT, PRIMARY KEY (sha, prefix));
+            CREATE TABLE IF NOT EXISTS blob_paths (
+                blob TEXT, family TEXT, path TEXT, "commit" TEXT, PRIMARY KEY (blob, path));
+            CREATE TABLE IF NOT EXISTS blobs (sha TEXT, family TEXT, scanned INTEGER, PRIMARY KEY (sha, family));
+            CREATE INDEX IF NOT EXISTS blobs_scanned ON blobs (scanned);
+            CREATE TABLE IF NOT EXISTS findings (blob TEXT, family TEXT, line INTEGER, "column" INTEGER, string TEXT);
+            CREATE INDEX IF NOT EXISTS findings_blob ON findings (blob, family);
+        """)
+
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def check_fingerprint(self, fingerprint):
+        """
+        Blob results computed with different configuration or models are discarded, so that their blobs
+        are scanned again; walked commits and trees are kept
+
+        :return: False if the stored results were computed with a different fingerprint
+        :rtype: bool
+        """
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is not None and row[0] == fingerprint:
+            return True
+        connection = self._transaction()
+        try:
+            connection.execute("DELETE FROM findings")
+            connection.execute("UPDATE blobs SET scanned = 0")
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return row is None
+
+    def is_commit_scanned(self, sha):
+        return self.connection.execute("SELECT 1 FROM commits WHERE sha = ?", (sha,)).fetchone() is not None
+
+    def is_tree_walked(self, sha, prefix):
+        return self.connection.execute("SELECT 1 FROM trees WHERE sha = ? AND prefix = ?",
+                                       (sha, prefix)).fetchone() is not None
+
+    def add_commits(self, commits, trees, blob_paths):
+        """
+        Records, at once, walked commits and trees and the blobs found inside them, that become pending
+
+        :param commits: hex SHA-1 of the walked commits
+        :param trees: (hex SHA-1, path prefix) of the walked trees
+        :param blob_paths: (blob, family, path, commit) tuples
+        """
+        connection = self._transaction()
+        try:
+            connection.executemany('INSERT OR IGNORE INTO blob_paths VALUES (?, ?, ?, ?)', blob_paths)
+            connection.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?, 0)",
+                                   set((blob, family) for blob, family, _, _ in blob_paths))
+            connection.executemany("INSERT OR IGNORE INTO trees VALUES (?, ?)", trees)
+            connection.executemany("INSERT OR IGNORE INTO commits VALUES (?)", ((sha,) for sha in commits))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def pending_blobs(self):
+        """
+        :return: the (hex SHA-1, family) pairs of the blobs not scanned yet
+        :rtype: list
+        """
+        return self.connection.execute("SELECT sha, family FROM blobs WHERE scanned = 0 ORDER BY sha").fetchall()
+
+    def complete_blobs(self, blobs, findings):
+        """
+        :param blobs: (hex SHA-1, family) pairs of scanned blobs
+        :param findings: (blob, family, line, column, string) tuples, found inside them
+        """
+        connection = self._transaction()
+        try:
+            connection.executemany("INSERT INTO findings VALUES (?, ?, ?, ?, ?)", findings)
+            connection.executemany("UPDATE blobs SET scanned = 1 WHERE sha = ? AND family = ?", blobs)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def findings(self):
+        """
+        :return: a generator over the GitFinding objects, for each path each blob with API keys was introduced at
+        """
+        cursor = self.connection.execute(
+            'SELECT p."commit", p.path, f.blob, f.line, f."column", f.string FROM findings f '
+            'JOIN blob_paths p ON p.blob = f.blob AND p.family = f.family ORDER BY p.path, p."commit", f.line')
+        for row in cursor:
+            yield GitFinding(*row)
+
+    def close(self):
+        self.connection.close()
+
+
+def family_of(path):
+    """
+    :return: the language family of path (see literal_lexer), LINES for the other files
+    :rtype: str
+    """
+    return language_of(path) or LINES
+
+
+def iter_blob_strings(data, family, min_length=None, max_bytes=MAX_BLOB_BYTES, name="blob"):
+    """
+    :param data: the contents of a blob
+    :param family: how strings are extracted from the blob
+    :param min_length: shorter strings are skipped; defaults to the min_key_length of config.yml
+    :param max_bytes: larger blobs are skipped, None for no limit
+    :param name: what the blob is, for logging
+    :return: a generator over the (line, column, string) of the blob; binary blobs have none
+    """
+    if min_length is None:
+        min_length = config.min_key_length
+    if max_bytes is not None and len(data) > max_bytes:
+        logging.info("Skipping {0}: larger than {1} bytes".format(name, max_bytes))
+        return
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return
+    text = data.decode("utf-8", errors="replace")
+    if family != LINES:
+        yield from extract_literals(text, family, min_length)
+        return
+    for number, line in enumerate(text.split("\n")):
+        for match in TOKEN_RE.finditer(line):
+            if match.end() - match.start() >= min_length:
+                yield number + 1, match.start() + 1, match.group()
+
+
+class GitHistoryScanner(object):
+    def __init__(self, repository_path, store_path=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param repository_path: a local working copy, its .git directory or a bare repository
+        :param store_path: the SQLite results store, STORE_FILE inside the git directory by default
+        :param chunk_size: number of strings submitted to the detector at once
+        """
+        self.repository = GitRepository(repository_path)
+        self.store = BlobResultStore(store_path or os.path.join(self.repository.git_dir, STORE_FILE))
+        self.chunk_size = chunk_size
+
+    def close(self):
+        self.store.close()
+        self.repository.close()
+
+    def new_commits(self):
+        """
+        :return: the commits reachable from the references that were not scanned yet, parents first
+        :rtype: list
+        """
+        tips = set()
+        for sha in self.repository.references().values():
+            commit = self.repository.peel(sha)
+            if commit is not None:
+                tips.add(commit)
+        commits = {}
+        stack = sorted(tips)
+        while stack:
+            sha = stack.pop()
+            if sha in commits or self.store.is_commit_scanned(sha):
+                continue
+            commit = self.repository.read_commit(sha)
+            commits[sha] = commit
+            stack.extend(commit.parents)
+        # parents come before their children, so that each blob is attributed to the first commit it appears in
+        ordered = []
+        visited = set()
+        for tip in sorted(commits.values(), key=lambda commit: commit.committed):
+            stack = [(tip, False)]
+            while stack:
+                commit, parents_done = stack.pop()
+                if parents_done:
+                    ordered.append(commit)
+                    continue
+                if commit.sha in visited:
+                    continue
+                visited.add(commit.sha)
+                stack.append((commit, True))
+                stack.extend((commits[parent], False) for parent in reversed(commit.parents)
+                             if parent in commits and parent not in visited)
+        return ordered
+
+    def walk_commits(self, commits):
+        """
+        Records the blobs of the trees of commits
+
+        :return: the number of (blob, path) pairs seen for the first time
+        :rtype: int
+        """
+        trees = set()
+        blob_paths = {}
+        for commit in commits:
+            stack = [(commit.tree, "")]
+            while stack:
+                tree, prefix = stack.pop()
+                if (tree, prefix) in trees or self.store.is_tree_walked(tree, prefix):
+                    continue
+                trees.add((tree, prefix))
+                for mode, name, sha in self.repository.read_tree(tree):
+                    path = prefix + name
+                    if mode == TREE_MODE:
+                        stack.append((sha, path + "/"))
+                    elif mode not in (GITLINK_MODE, SYMLINK_MODE) and (sha, path) not in blob_paths:
+                        blob_paths[(sha, path)] = (sha, family_of(path), path, commit.sha)
+        self.store.add_commits([commit.sha for commit in commits], trees, list(blob_paths.values()))
+        return len(blob_paths)
+
+    def scan_blobs(self):
+        """
+        Scans the pending blobs, committing the results every chunk_size strings
+
+        :return: the number of scanned blobs
+        :rtype: int
+        """
+        # imported here, so that walking a repository doesn't need the models to be loaded
+        from .detector import detect_api_keys_batch
+
+        pending = self.store.pending_blobs()
+        strings = []
+        blobs = []
+        for blob, family in pending:
+            object_type, data = self.repository.read_object(blob)
+            if object_type == BLOB:
+                strings.extend((blob, family, line, column, string) for line, column, string in
+                               iter_blob_strings(data, family, name="blob {0}".format(blob)))
+            blobs.append((blob, family))
+            if len(strings) >= self.chunk_size:
+                self._complete(blobs, strings, detect_api_keys_batch)
+                strings, blobs = [], []
+        if blobs:
+            self._complete(blobs, strings, detect_api_keys_batch)
+        return len(pending)
+
+    def _complete(self, blobs, strings, detect_api_keys_batch):
+        findings = []
+        if strings:
+            detection = detect_api_keys_batch(StringBatch.from_strings([item[4] for item in strings]))
+            findings = [strings[index] for index in np.flatnonzero(detection).tolist()]
+        self.store.complete_blobs(blobs, findings)
+
+    def run(self):
+        """
+        Scans the commits added since the last run
+
+        :return: a generator over the findings of the whole history
+        """
+        if not self.store.check_fingerprint(model_fingerprint()):
+            logging.info("Configuration or models changed: every blob will be scanned again")
+        commits = self.new_commits()
+        paths = self.walk_commits(commits)
+        logging.info("{0} new commits, {1} new blob paths".format(len(commits), paths))
+        logging.info("{0} blobs scanned".format(self.scan_blobs()))
+        return self.store.findings()
+
+
+def scan_git_history(repository_path, store_path=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    :param repository_path: a local working copy, its .git directory or a bare repository
+    :param store_path: the SQLite results store, STORE_FILE inside the git directory by default
+    :param chunk_size: number of strings submitted to the detector at once
+    :return: the GitFinding objects of the whole history
+    :rtype: list
+    """
+    scanner = GitHistoryScanner(repository_path, store_path, chunk_size)
+    try:
+        return list(scanner.run())
+    finally:
+        scanner.close()
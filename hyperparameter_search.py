@@ -0,0 +1,251 @@
+"""
+Parallel search of the classifier backend configuration.
+The training set matrix is loaded (or built from the learnsets of config.yml) once: the parent process computes the
+normalization parameters in a streaming pass, splits off a validation set and writes the standardized matrices to
+temporary .npy files, that worker processes memory-map read-only (so that they share the same page cache instead of
+a copy each). Each worker trains a configuration: backends that support mini-batches are trained epoch by epoch,
+with early stopping on the validation errors and a time budget; the others are fitted once. Then it measures
+validation errors, training time and inference latency.
+The best configuration (fewest validation errors, then lowest batched latency) is the only one measured on the
+test set, that takes no part in the selection. It is returned as a classifier_backend setting for config.yml and as
+a trained StringBinaryClassifier, that load_or_create_trained_instance restores without re-training when the same
+backend is configured.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from multiprocessing import Pool
+
+import numpy as np
+
+from . import config
+from .classifier_backends import ClassifierBackend, create_backend
+from .feature_matrix import NpyMatrixWriter, BLOCK_ROWS, iter_shuffled_batches, matrix_statistics, \
+    write_training_set
+from .model_benchmark import TRAINING_SET, TEST_SET, SINGLE_REPEAT, BATCH_REPEAT, load_matrix, median_seconds
+from .string_classifier import StringBinaryClassifier, N_FEATURES
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+DEFAULT_TIME_BUDGET = 120.0
+DEFAULT_MAX_EPOCHS = 200
+# epochs without improvement of the validation errors before stopping
+DEFAULT_PATIENCE = 10
+DEFAULT_BATCH_SIZE = 256
+VALIDATION_FRACTION = 0.1
+
+RESULT_FIELDS = ["name", "params", "validation_errors", "epochs", "stopped", "train_s", "single_latency_us",
+                 "batch_latency_us"]
+TEST_FIELDS = ["accuracy", "false_positives", "false_negatives", "errors"]
+
+
+def default_search_space():
+    """
+    :return: the (backend name, params) configurations to be tried
+    :rtype: list
+    """
+    space = []
+    for hidden_layer_sizes in [(16,), (32,), (100,), (50, 50), (100, 100), (100, 100, 100)]:
+        for learning_rate_init in [0.001, 0.01]:
+            space.append(("mlp_minibatch", {"hidden_layer_sizes": hidden_layer_sizes,
+                                            "learning_rate_init": learning_rate_init}))
+    for hidden_layer_sizes in [(50, 50), (100, 100)]:
+        for max_iter in [100, 1000]:
+            space.append(("mlp", {"hidden_layer_sizes": hidden_layer_sizes, "max_iter": max_iter}))
+    for degree in [2, 3]:
+        space.append(("logistic_regression", {"degree": degree}))
+    return space
+
+
+def load_search_space(file_path):
+    """
+    :param file_path: a JSON file, containing a list of {"name": backend name, "params": {...}} objects
+    :return: the configurations to be tried
+    :rtype: list
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        return [(item["name"], item.get("params") or {}) for item in json.load(f)]
+
+
+def prepare_matrices(training_set, work_dir, seed=0, block_rows=BLOCK_ROWS):
+    """
+    Standardizes the training set, splitting it into training and validation matrices, written to work_dir
+
+    :return: paths of the training and validation matrices, mean and standard deviation of the inputs
+    :rtype: (str, str, np.array, np.array)
+    """
+    matrix = np.load(training_set, mmap_mode="r")
+    input_mean, input_stdev = matrix_statistics(matrix, N_FEATURES)
+    rng = np.random.default_rng(seed)
+    paths = os.path.join(work_dir, "train.npy"), os.path.join(work_dir, "validation.npy")
+    with NpyMatrixWriter(paths[0], N_FEATURES + 1) as train, NpyMatrixWriter(paths[1], N_FEATURES + 1) as validation:
+        for start in range(0, len(matrix), block_rows):
+            block = np.array(matrix[start:start + block_rows])
+            block[:, 0:-1] = (block[:, 0:-1] - input_mean) / input_stdev
+            validating = rng.random(len(block)) < VALIDATION_FRACTION
+            train.write(block[~validating])
+            validation.write(block[validating])
+    return paths[0], paths[1], input_mean, input_stdev
+
+
+_matrices = None
+
+
+def _init_worker(train_path, validation_path):
+    # the matrices are memory-mapped once for each worker, and shared by all its configurations
+    global _matrices
+    _matrices = (np.load(train_path, mmap_mode="r"), np.load(validation_path, mmap_mode="r"))
+
+
+def _errors(backend, inputs, outputs):
+    return int((np.asarray(backend.predict(inputs)).astype(int) != outputs).sum())
+
+
+def evaluate_configuration(task):
+    """
+    Trains and measures a configuration, in a worker process
+
+    :param task: backend name, params, time budget, max epochs, patience, batch size, seed
+    :return: the measures, keyed as RESULT_FIELDS, and the trained backend, serialized
+    :rtype: (OrderedDict, bytes)
+    """
+    name, params, time_budget, max_epochs, patience, batch_size, seed = task
+    train, validation = _matrices
+    # models without a random_state draw from the global generator
+    np.random.seed(seed)
+    backend = create_backend(name, params)
+    validation_inputs, validation_outputs = np.asarray(validation[:, 0:-1]), validation[:, -1].astype(int)
+    start = time.perf_counter()
+    if hasattr(backend.model, "partial_fit"):
+        rng = np.random.default_rng(seed)
+        best_errors, best_epoch, best_model = None, 0, None
+        epochs = 0
+        stopped = "max_epochs"
+        while epochs < max_epochs:
+            for batch in iter_shuffled_batches(train, batch_size, rng):
+                backend.partial_train(batch[:, 0:-1], batch[:, -1])
+                if time.perf_counter() - start > time_budget:
+                    stopped = "time_budget"
+                    break
+            epochs += 1
+            errors = _errors(backend, validation_inputs, validation_outputs)
+            if best_errors is None or errors < best_errors:
+                best_errors, best_epoch, best_model = errors, epochs, backend.serialize()
+            if stopped == "time_budget":
+                break
+            if epochs - best_epoch >= patience:
+                stopped = "early_stopping"
+                break
+        # the model of the epoch with the fewest validation errors
+        backend = ClassifierBackend.deserialize(best_model)
+    else:
+        backend.train(np.asarray(train[:, 0:-1]), train[:, -1].astype(int))
+        epochs = 1
+        stopped = "fitted"
+    train_time = time.perf_counter() - start
+
+    result = OrderedDict()
+    result["name"] = name
+    result["params"] = backend.params
+    result["validation_errors"] = _errors(backend, validation_inputs, validation_outputs)
+    result["epochs"] = epochs
+    result["stopped"] = stopped
+    result["train_s"] = train_time
+    result["single_latency_us"] = median_seconds(lambda: backend.predict(validation_inputs[:1]), SINGLE_REPEAT) * 1e6
+    result["batch_latency_us"] = median_seconds(lambda: backend.predict(validation_inputs), BATCH_REPEAT) * 1e6 / len(
+        validation_inputs)
+    logging.info("{0} {1}: {2} validation errors, {3} epochs ({4}), {5:.1f}s".format(
+        name, backend.params, result["validation_errors"], epochs, stopped, train_time))
+    return result, backend.serialize()
+
+
+def build_training_set(file_path):
+    """
+    Builds the training set matrix from the learnsets of config.yml
+    """
+    write_training_set([os.path.join(__location__, path) for path in config.api_learnsets],
+                       [os.path.join(__location__, path) for path in config.text_learnsets], file_path)
+
+
+def run_search(search_space=None, training_set=TRAINING_SET, test_set=TEST_SET, workers=None,
+               time_budget=DEFAULT_TIME_BUDGET, max_epochs=DEFAULT_MAX_EPOCHS, patience=DEFAULT_PATIENCE,
+               batch_size=DEFAULT_BATCH_SIZE, seed=0):
+    """
+    :param search_space: the (backend name, params) configurations to be tried, defaults to default_search_space()
+    :param training_set: path of the training set matrix, built from the learnsets of config.yml if missing
+    :param test_set: path of the test set matrix, on which the best configuration alone is measured
+    :param workers: number of worker processes, defaults to the CPUs count
+    :param time_budget: maximum training seconds for each configuration trained in mini-batches
+    :param max_epochs: maximum epochs for each configuration trained in mini-batches
+    :param patience: epochs without improvement of the validation errors before stopping
+    :param batch_size: rows of each mini-batch
+    :param seed: seed of the validation split, of the shuffling and of the models
+    :return: the measures of each configuration (best first), the test measures of the best one, keyed as
+             TEST_FIELDS, and the best classifier, trained
+    :rtype: (list, OrderedDict, StringBinaryClassifier)
+    """
+    if search_space is None:
+        search_space = default_search_space()
+    for name, params in search_space:
+        # fail early on unknown backends and parameters
+        create_backend(name, params)
+    if not os.path.exists(training_set):
+        logging.info("Building the training set {0}...".format(training_set))
+        build_training_set(training_set)
+    work_dir = tempfile.mkdtemp(prefix="hyperparameter_search")
+    try:
+        train_path, validation_path, input_mean, input_stdev = prepare_matrices(training_set, work_dir, seed)
+        tasks = [(name, params, time_budget, max_epochs, patience, batch_size, seed) for name, params in search_space]
+        with Pool(workers or os.cpu_count(), initializer=_init_worker,
+                  initargs=(train_path, validation_path)) as pool:
+            outcomes = pool.map(evaluate_configuration, tasks)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    # the test set takes no part in the selection
+    outcomes.sort(key=lambda outcome: (outcome[0]["validation_errors"], outcome[0]["batch_latency_us"]))
+    classifier = StringBinaryClassifier(backend=ClassifierBackend.deserialize(outcomes[0][1]))
+    classifier.input_mean = input_mean
+    classifier.input_stdev = input_stdev
+    return [result for result, _ in outcomes], test_measures(classifier, test_set), classifier
+
+
+def test_measures(classifier, test_set=TEST_SET):
+    """
+    :param classifier: a trained classifier
+    :type classifier: StringBinaryClassifier
+    :param test_set: path of the test set matrix
+    :return: the measures of classifier on the test set, keyed as TEST_FIELDS
+    :rtype: OrderedDict
+    """
+    test_inputs, test_outputs = load_matrix(test_set)
+    predictions = np.asarray(classifier.predict(test_inputs)).astype(int)
+    result = OrderedDict()
+    result["accuracy"] = float((predictions == test_outputs).mean())
+    result["false_positives"] = int(((predictions == 1) & (test_outputs == 0)).sum())
+    result["false_negatives"] = int(((predictions == 0) & (test_outputs == 1)).sum())
+    result["errors"] = result["false_positives"] + result["false_negatives"]
+    return result
+
+
+def best_configuration(classifier):
+    """
+    :return: the classifier_backend setting of config.yml for the backend of classifier
+    :rtype: OrderedDict
+    """
+    description = classifier.backend.describe()
+    return OrderedDict([("classifier_backend", OrderedDict([
+        ("name", description["name"]),
+        ("params", {name: list(value) if isinstance(value, tuple) else value
+                    for name, value in description["params"].items()})]))])
+
+
+def dump_results(results, test_result, classifier, file_path):
+    """
+    Saves the search results, the best configuration and its test measures as JSON
+    """
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"results": results, "best": best_configuration(classifier), "test": test_result}, f, indent=2)
@@ -0,0 +1,217 @@
+"""
+Candidate extraction from source code: instead of whole lines, only the contents of string literals (and XML
+attribute values and texts) are submitted to the detector, together with their file, line and column.
+Each language family is lexed by a single regular expression whose alternatives are tried, left to right,
+at each position of the file, so that comments and literals are recognized in one pass: a quote inside
+a comment, or a comment marker inside a literal, never starts a token.
+"""
+import bisect
+import itertools
+import logging
+import os
+import re
+from xml.sax.saxutils import unescape as xml_unescape
+
+from . import config
+from .scan_job import list_input_files
+
+DEFAULT_CHUNK_SIZE = 10000
+
+C_LIKE = "c_like"
+PYTHON = "python"
+SMALI = "smali"
+XML = "xml"
+
+EXTENSIONS = {".java": C_LIKE, ".kt": C_LIKE, ".kts": C_LIKE, ".js": C_LIKE, ".mjs": C_LIKE, ".jsx": C_LIKE,
+              ".ts": C_LIKE, ".py": PYTHON, ".smali": SMALI, ".xml": XML}
+
+BACKSLASH_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "0": "\0"}
+BACKSLASH_ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+XML_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+
+
+def _unescape_backslashes(string):
+    if "\\" not in string:
+        return string
+
+    def replace(match):
+        escape = match.group(1)
+        if len(escape) == 5:
+            return chr(int(escape[1:], 16))
+        return BACKSLASH_ESCAPES.get(escape, escape)
+
+    return BACKSLASH_ESCAPE_RE.sub(replace, string)
+
+
+def _unescape_xml(string):
+    if "&" not in string:
+        return string
+    return xml_unescape(string, XML_ENTITIES)
+
+
+def _identity(string):
+    return string
+
+
+DOUBLE_QUOTED = r'"((?:[^"\\\n]|\\.)*)"'
+SINGLE_QUOTED = r"'((?:[^'\\\n]|\\.)*)'"
+TRIPLE_DOUBLE_QUOTED = r'"""((?:[^\\]|\\.)*?)"""'
+TRIPLE_SINGLE_QUOTED = r"'''((?:[^\\]|\\.)*?)'''"
+# Python raw strings (r"...", rb"...", Rb"...", fr"..."), not part of an identifier
+RAW_PREFIX = r"(?<!\w)(?:[rR][bBfF]?|[bBfF][rR])"
+
+# (pattern, unescape function) pairs; patterns without a capturing group (comments) are skipped.
+# Each literal pattern has exactly one group, holding the literal contents
+GRAMMARS = {
+    C_LIKE: [(r"//[^\n]*", None),
+             (r"/\*.*?\*/", None),
+             # Kotlin raw strings
+             (r'"""(.*?)"""', _identity),
+             (DOUBLE_QUOTED, _unescape_backslashes),
+             (SINGLE_QUOTED, _unescape_backslashes),
+             # JavaScript template literals
+             (r"`((?:[^`\\]|\\.)*)`", _unescape_backslashes)],
+    PYTHON: [(r"#[^\n]*", None),
+             # a backslash still keeps the next quote from closing a raw string, but is not unescaped
+             (RAW_PREFIX + TRIPLE_DOUBLE_QUOTED, _identity),
+             (RAW_PREFIX + TRIPLE_SINGLE_QUOTED, _identity),
+             (RAW_PREFIX + DOUBLE_QUOTED, _identity),
+             (RAW_PREFIX + SINGLE_QUOTED, _identity),
+             (TRIPLE_DOUBLE_QUOTED, _unescape_backslashes),
+             (TRIPLE_SINGLE_QUOTED, _unescape_backslashes),
+             (DOUBLE_QUOTED, _unescape_backslashes),
+             (SINGLE_QUOTED, _unescape_backslashes)],
+    SMALI: [(r"#[^\n]*", None),
+            (DOUBLE_QUOTED, _unescape_backslashes)],
+    XML: [(r"<!--.*?-->", None),
+          (r"<!\[CDATA\[(.*?)\]\]>", _identity),
+          (r'=\s*"([^"]*)"', _unescape_xml),
+          (r"=\s*'([^']*)'", _unescape_xml),
+          # text between tags; the lookahead leaves the "<" to the next token
+          (r">([^<]+)(?=<)", _unescape_xml)],
+}
+
+
+def _compile(grammar):
+    """
+    :return: the compiled lexer and the unescape function of each capturing group (by group number)
+    """
+    regex = re.compile("|".join("(?:{0})".format(pattern) for pattern, _ in grammar), re.DOTALL)
+    unescapers = {}
+    group = 1
+    for pattern, unescape in grammar:
+        if unescape is not None:
+            unescapers[group] = unescape
+        group += re.compile(pattern).groups
+    return regex, unescapers
+
+
+LEXERS = {family: _compile(grammar) for family, grammar in GRAMMARS.items()}
+
+
+class Literal(object):
+    def __init__(self, path, line, column, value):
+        """
+        :param path: path of the source file
+        :param line: line where the literal contents start, 1-based
+        :param column: column where the literal contents start, 1-based
+        :param value: the (unescaped) literal contents
+        """
+        self.path = path
+        self.line = line
+        self.column = column
+        self.value = value
+
+    def __str__(self):
+        return "{0}:{1}:{2}: {3}".format(self.path, self.line, self.column, self.value)
+
+
+def language_of(path):
+    """
+    :return: the language family of a source file, None if not supported
+    :rtype: str
+    """
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def extract_literals(text, family, min_length=None):
+    """
+    Lexes the string literals of a source file
+
+    :param text: the source code
+    :param family: the language family, one of the GRAMMARS keys
+    :param min_length: shorter literals are skipped; defaults to the min_key_length of config.yml
+    :return: a generator over (line, column, value) tuples, in source order
+    """
+    if min_length is None:
+        min_length = config.min_key_length
+    regex, unescapers = LEXERS[family]
+    newlines = None
+    for match in regex.finditer(text):
+        group = match.lastindex
+        if group is None:
+            # a comment
+            continue
+        start, end = match.span(group)
+        value = text[start:end]
+        if family == XML:
+            # XML texts are usually indented
+            stripped = value.lstrip()
+            start += len(value) - len(stripped)
+            value = stripped.rstrip()
+        if end - start < min_length:
+            continue
+        value = unescapers[group](value)
+        if len(value) < min_length:
+            continue
+        if newlines is None:
+            newlines = [m.start() for m in re.finditer("\n", text)]
+        line = bisect.bisect_left(newlines, start)
+        line_start = newlines[line - 1] + 1 if line else 0
+        yield line + 1, start - line_start + 1, value
+
+
+def iter_file_literals(path, family=None, min_length=None):
+    """
+    :param path: path of the source file
+    :param family: the language family, guessed from the file extension if not specified
+    :param min_length: shorter literals are skipped; defaults to the min_key_length of config.yml
+    :return: a generator over the Literal objects of the file
+    """
+    family = family or language_of(path)
+    if family is None:
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    for line, column, value in extract_literals(text, family, min_length):
+        yield Literal(path, line, column, value)
+
+
+def scan_sources(inputs, min_length=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Detects API keys inside the string literals of source files
+
+    :param inputs: paths of files and/or directories, the latter are walked recursively;
+                   files of unsupported languages are skipped
+    :param min_length: shorter literals are skipped; defaults to the min_key_length of config.yml
+    :param chunk_size: number of literals submitted to the detector at once
+    :return: a generator over the Literal objects that are API keys
+    """
+    # imported here, so that lexing alone doesn't need the models to be loaded
+    from .detector import detect_api_keys
+
+    def literals():
+        for path in list_input_files(inputs):
+            if language_of(path) is None:
+                logging.debug("Skipping {0}: unsupported language".format(path))
+                continue
+            yield from iter_file_literals(path, min_length=min_length)
+
+    iterator = literals()
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        for literal, is_api_key in zip(chunk, detect_api_keys([literal.value for literal in chunk])):
+            if is_api_key:
+                yield literal
@@ -0,0 +1,184 @@
+"""
+Accuracy versus inference cost benchmark of candidate classifiers for the string features.
+Each candidate is trained on the training set matrix, then measured on the test set matrix: accuracy,
+false positives/negatives, size of the pickled model, time needed to unpickle it and inference latency,
+both for a single string and (per string) for a whole batch. Candidates that are not worse than another one
+in every respect (errors, single-string and batched latency) make up the Pareto front.
+"""
+import csv
+import json
+import logging
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import PolynomialFeatures
+from sklearn.tree import DecisionTreeClassifier
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+TRAINING_SET = os.path.join(__location__, "datasets", "classifier_learnset.npy")
+TEST_SET = os.path.join(__location__, "datasets", "classifier_testset_extended.npy")
+# timing repetitions; the median is reported
+SINGLE_REPEAT = 200
+BATCH_REPEAT = 5
+LOAD_REPEAT = 20
+
+RESULT_FIELDS = ["name", "accuracy", "false_positives", "false_negatives", "errors", "size_bytes", "load_ms",
+                 "single_latency_us", "batch_latency_us", "train_s", "pareto"]
+
+
+def default_candidates():
+    """
+    :return: name => factory of a not yet trained classifier, for each candidate
+    :rtype: OrderedDict
+    """
+    candidates = OrderedDict()
+    for hidden_layer_sizes in [(8,), (16,), (32,), (16, 16), (50, 50), (100, 100)]:
+        candidates["MLP {0}".format(hidden_layer_sizes)] = \
+            lambda sizes=hidden_layer_sizes: MLPClassifier(hidden_layer_sizes=sizes, solver='lbfgs', max_iter=1000,
+                                                           random_state=0)
+    for degree in [1, 2, 3]:
+        candidates["Logistic Regression (degree {0})".format(degree)] = \
+            lambda degree=degree: make_pipeline(PolynomialFeatures(degree), LogisticRegression(C=100.0, max_iter=1000))
+    for max_depth in [5, 10]:
+        candidates["Decision Tree (depth {0})".format(max_depth)] = \
+            lambda depth=max_depth: DecisionTreeClassifier(max_depth=depth, random_state=0)
+    for n_estimators, max_depth in [(10, 5), (50, 10)]:
+        candidates["Random Forest ({0} trees, depth {1})".format(n_estimators, max_depth)] = \
+            lambda n=n_estimators, depth=max_depth: RandomForestClassifier(n_estimators=n, max_depth=depth,
+                                                                           random_state=0)
+    candidates["Gradient Boosting (50 trees, depth 3)"] = \
+        lambda: GradientBoostingClassifier(n_estimators=50, max_depth=3, random_state=0)
+    candidates["Nearest Neighbors (3)"] = lambda: KNeighborsClassifier(3)
+    return candidates
+
+
+def load_matrix(file_path):
+    """
+    :param file_path: a .npy matrix where each row contains the features of a string and its class
+    :return: inputs and (integer) classes
+    :rtype: (np.array, np.array)
+    """
+    matrix = np.load(file_path)
+    return matrix[:, 0:-1], matrix[:, -1].astype(int)
+
+
+def median_seconds(function, repeat):
+    """
+    :param function: the function to be timed, without arguments
+    :param repeat: number of calls
+    :return: the median duration of a call, in seconds
+    :rtype: float
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def measure(name, model, train_inputs, train_outputs, test_inputs, test_outputs):
+    """
+    Trains a candidate and measures it
+
+    :return: the measures, keyed as RESULT_FIELDS
+    :rtype: OrderedDict
+    """
+    logging.info("Benchmarking {0}...".format(name))
+    start = time.perf_counter()
+    model.fit(train_inputs, train_outputs)
+    train_time = time.perf_counter() - start
+
+    predictions = model.predict(test_inputs).astype(int)
+    false_positives = int(((predictions == 1) & (test_outputs == 0)).sum())
+    false_negatives = int(((predictions == 0) & (test_outputs == 1)).sum())
+    dump = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    single_input = test_inputs[:1]
+    result = OrderedDict()
+    result["name"] = name
+    result["accuracy"] = float((predictions == test_outputs).mean())
+    result["false_positives"] = false_positives
+    result["false_negatives"] = false_negatives
+    result["errors"] = false_positives + false_negatives
+    result["size_bytes"] = len(dump)
+    result["load_ms"] = median_seconds(lambda: pickle.loads(dump), LOAD_REPEAT) * 1e3
+    result["single_latency_us"] = median_seconds(lambda: model.predict(single_input), SINGLE_REPEAT) * 1e6
+    result["batch_latency_us"] = median_seconds(lambda: model.predict(test_inputs), BATCH_REPEAT) * 1e6 / len(
+        test_inputs)
+    result["train_s"] = train_time
+    result["pareto"] = False
+    return result
+
+
+def pareto_front(results, objectives=("errors", "single_latency_us", "batch_latency_us")):
+    """
+    Marks the results that are not dominated by any other one, i.e. such that no other result is at least as good
+    in every objective and better in one of them (lower is better, for each objective)
+
+    :param results: list of results, as returned by measure
+    :param objectives: the keys of the results to be minimized
+    :return: the non-dominated results
+    :rtype: list
+    """
+    front = []
+    for result in results:
+        values = [result[objective] for objective in objectives]
+        dominated = False
+        for other in results:
+            other_values = [other[objective] for objective in objectives]
+            if all(o <= v for o, v in zip(other_values, values)) and any(o < v for o, v in zip(other_values, values)):
+                dominated = True
+                break
+        result["pareto"] = not dominated
+        if not dominated:
+            front.append(result)
+    return front
+
+
+def run_benchmark(candidates=None, training_set=TRAINING_SET, test_set=TEST_SET):
+    """
+    :param candidates: name => factory of a not yet trained classifier; defaults to default_candidates()
+    :param training_set: path of the training set matrix
+    :param test_set: path of the test set matrix
+    :return: the measures of each candidate, with the "pareto" field set
+    :rtype: list
+    """
+    if candidates is None:
+        candidates = default_candidates()
+    train_inputs, train_outputs = load_matrix(training_set)
+    test_inputs, test_outputs = load_matrix(test_set)
+    # the same standardization done by StringBinaryClassifier, whose cost is the same for every candidate
+    input_mean = train_inputs.mean(axis=0)
+    input_stdev = train_inputs.std(axis=0)
+    train_inputs = (train_inputs - input_mean) / input_stdev
+    test_inputs = (test_inputs - input_mean) / input_stdev
+
+    results = [measure(name, factory(), train_inputs, train_outputs, test_inputs, test_outputs)
+               for name, factory in candidates.items()]
+    front = pareto_front(results)
+    logging.info("Pareto front: {0}".format(", ".join(result["name"] for result in front)))
+    return results
+
+
+def dump_results(results, file_path):
+    """
+    Saves the benchmark results as CSV if file_path ends with .csv, as JSON otherwise
+    """
+    if file_path.lower().endswith(".csv"):
+        with open(file_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+        return
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"results": results,
+                   "pareto_front": [result["name"] for result in results if result["pareto"]]}, f, indent=2)
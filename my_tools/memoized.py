@@ -1,5 +1,5 @@
-import collections
 import functools
+import threading
 
 
 class Memoized(object):
@@ -9,23 +9,29 @@ class Memoized(object):
     Decorator. Caches a function's return value each time it is called.
     If called later with the same arguments, the cached value is returned
     (not reevaluated).
+    Thread-safe: cache hits don't take any lock, while misses are computed
+    (once) while holding a reentrant lock.
     """
 
     def __init__(self, func):
         self.func = func
         self.cache = {}
+        self.lock = threading.RLock()
 
     def __call__(self, *args):
-        if not isinstance(args, collections.Hashable):
+        try:
+            return self.cache[args]
+        except KeyError:
+            pass
+        except TypeError:
             # uncacheable. a list, for instance.
             # better to not cache than blow up.
             return self.func(*args)
-        if args in self.cache:
+        with self.lock:
+            # another thread may have computed the value while we were waiting
+            if args not in self.cache:
+                self.cache[args] = self.func(*args)
             return self.cache[args]
-        else:
-            value = self.func(*args)
-            self.cache[args] = value
-            return value
 
     def __repr__(self):
         """Return the function's docstring."""
@@ -0,0 +1,206 @@
+"""
+Structured output of detection results: JSON Lines, CSV or a compact binary columnar file.
+Writers receive whole batches of results (verdicts, classifier scores, source and offset of each string) and
+format each batch into a single block, that is written at once to a large buffered file, instead of one line
+at a time.
+The columnar file starts with COLUMNAR_MAGIC and a JSON header (length prefixed) that describes the columns;
+then, for each batch, the number of rows (uint64) followed by each column, as a little-endian array. It can be
+loaded with read_columnar without parsing any text.
+"""
+import csv
+import io
+import json
+import struct
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from .string_batch import ENCODING
+
+OUTPUT_FORMATS = ("lines", "jsonl", "csv", "columnar")
+BUFFER_SIZE = 1 << 20
+RECORD_FIELDS = ["index", "source", "offset", "score", "api_key", "string"]
+
+COLUMNAR_MAGIC = b"AKDCOLS1"
+COLUMNS = [("index", "<u8"), ("score", "<f4"), ("verdict", "u1"), ("source", "<u4"), ("offset", "<i8")]
+_LENGTH = struct.Struct("<I")
+_ROWS = struct.Struct("<Q")
+
+
+class ResultsWriter(object):
+    """
+    Base class of the writers. Results are written with write_batch, then close flushes the file
+    (and closes it, unless it is the standard output)
+    """
+    name = None
+    binary = False
+
+    def __init__(self, file_path=None, sources=None):
+        """
+        :param file_path: where to write the results; None for the standard output
+        :param sources: the names of the sources (e.g. input files), by source id
+        """
+        self.sources = list(sources) if sources is not None else ["<stdin>"]
+        self.rows = 0
+        if file_path is None:
+            if self.binary:
+                raise ValueError("The {0} format needs an output file".format(self.name))
+            # anything already printed comes first
+            sys.stdout.flush()
+            self.file = io.TextIOWrapper(sys.stdout.buffer, encoding=ENCODING, newline="", write_through=False)
+            self.owned = False
+        else:
+            self.file = open(file_path, "wb" if self.binary else "w", buffering=BUFFER_SIZE,
+                             **({} if self.binary else {"encoding": ENCODING, "newline": ""}))
+            self.owned = True
+        self.write_header()
+
+    def write_header(self):
+        pass
+
+    def write_batch(self, batch, detection, scores, offsets=None, source_id=0, first_index=None, indices=None):
+        """
+        :param batch: the analyzed strings
+        :type batch: StringBatch
+        :param detection: the verdict of each string of the batch
+        :param scores: the classifier score of each string of the batch
+        :param offsets: the byte offset of each string inside its source, None if unknown (written as -1)
+        :param source_id: the source of the strings, an index of sources
+        :param first_index: the index of the first string of the batch, i.e. the number of strings written before,
+                            by default
+        :param indices: the indices of the strings of the batch to be written, None for all of them
+        """
+        if first_index is None:
+            first_index = self.rows
+        if indices is None:
+            indices = np.arange(len(batch))
+        indices = np.asarray(indices, dtype=np.int64)
+        offsets = np.full(len(batch), -1, dtype=np.int64) if offsets is None else np.asarray(offsets)
+        self.write_rows(batch, indices, first_index + indices, np.asarray(scores)[indices],
+                        np.asarray(detection)[indices], source_id, offsets[indices])
+        self.rows = max(self.rows, first_index + len(batch))
+
+    def write_rows(self, batch, indices, numbers, scores, verdicts, source_id, offsets):
+        raise NotImplementedError
+
+    def close(self):
+        self.file.flush()
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.detach()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LinesWriter(ResultsWriter):
+    """
+    The historical output: one string (or one verdict) for each line
+    """
+    name = "lines"
+
+    def __init__(self, file_path=None, sources=None, verdicts=True):
+        """
+        :param verdicts: if True, writes the verdict of each string, the string itself otherwise
+        """
+        self.verdicts = verdicts
+        super(LinesWriter, self).__init__(file_path, sources)
+
+    def write_rows(self, batch, indices, numbers, scores, verdicts, source_id, offsets):
+        values = verdicts.tolist() if self.verdicts else batch.iter_strings(indices)
+        self.file.write("".join("{0}\n".format(value) for value in values))
+
+
+class JsonLinesWriter(ResultsWriter):
+    name = "jsonl"
+
+    def write_rows(self, batch, indices, numbers, scores, verdicts, source_id, offsets):
+        source = json.dumps(self.sources[source_id])
+        lines = ['{{"index": {0}, "source": {1}, "offset": {2}, "score": {3!r}, "api_key": {4}, '
+                 '"string": {5}}}\n'.format(number, source, offset, score, "true" if verdict else "false",
+                                             json.dumps(string))
+                 for number, offset, score, verdict, string in zip(numbers.tolist(), offsets.tolist(),
+                                                                    scores.tolist(), verdicts.tolist(),
+                                                                    batch.iter_strings(indices))]
+        self.file.write("".join(lines))
+
+
+class CsvWriter(ResultsWriter):
+    name = "csv"
+
+    def write_header(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(RECORD_FIELDS)
+
+    def write_rows(self, batch, indices, numbers, scores, verdicts, source_id, offsets):
+        source = self.sources[source_id]
+        block = io.StringIO()
+        csv.writer(block).writerows(zip(numbers.tolist(), [source] * len(indices), offsets.tolist(),
+                                        scores.tolist(), verdicts.tolist(), batch.iter_strings(indices)))
+        self.file.write(block.getvalue())
+
+
+class ColumnarWriter(ResultsWriter):
+    name = "columnar"
+    binary = True
+
+    def write_header(self):
+        header = json.dumps({"columns": COLUMNS, "sources": self.sources}).encode(ENCODING)
+        self.file.write(COLUMNAR_MAGIC + _LENGTH.pack(len(header)) + header)
+
+    def write_rows(self, batch, indices, numbers, scores, verdicts, source_id, offsets):
+        columns = {"index": numbers, "score": scores, "verdict": verdicts, "source": np.full(len(indices), source_id),
+                   "offset": offsets}
+        block = [_ROWS.pack(len(indices))]
+        block.extend(np.ascontiguousarray(columns[name], dtype=dtype).tobytes() for name, dtype in COLUMNS)
+        self.file.write(b"".join(block))
+
+
+WRITERS = {writer.name: writer for writer in [LinesWriter, JsonLinesWriter, CsvWriter, ColumnarWriter]}
+
+
+def create_writer(output_format, file_path=None, sources=None, **kwargs):
+    """
+    :param output_format: one of OUTPUT_FORMATS
+    :param file_path: where to write the results; None for the standard output
+    :param sources: the names of the sources (e.g. input files), by source id
+    :rtype: ResultsWriter
+    """
+    if output_format not in WRITERS:
+        raise ValueError("Unknown output format '{0}', available ones are: {1}".format(
+            output_format, ", ".join(OUTPUT_FORMATS)))
+    return WRITERS[output_format](file_path, sources, **kwargs)
+
+
+def read_columnar(file_path):
+    """
+    Loads a file written by ColumnarWriter
+
+    :param file_path: path of the file
+    :return: the names of the sources and column name => array, for each one of COLUMNS
+    :rtype: (list, OrderedDict)
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if not data.startswith(COLUMNAR_MAGIC):
+        raise ValueError("{0} is not a columnar results file".format(file_path))
+    position = len(COLUMNAR_MAGIC)
+    (header_length,) = _LENGTH.unpack_from(data, position)
+    position += _LENGTH.size
+    header = json.loads(data[position:position + header_length].decode(ENCODING))
+    position += header_length
+    columns = [(name, np.dtype(dtype)) for name, dtype in header["columns"]]
+    blocks = OrderedDict((name, []) for name, _ in columns)
+    while position < len(data):
+        (rows,) = _ROWS.unpack_from(data, position)
+        position += _ROWS.size
+        for name, dtype in columns:
+            blocks[name].append(np.frombuffer(data, dtype=dtype, count=rows, offset=position))
+            position += rows * dtype.itemsize
+    return header["sources"], OrderedDict((name, np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype))
+                                          for (name, arrays), (_, dtype) in zip(blocks.items(), columns))
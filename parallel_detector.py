@@ -0,0 +1,121 @@
+"""
+Thread-parallel version of the detector API.
+A batch is packed once, then its strings are split into chunks that are detected concurrently by the threads of a
+ThreadPoolExecutor. Every thread shares the same models: the classifier, the gibberish detector, the dictionary
+and the filters are loaded once (module imports are serialized by the import lock) and are only read afterwards;
+the only caches (charset.get_char_distance_distribution, memoized) are filled under a lock.
+On free-threaded CPython builds the chunks run in parallel; on regular CPython, threads overlap inside the
+vectorized features kernel and the classifier, where NumPy releases the GIL.
+"""
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .detector import detect_api_keys_batch
+from .string_batch import StringBatch
+
+DEFAULT_CHUNK_SIZE = 4096
+DEFAULT_THREAD_COUNTS = (1, 2, 4, 8)
+
+
+def gil_enabled():
+    """
+    :return: False if running on a free-threaded CPython build with the GIL disabled
+    :rtype: bool
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled is not None else True
+
+
+def detect_api_keys_batch_parallel(batch, executor=None, max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Thread-parallel version of detector.detect_api_keys_batch
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :param executor: the ThreadPoolExecutor where detection runs; if None, one is created for the call
+    :param max_workers: number of threads of the executor created for the call, defaults to the CPUs count
+    :param chunk_size: number of strings detected by each executor job
+    :return: a boolean mask, True for each string of the batch that is an API key
+    :rtype: np.array
+    """
+    detection = np.zeros(len(batch), dtype=bool)
+    chunks = [(start, min(start + chunk_size, len(batch))) for start in range(0, len(batch), chunk_size)]
+
+    def detect_chunk(chunk):
+        # chunks are disjoint, so each thread writes its own part of the mask
+        start, end = chunk
+        detection[start:end] = detect_api_keys_batch(batch.slice(start, end))
+
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as own_executor:
+            list(own_executor.map(detect_chunk, chunks))
+    else:
+        list(executor.map(detect_chunk, chunks))
+    return detection
+
+
+def detect_api_keys_parallel(strings, executor=None, max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Thread-parallel version of detector.detect_api_keys
+
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param executor: the ThreadPoolExecutor where detection runs; if None, one is created for the call
+    :param max_workers: number of threads of the executor created for the call, defaults to the CPUs count
+    :param chunk_size: number of strings detected by each executor job
+    :return: a list of booleans, True for each string that is an API key
+    :rtype: list
+    """
+    return detect_api_keys_batch_parallel(StringBatch.from_strings(strings), executor, max_workers,
+                                          chunk_size).tolist()
+
+
+def filter_api_keys_parallel(strings, executor=None, max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Thread-parallel version of detector.filter_api_keys
+
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param executor: the ThreadPoolExecutor where detection runs; if None, one is created for the call
+    :param max_workers: number of threads of the executor created for the call, defaults to the CPUs count
+    :param chunk_size: number of strings detected by each executor job
+    :return: the strings that are API keys, decoded
+    :rtype: list
+    """
+    batch = StringBatch.from_strings(strings)
+    return batch.select(detect_api_keys_batch_parallel(batch, executor, max_workers, chunk_size))
+
+
+def benchmark_threads(strings, thread_counts=DEFAULT_THREAD_COUNTS, chunk_size=DEFAULT_CHUNK_SIZE, repeat=3):
+    """
+    Measures how detect_api_keys_batch_parallel scales with the number of threads
+
+    :param strings: the strings to be analyzed
+    :param thread_counts: the numbers of threads to be measured
+    :param chunk_size: number of strings detected by each executor job
+    :param repeat: runs for each number of threads; the fastest one is reported
+    :return: interpreter information and, for each number of threads, throughput and speedup
+    :rtype: OrderedDict
+    """
+    batch = StringBatch.from_strings(strings)
+    # warm up the caches, so that the first measure is not penalized
+    detect_api_keys_batch(batch.slice(0, min(chunk_size, len(batch))))
+    report = OrderedDict([("python", sys.version), ("gil_enabled", gil_enabled()), ("cpus", os.cpu_count()),
+                          ("strings", len(batch)), ("chunk_size", chunk_size), ("results", [])])
+    for threads in thread_counts:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                detect_api_keys_batch_parallel(batch, executor, chunk_size=chunk_size)
+                timings.append(time.perf_counter() - start)
+        elapsed = min(timings)
+        report["results"].append(OrderedDict([("threads", threads), ("seconds", elapsed),
+                                              ("strings_per_second", len(batch) / elapsed)]))
+    baseline = report["results"][0]["seconds"] if report["results"] else None
+    for result in report["results"]:
+        result["speedup"] = baseline / result["seconds"]
+    return report
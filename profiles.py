@@ -0,0 +1,147 @@
+"""
+Detection profiles: per-team filter settings and decision thresholds on top of the shared models.
+The classifier, the gibberish detector and the dictionary are loaded once, by their singletons, and never
+modified while detecting; a profile only holds what differs between teams (length limits, word content
+threshold, blacklists and classifier decision threshold), so that many profiles can live in the same process.
+A batch can be evaluated against several profiles at once: the features of each string are computed, and
+classified, only once.
+"""
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from . import config
+from .classifier_singleton import classifier
+from .string_batch import StringBatch
+from .string_classifier import calculate_features_batch
+from .strings_filter import StringsFilter
+from .strings_filter_singleton import s_filter
+from .words_finder_singleton import finder
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+DEFAULT_PROFILE = "default"
+DEFAULT_DECISION_THRESHOLD = 0.5
+PROFILE_SETTINGS = ("min_key_length", "max_key_length", "word_content_threshold", "blacklists", "decision_threshold")
+
+
+class DetectionProfile(object):
+    """
+    Read-only set of filter settings and decision threshold
+    """
+
+    def __init__(self, name, strings_filter, decision_threshold=DEFAULT_DECISION_THRESHOLD):
+        """
+        :param name: the profile name
+        :param strings_filter: the pre and post filters of the profile
+        :type strings_filter: StringsFilter
+        :param decision_threshold: strings whose classifier probability is above it are API keys
+        """
+        self._name = name
+        self._filter = strings_filter
+        self._decision_threshold = float(decision_threshold)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def strings_filter(self):
+        return self._filter
+
+    @property
+    def decision_threshold(self):
+        return self._decision_threshold
+
+    def __repr__(self):
+        return "DetectionProfile({0!r}, min_key_length={1}, max_key_length={2}, word_content_threshold={3}, " \
+               "decision_threshold={4})".format(self.name, self._filter.min_key_length, self._filter.max_key_length,
+                                                self._filter.word_content_threshold, self.decision_threshold)
+
+
+def default_profile():
+    """
+    :return: the profile of the global settings of config.yml (or of the deployment bundle)
+    :rtype: DetectionProfile
+    """
+    return DetectionProfile(DEFAULT_PROFILE, s_filter)
+
+
+def create_profile(name, settings):
+    """
+    :param name: the profile name
+    :param settings: dict of PROFILE_SETTINGS; the missing ones are taken from the default profile.
+                     Blacklists are paths relative to the package directory
+    :rtype: DetectionProfile
+    """
+    unknown = set(settings) - set(PROFILE_SETTINGS)
+    if unknown:
+        raise ValueError("Unknown settings of profile '{0}': {1}".format(name, ", ".join(sorted(unknown))))
+    if "blacklists" in settings:
+        strings_filter = StringsFilter(settings.get("min_key_length", s_filter.min_key_length),
+                                       settings.get("max_key_length", s_filter.max_key_length),
+                                       settings.get("word_content_threshold", s_filter.word_content_threshold),
+                                       [os.path.join(__location__, path) for path in settings["blacklists"] or []])
+    else:
+        # the blacklist of the default profile (or its index, if loaded from the bundle) is shared
+        strings_filter = s_filter.derive(**{key: value for key, value in settings.items()
+                                            if key != "decision_threshold"})
+    return DetectionProfile(name, strings_filter, settings.get("decision_threshold", DEFAULT_DECISION_THRESHOLD))
+
+
+def load_profiles():
+    """
+    :return: name => DetectionProfile, for the default profile and for each one of the profiles key of config.yml
+    :rtype: OrderedDict
+    """
+    profiles = OrderedDict([(DEFAULT_PROFILE, default_profile())])
+    for name, settings in (getattr(config, "profiles", None) or {}).items():
+        profiles[name] = create_profile(name, settings or {})
+    return profiles
+
+
+def detect_api_keys_profiles_batch(batch, profiles):
+    """
+    Detects API keys inside a batch of strings, for each profile. The features of the strings that pass
+    the pre-filter of at least one profile are computed and classified once; the words percentage of the
+    strings that are positive for at least one profile is computed once as well
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :param profiles: an iterable of DetectionProfile objects
+    :return: profile name => boolean mask, True for each string of the batch that is an API key
+    :rtype: OrderedDict
+    """
+    profiles = list(profiles)
+    candidates = [profile.strings_filter.pre_filter_batch(batch) for profile in profiles]
+    detections = OrderedDict((profile.name, np.zeros(len(batch), dtype=bool)) for profile in profiles)
+    indices = np.unique(np.concatenate(candidates)) if candidates else np.zeros(0, dtype=np.int64)
+    inputs, valid = calculate_features_batch(batch, indices)
+    indices = indices[valid]
+    if not len(indices):
+        return detections
+    probabilities = np.full(len(batch), -1.0)
+    probabilities[indices] = classifier.predict_proba(inputs)
+
+    positives = [profile_indices[probabilities[profile_indices] > profile.decision_threshold]
+                 for profile, profile_indices in zip(profiles, candidates)]
+    words_percentages = np.zeros(len(batch))
+    positive_indices = np.unique(np.concatenate(positives))
+    for i, string in zip(positive_indices.tolist(), batch.iter_candidates(positive_indices)):
+        words_percentages[i] = finder.get_words_percentage(string)
+    for profile, profile_positives in zip(profiles, positives):
+        keep = words_percentages[profile_positives] < profile.strings_filter.word_content_threshold
+        detections[profile.name][profile_positives[keep]] = True
+    return detections
+
+
+def detect_api_keys_profiles(strings, profiles):
+    """
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param profiles: an iterable of DetectionProfile objects
+    :return: profile name => list of booleans, True for each string that is an API key
+    :rtype: OrderedDict
+    """
+    detections = detect_api_keys_profiles_batch(StringBatch.from_strings(strings), profiles)
+    return OrderedDict((name, detection.tolist()) for name, detection in detections.items())
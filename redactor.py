@@ -0,0 +1,272 @@
+"""
+Streaming redaction of API keys, e.g. from logs and exported datasets before they are shipped elsewhere.
+The input stream is read in blocks of complete lines (as much as is available, up to a maximum size: a slow stream,
+such as a pipe from a log shipper, is redacted as soon as its lines arrive, a fast one in large blocks). The tokens
+of each block (see git_scan.TOKEN_RE) are deduplicated and detected at once, as a single StringBatch; the block is
+then written back with every API key replaced by a mask, optionally followed by a hash of the key, so that the
+occurrences of the same key can be correlated without revealing it.
+Blocks are redacted by a pool of threads, with a bounded number of blocks in flight, and written in input order by
+a writer thread as soon as they are redacted, while the next lines are awaited: memory is bounded by the block size
+and by the number of threads, whatever the length of the stream.
+"""
+import hashlib
+import hmac
+import io
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .archive_scanner import BYTES_TOKEN_RE
+from .scan_job import MAX_LINE_BYTES
+from .string_batch import StringBatch
+
+DEFAULT_MASK = "[REDACTED]"
+# bytes read at once: blocks hold the complete lines of a read, so they are at most this long
+DEFAULT_BLOCK_BYTES = 1 << 20
+# hexadecimal digits of the hash suffix
+HASH_DIGITS = 12
+HASH_SEPARATOR = b"#"
+DEFAULT_BENCHMARK_LINES = 500000
+DEFAULT_KEY_FRACTION = 0.01
+DEFAULT_THREAD_COUNTS = (1, 2, 4)
+
+
+class RedactionStats(object):
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+        self.candidates = 0
+        self.keys = 0
+        self.elapsed = 0.0
+
+    def add(self, other):
+        self.bytes += other.bytes
+        self.lines += other.lines
+        self.candidates += other.candidates
+        self.keys += other.keys
+
+    def __str__(self):
+        return "{0} lines ({1} bytes), {2} candidates, {3} API keys redacted in {4:.2f}s".format(
+            self.lines, self.bytes, self.candidates, self.keys, self.elapsed)
+
+
+class Redactor(object):
+    def __init__(self, mask=DEFAULT_MASK, hash_suffix=False, hash_key=None, min_length=None):
+        """
+        :param mask: what API keys are replaced with
+        :param hash_suffix: if True, the mask is followed by HASH_SEPARATOR and a hash of the key
+        :param hash_key: if specified, the hash is a HMAC with this key, so that it can't be verified against a
+                         guessed key by whoever doesn't know it
+        :param min_length: shorter tokens are not detected; defaults to the min_key_length of config.yml
+        """
+        self.mask = mask.encode("utf-8") if isinstance(mask, str) else bytes(mask)
+        self.hash_suffix = hash_suffix
+        self.hash_key = hash_key.encode("utf-8") if isinstance(hash_key, str) else hash_key
+        self.min_length = config.min_key_length if min_length is None else min_length
+
+    def replacement(self, key):
+        """
+        :param key: an API key, as bytes
+        :return: what key is replaced with
+        :rtype: bytes
+        """
+        if not self.hash_suffix:
+            return self.mask
+        if self.hash_key:
+            digest = hmac.new(self.hash_key, key, hashlib.sha256).hexdigest()
+        else:
+            digest = hashlib.sha256(key).hexdigest()
+        return self.mask + HASH_SEPARATOR + digest[:HASH_DIGITS].encode("ascii")
+
+    def redact(self, block):
+        """
+        :param block: complete lines, as bytes
+        :return: block with its API keys replaced, and the statistics of the block
+        :rtype: (bytes, RedactionStats)
+        """
+        from .detector import detect_api_keys_batch
+        stats = RedactionStats()
+        stats.bytes = len(block)
+        stats.lines = block.count(b"\n") + (1 if block and not block.endswith(b"\n") else 0)
+        matches = [match for match in BYTES_TOKEN_RE.finditer(block) if match.end() - match.start() >= self.min_length]
+        stats.candidates = len(matches)
+        if not matches:
+            return block, stats
+        # logs repeat the same tokens over and over: each one is detected once
+        tokens = list(OrderedDict.fromkeys(match.group() for match in matches))
+        detection = detect_api_keys_batch(StringBatch.from_strings(tokens))
+        replacements = {token: self.replacement(token) for token, is_api_key in zip(tokens, detection) if is_api_key}
+        if not replacements:
+            return block, stats
+        pieces = []
+        position = 0
+        for match in matches:
+            replacement = replacements.get(match.group())
+            if replacement is not None:
+                pieces.append(block[position:match.start()])
+                pieces.append(replacement)
+                position = match.end()
+                stats.keys += 1
+        pieces.append(block[position:])
+        return b"".join(pieces), stats
+
+
+def iter_line_blocks(stream, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    :param stream: a binary stream
+    :param block_bytes: bytes read at once
+    :return: a generator over blocks of complete lines, as bytes; the last one may not end with a line terminator,
+             and lines longer than MAX_LINE_BYTES are split
+    """
+    # read1 returns what is available, instead of waiting for block_bytes
+    read = stream.read1 if hasattr(stream, "read1") else stream.read
+    rest = b""
+    while True:
+        data = read(block_bytes)
+        if not data:
+            break
+        if rest:
+            data = rest + data
+        end = data.rfind(b"\n") + 1
+        if not end and len(data) < MAX_LINE_BYTES:
+            rest = data
+            continue
+        if not end:
+            end = len(data)
+        rest = data[end:]
+        yield data[:end]
+    if rest:
+        yield rest
+
+
+def redact_stream(input_stream, output_stream, redactor=None, threads=1, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Copies input_stream to output_stream, replacing the API keys
+
+    :param input_stream: a binary stream
+    :param output_stream: a binary stream, flushed after each block
+    :param redactor: how API keys are replaced, defaults to Redactor()
+    :type redactor: Redactor
+    :param threads: number of threads redacting blocks concurrently
+    :param block_bytes: bytes read at once
+    :return: the statistics of the stream
+    :rtype: RedactionStats
+    """
+    if redactor is None:
+        redactor = Redactor()
+    stats = RedactionStats()
+    start = time.perf_counter()
+    blocks = iter_line_blocks(input_stream, block_bytes)
+    # the futures of the blocks, in input order: their number is bounded, and so is memory
+    futures = queue.Queue(maxsize=2 * threads)
+    errors = []
+    writer = threading.Thread(target=_write_in_order, args=(futures, output_stream, stats, errors))
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for block in blocks:
+                if errors:
+                    break
+                futures.put(executor.submit(redactor.redact, block))
+    finally:
+        futures.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def _write_in_order(futures, output_stream, stats, errors):
+    # a block is written as soon as it is redacted, even if the next read waits for lines that are slow to come
+    while True:
+        future = futures.get()
+        if future is None:
+            return
+        if errors:
+            # the stream is abandoned, but the reader must not block on a full queue
+            continue
+        try:
+            block, block_stats = future.result()
+            output_stream.write(block)
+            output_stream.flush()
+            stats.add(block_stats)
+        except BaseException as e:
+            errors.append(e)
+
+
+def generate_log(api_keys, words, lines, key_fraction=DEFAULT_KEY_FRACTION, seed=0):
+    """
+    Generates a synthetic application log, where some lines contain an API key
+
+    :param api_keys: the API keys to be leaked
+    :param words: generic strings, e.g. user names and paths
+    :param lines: number of lines of the log
+    :param key_fraction: fraction of the lines containing an API key
+    :param seed: seed of the random generator
+    :return: the log and the number of API keys inside it
+    :rtype: (bytes, int)
+    """
+    rng = random.Random(seed)
+    templates = [
+        "{time} INFO [{thread}] http - GET /api/v1/{word}/{number} status=200 latency_ms={latency} user={word2}",
+        "{time} DEBUG [{thread}] cache - miss key={word}:{number} size={latency}",
+        "{time} WARN [{thread}] db - slow query on table {word} took {latency}ms (rows={number})",
+        "{time} INFO [{thread}] session - user {word2} logged in from 10.0.{latency}.{number}",
+        "{time} ERROR [{thread}] worker - job {word} failed: connection reset by peer (attempt {number})",
+    ]
+    key_templates = [
+        "{time} DEBUG [{thread}] http - request headers: Authorization: Bearer {key}",
+        "{time} INFO [{thread}] config - loaded api_key={key} for {word}",
+        '{time} DEBUG [{thread}] client - {{"token": "{key}", "user": "{word2}"}}',
+    ]
+    output = io.StringIO()
+    keys = 0
+    for number in range(lines):
+        # one line per millisecond
+        values = {"time": "2024-05-01T{0:02d}:{1:02d}:{2:02d}.{3:03d}Z".format(
+                      number // 3600000 % 24, number // 60000 % 60, number // 1000 % 60, number % 1000),
+                  "thread": "pool-1-thread-{0}".format(rng.randrange(16)), "word": rng.choice(words),
+                  "word2": rng.choice(words), "number": rng.randrange(100000), "latency": rng.randrange(256)}
+        if rng.random() < key_fraction:
+            values["key"] = rng.choice(api_keys)
+            output.write(rng.choice(key_templates).format(**values))
+            keys += 1
+        else:
+            output.write(rng.choice(templates).format(**values))
+        output.write("\n")
+    return output.getvalue().encode("utf-8"), keys
+
+
+def benchmark_redaction(api_keys, words, lines=DEFAULT_BENCHMARK_LINES, key_fraction=DEFAULT_KEY_FRACTION,
+                        thread_counts=DEFAULT_THREAD_COUNTS, block_bytes=DEFAULT_BLOCK_BYTES, repeat=3, seed=0):
+    """
+    Measures the throughput of redact_stream on a synthetic log (see generate_log)
+
+    :param thread_counts: the numbers of threads to be measured
+    :param repeat: runs for each number of threads; the fastest one is reported
+    :return: the log size, the API keys inside it and, for each number of threads, throughput and redacted keys
+    :rtype: OrderedDict
+    """
+    log, keys = generate_log(api_keys, words, lines, key_fraction, seed)
+    redactor = Redactor(hash_suffix=True)
+    # warm up the caches, so that the first measure is not penalized
+    redactor.redact(log[:log.find(b"\n", block_bytes) + 1 or len(log)])
+    report = OrderedDict([("cpus", os.cpu_count()), ("lines", lines), ("bytes", len(log)),
+                          ("api_keys", keys), ("block_bytes", block_bytes), ("results", [])])
+    for threads in thread_counts:
+        timings = []
+        for _ in range(repeat):
+            stats = redact_stream(io.BytesIO(log), io.BytesIO(), redactor, threads, block_bytes)
+            timings.append(stats.elapsed)
+        elapsed = min(timings)
+        report["results"].append(OrderedDict([("threads", threads), ("seconds", elapsed),
+                                              ("lines_per_second", lines / elapsed),
+                                              ("megabytes_per_second", len(log) / elapsed / 1e6),
+                                              ("candidates", stats.candidates), ("redacted", stats.keys)]))
+    return report
@@ -0,0 +1,206 @@
+"""
+Resumable scan of large corpora of strings (one for each line), checkpointed chunk by chunk.
+Findings are appended to a JSON Lines file and a progress journal records, after each chunk, where the scan
+arrived and how large the findings file was at that point. A restarted job truncates the findings file to
+the last checkpoint and goes on from there, so that no string is classified (or reported) twice.
+"""
+import hashlib
+import json
+import logging
+import os
+
+from . import config
+from .detector import detect_api_keys
+from .gibberish_detector import config as gibberish_config
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+DEFAULT_CHUNK_SIZE = 10000
+# longer lines are split, so that a file without line terminators can't exhaust memory
+MAX_LINE_BYTES = 1 << 20
+JOURNAL_FILE = "journal.json"
+FINDINGS_FILE = "findings.jsonl"
+
+
+def list_input_files(inputs):
+    """
+    Expands a list of files and directories into the (sorted) list of files to be scanned
+
+    :param inputs: paths of files and/or directories, the latter are walked recursively
+    :return: the file paths
+    :rtype: list
+    """
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, file_names in os.walk(path):
+                dirs.sort()
+                for file_name in sorted(file_names):
+                    files.append(os.path.join(root, file_name))
+        else:
+            files.append(path)
+    return files
+
+
+def model_fingerprint():
+    """
+    Computes a fingerprint of everything that affects detection results: configuration files,
+    trained models, wordlists and blacklists, or the deployment bundle that replaces them when configured
+
+    :return: an hex SHA-256 digest
+    :rtype: str
+    """
+    paths = [os.path.join(__location__, "config.yml")]
+    if config.bundle:
+        paths.append(os.path.join(__location__, config.bundle))
+    else:
+        paths.append(os.path.join(__location__, config.dump))
+        paths += [os.path.join(__location__, path) for path in config.wordlists + config.blacklists]
+        gibberish_location = os.path.join(__location__, "gibberish_detector")
+        paths += [os.path.join(gibberish_location, "config.yml"),
+                  os.path.join(gibberish_location, gibberish_config.dump)]
+    if getattr(config, "surrogate", None):
+        paths.append(os.path.join(__location__, config.surrogate))
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def read_chunk(f, chunk_size, end=None):
+    """
+    Reads up to chunk_size lines from a binary file
+
+    :param f: a file opened in binary mode
+    :param chunk_size: maximum number of lines to be read
+    :param end: if specified, lines starting at this byte offset (or after) are not read
+    :return: a list of (byte offset, stripped line) pairs
+    :rtype: list
+    """
+    lines = []
+    while len(lines) < chunk_size:
+        offset = f.tell()
+        if end is not None and offset >= end:
+            break
+        line = f.readline(MAX_LINE_BYTES)
+        if not line:
+            break
+        lines.append((offset, line.strip()))
+    return lines
+
+
+class ScanJob(object):
+    """
+    A scan of files and directories that can be interrupted at any time and resumed later
+    """
+
+    def __init__(self, inputs, job_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param inputs: paths of files and/or directories to be scanned, where each line is a string
+        :param job_dir: directory where the journal and the findings are stored
+        :param chunk_size: number of lines between two checkpoints
+        """
+        self.files = list_input_files(inputs)
+        self.job_dir = job_dir
+        self.chunk_size = chunk_size
+        self.journal_path = os.path.join(job_dir, JOURNAL_FILE)
+        self.findings_path = os.path.join(job_dir, FINDINGS_FILE)
+        self.fingerprint = model_fingerprint()
+
+    def load_journal(self):
+        """
+        :return: the progress journal, a new one if the job never started
+        :rtype: dict
+        """
+        if not os.path.exists(self.journal_path):
+            return {"fingerprint": self.fingerprint, "files": self.files, "file_index": 0, "offset": 0,
+                    "line": 0, "chunk_id": 0, "findings": 0, "findings_size": 0, "completed": False}
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            journal = json.load(f)
+        if journal["fingerprint"] != self.fingerprint:
+            raise ValueError("Configuration or models changed since the job {0} started; "
+                             "results would be inconsistent".format(self.job_dir))
+        if journal["files"] != self.files:
+            raise ValueError("Input files changed since the job {0} started".format(self.job_dir))
+        return journal
+
+    def save_journal(self, journal):
+        # write-then-rename, so that a crash never leaves a truncated journal behind
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def run(self):
+        """
+        Runs (or resumes) the scan until every file has been processed
+
+        :return: the final journal
+        :rtype: dict
+        """
+        os.makedirs(self.job_dir, exist_ok=True)
+        journal = self.load_journal()
+        if journal["completed"]:
+            logging.info("Scan job {0} already completed".format(self.job_dir))
+            return journal
+        if journal["chunk_id"]:
+            logging.info("Resuming scan job {0} from chunk {1} ({2}, offset {3})".format(
+                self.job_dir, journal["chunk_id"], self.files[journal["file_index"]], journal["offset"]))
+        mode = "r+b" if os.path.exists(self.findings_path) else "wb"
+        with open(self.findings_path, mode) as findings:
+            # drop findings written after the last checkpoint
+            findings.truncate(journal["findings_size"])
+            findings.seek(journal["findings_size"])
+            while journal["file_index"] < len(self.files):
+                path = self.files[journal["file_index"]]
+                with open(path, "rb") as f:
+                    f.seek(journal["offset"])
+                    while True:
+                        lines = read_chunk(f, self.chunk_size)
+                        if not lines:
+                            break
+                        self._process_chunk(journal, path, lines, findings)
+                        journal["offset"] = f.tell()
+                        journal["line"] += len(lines)
+                        journal["chunk_id"] += 1
+                        journal["findings_size"] = findings.tell()
+                        self.save_journal(journal)
+                journal["file_index"] += 1
+                journal["offset"] = 0
+                journal["line"] = 0
+                self.save_journal(journal)
+        journal["completed"] = True
+        self.save_journal(journal)
+        logging.info("Scan job {0} completed: {1} chunks, {2} findings".format(
+            self.job_dir, journal["chunk_id"], journal["findings"]))
+        return journal
+
+    def _process_chunk(self, journal, path, lines, findings):
+        detection = detect_api_keys([line for _, line in lines])
+        records = []
+        for number, ((offset, line), is_api_key) in enumerate(zip(lines, detection)):
+            if is_api_key:
+                records.append(json.dumps({"chunk": journal["chunk_id"], "path": path,
+                                           "line": journal["line"] + number + 1, "offset": offset,
+                                           "string": line.decode("utf-8", errors="replace")}))
+        if records:
+            findings.write(("\n".join(records) + "\n").encode("utf-8"))
+            journal["findings"] += len(records)
+        findings.flush()
+        os.fsync(findings.fileno())
+
+
+def iter_findings(job_dir):
+    """
+    :param job_dir: directory of a scan job
+    :return: a generator over the findings of the job, up to its last checkpoint
+    """
+    with open(os.path.join(job_dir, JOURNAL_FILE), "r", encoding="utf-8") as f:
+        size = json.load(f)["findings_size"]
+    with open(os.path.join(job_dir, FINDINGS_FILE), "rb") as f:
+        while f.tell() < size:
+            yield json.loads(f.readline().decode("utf-8"))
@@ -13,7 +13,7 @@ def string_sequentiality(string, charset, plot_scatterplot=False):
     """
     Computes how much a string contains sequence of consecutive or distance-fixed characters
 
-    :param string: the string
+    :param string: the string; can be ASCII bytes
     :param charset: a charset as a string
     :param plot_scatterplot: optional boolean, if true plots a scatterplot
 
@@ -25,11 +25,13 @@ def string_sequentiality(string, charset, plot_scatterplot=False):
     string_length = len(string)
     window_size = math.floor(math.log(string_length))
     window_size = int(window_size)
+    # iterating over bytes already yields the characters' codes
+    codes = list(string) if isinstance(string, bytes) else [ord(c) for c in string]
     counter = 0
     buckets = {}
     for j in range(1, len(string)):
         for i in range(max(j - window_size, 0), j):
-            diff = math.fabs((ord(string[j]) - ord(string[i])))
+            diff = math.fabs((codes[j] - codes[i]))
             buckets[diff] = buckets.get(diff, 0) + 1
             counter += 1
 
@@ -0,0 +1,159 @@
+"""
+Columnar representation of a batch of strings
+"""
+import numpy as np
+
+ENCODING = "utf-8"
+
+
+class StringBatch(object):
+    """
+    A batch of strings packed in a single UTF-8 buffer plus an offsets array, i.e. the i-th string
+    is buffer[offsets[i]:offsets[i + 1]].
+    Pure ASCII strings are handed to the features functions as bytes, which take a byte-level fast path
+    that needs neither decoding nor Unicode normalization.
+    Detection stages work on arrays of indices (or boolean masks) over the batch, so that no per-string
+    Python object needs to be kept alive between stages; strings are materialized only when needed.
+    """
+
+    def __init__(self, buffer, offsets):
+        """
+        :param buffer: the packed UTF-8 encoded strings
+        :type buffer: bytes
+        :param offsets: array of len(batch) + 1 offsets inside buffer
+        :type offsets: np.array
+        """
+        self.buffer = buffer
+        self.offsets = offsets
+        self.byte_lengths = np.diff(offsets)
+        self.ascii = None
+        self.lengths = None
+        self._scan_encoding()
+
+    @classmethod
+    def from_strings(cls, strings):
+        """
+        Packs an iterable of strings into a StringBatch. None values are treated as empty strings
+
+        :param strings: an iterable of strings; bytes-like items (bytes, bytearray, memoryview) are
+                        packed as they are and should be UTF-8 encoded
+        :return: the packed batch
+        :rtype: StringBatch
+        """
+        encoded = [string.encode(ENCODING) if isinstance(string, str) else string or b'' for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    def _scan_encoding(self):
+        """
+        Computes, without decoding them, which strings are pure ASCII and the length in characters
+        of each string, i.e. the length in bytes minus the number of UTF-8 continuation bytes
+        """
+        data = np.frombuffer(self.buffer, dtype=np.uint8)
+        if not len(data) or data.max() < 0x80:
+            self.ascii = np.ones(len(self), dtype=bool)
+            self.lengths = self.byte_lengths
+            return
+        self.ascii = _count_per_string(data >= 0x80, self.offsets) == 0
+        self.lengths = self.byte_lengths - _count_per_string((data & 0xC0) == 0x80, self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_bytes(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.get_bytes(i).decode(ENCODING, errors='replace')
+
+    def iter_bytes(self, indices):
+        """
+        :param indices: array of indices of the strings to be returned
+        :return: a generator over the (still encoded) strings identified by indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        for start, end in zip(self.offsets[indices].tolist(), self.offsets[indices + 1].tolist()):
+            yield self.buffer[start:end]
+
+    def iter_strings(self, indices):
+        """
+        :param indices: array of indices of the strings to be returned
+        :return: a generator over the strings identified by indices
+        """
+        for data in self.iter_bytes(indices):
+            yield data.decode(ENCODING, errors='replace')
+
+    def iter_candidates(self, indices):
+        """
+        :param indices: array of indices of the strings to be returned
+        :return: a generator over the strings identified by indices, as bytes if they are pure ASCII
+                 (so that they can go through the byte-level fast path), decoded otherwise
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        for data, is_ascii in zip(self.iter_bytes(indices), self.ascii[indices].tolist()):
+            yield data if is_ascii else data.decode(ENCODING, errors='replace')
+
+    def gather_bytes(self, indices):
+        """
+        Concatenates the bytes of the strings identified by indices, without materializing them
+
+        :param indices: array of indices of the strings to be gathered
+        :return: the concatenated bytes and, for each of them, the position of its string inside indices
+        :rtype: (np.array, np.array)
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.byte_lengths[indices]
+        rows = np.repeat(np.arange(len(indices)), lengths)
+        first_byte = np.cumsum(lengths) - lengths
+        positions = starts[rows] + (np.arange(len(rows)) - first_byte[rows])
+        data = np.frombuffer(self.buffer, dtype=np.uint8)
+        return data[positions], rows
+
+    def byte_histograms(self, indices):
+        """
+        Counts the occurrences of each byte value inside the strings identified by indices, without
+        materializing them
+
+        :param indices: array of indices of the strings to be analyzed
+        :return: a len(indices) x 256 matrix of counts
+        :rtype: np.array
+        """
+        data, rows = self.gather_bytes(indices)
+        counts = np.bincount(rows * 256 + data, minlength=len(indices) * 256)
+        return counts.reshape(len(indices), 256)
+
+    def slice(self, start, end):
+        """
+        :return: the batch of the strings from start (included) to end (excluded)
+        :rtype: StringBatch
+        """
+        offsets = self.offsets[start:end + 1]
+        return StringBatch(self.buffer[offsets[0]:offsets[-1]], offsets - offsets[0])
+
+    def select(self, indices):
+        """
+        Materializes the strings identified by indices
+
+        :param indices: array of indices (or boolean mask) of the strings to be returned
+        :return: the selected strings
+        :rtype: list
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        return list(self.iter_strings(indices))
+
+
+def _count_per_string(flags, offsets):
+    """
+    :param flags: a boolean array over the packed buffer
+    :param offsets: the offsets array of the batch
+    :return: the number of True flags inside each string
+    :rtype: np.array
+    """
+    cumulative = np.zeros(len(flags) + 1, dtype=np.int64)
+    np.cumsum(flags, out=cumulative[1:])
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
@@ -1,29 +1,44 @@
 import logging
 import os
 import pickle
+import time
+from collections import OrderedDict
 
 import numpy as np
-from sklearn.neural_network import MLPClassifier
 
 from . import charset
+from .classifier_backends import MLPBackend
 from .entropy import normalized_entropy
 from .gibberish_detector.gibberish_singleton import gib_detector
 from .sequentiality import string_sequentiality
 
+N_FEATURES = 4
+
 
 class StringBinaryClassifier(object):
     """
-    Wrapper object for a Neural Network.
+    Wrapper object for a classifier backend, by default a Neural Network.
     Used to classify strings based on entropy, sequentiality and gibberish
     """
 
-    def __init__(self, max_iter=100):
+    def __init__(self, max_iter=100, backend=None):
         """
-        :param max_iter: max iterations for wrapped Neural Network
+        :param max_iter: max iterations for the default Neural Network backend
+        :param backend: the (not yet trained) classifier backend; if None, a Neural Network is used
+        :type backend: ClassifierBackend
         """
-        self.__neural_network = MLPClassifier(hidden_layer_sizes=(100, 100), solver='lbfgs', max_iter=max_iter)
+        self.backend = backend if backend is not None else MLPBackend(max_iter=max_iter)
         self.input_mean = None
         self.input_stdev = None
+        self.evaluation_report = None
+
+    def __setstate__(self, state):
+        # instances pickled before the introduction of backends wrap the Neural Network directly
+        neural_network = state.pop("_StringBinaryClassifier__neural_network", None)
+        if neural_network is not None:
+            state["backend"] = MLPBackend.from_model(neural_network)
+        state.setdefault("evaluation_report", None)
+        self.__dict__.update(state)
 
     def calculate_normalization_parameters(self, matrix):
         """
@@ -35,7 +50,7 @@ class StringBinaryClassifier(object):
 
     def train(self, matrix_learn_set, good_test, bad_test):
         """
-        Trains the wrapped neural network
+        Trains the wrapped classifier backend
 
         :param matrix_learn_set: input train set, where each row contains the already-computed input features
         :param good_test:  set of file paths where each line is a class 1 string, used for testing
@@ -51,35 +66,68 @@ class StringBinaryClassifier(object):
             train_inputs -= self.input_mean
             train_inputs /= self.input_stdev
 
-        # train the NN
-        logging.info("Started training NN...")
-        self.__neural_network.fit(train_inputs, train_outputs)
+        # train the backend
+        logging.info("Started training {0} backend...".format(self.backend.name))
+        self.backend.train(train_inputs, train_outputs)
+        logging.info("Training finished.")
+
+        self.evaluation_report = self.evaluate(good_test, bad_test)
+        self.evaluation_report.log()
+
+    def train_out_of_core(self, matrix_path, good_test, bad_test, epochs=5, batch_size=1024, seed=None):
+        """
+        Trains the wrapped classifier backend (that must support mini-batches, e.g. mlp_minibatch) on a training
+        set saved as .npy file, without loading it: normalization parameters are computed in a streaming pass
+        over the memory-mapped matrix, then the backend is trained on shuffled mini-batches read from it
+
+        :param matrix_path: the training set, e.g. written by feature_matrix.write_training_set
+        :param good_test:  set of file paths where each line is a class 1 string, used for testing
+        :param bad_test: set of file paths where each line is a class 0 string, used for testing
+        :param epochs: number of passes over the training set
+        :param batch_size: rows of each mini-batch
+        :param seed: seed of the shuffling, None for a random one
+        """
+        # imported here, since feature_matrix depends on this module
+        from .feature_matrix import matrix_statistics, iter_shuffled_batches
+
+        matrix = np.load(matrix_path, mmap_mode="r")
+        self.input_mean, self.input_stdev = matrix_statistics(matrix, N_FEATURES)
+        rng = np.random.default_rng(seed)
+        logging.info("Started training {0} backend on {1} rows, in mini-batches...".format(
+            self.backend.name, len(matrix)))
+        for epoch in range(epochs):
+            for batch in iter_shuffled_batches(matrix, batch_size, rng):
+                inputs = (batch[:, 0:-1] - self.input_mean) / self.input_stdev
+                self.backend.partial_train(inputs, batch[:, -1])
+            logging.info("Epoch {0}/{1} finished".format(epoch + 1, epochs))
         logging.info("Training finished.")
 
-        tot_count = 0
-        err_count = 0
-        for good_test_file in good_test:
-            for line in open(good_test_file):
-                tot_count += 1
-                line = line.replace('\n', '').replace('\r', '')
-                prediction = self.predict_strings([line])
-                if prediction[0] != 1:
-                    logging.warning("String {0} was not detected as an API key.".format(line))
-                    err_count += 1
-        for bad_test_file in bad_test:
-            for line in open(bad_test_file):
-                tot_count += 1
-                line = line.replace('\n', '').replace('\r', '')
-                prediction = self.predict_strings([line])
-                if prediction[0] != 0:
-                    logging.warning("String {0} was wrongly detected as an API key.".format(line))
-                    err_count += 1
-        score = (tot_count - err_count) / tot_count
-        logging.info("Test finished. Classifier score: {0}".format(score))
+        self.evaluation_report = self.evaluate(good_test, bad_test)
+        self.evaluation_report.log()
+
+    def evaluate(self, good_test, bad_test):
+        """
+        Tests the wrapped classifier backend. Each test file is featurized as a single batch and
+        predicted with a single call to the backend
+
+        :param good_test:  set of file paths where each line is a class 1 string, used for testing
+        :param bad_test: set of file paths where each line is a class 0 string, used for testing
+        :return: a report containing the confusion matrix, the per-file errors and the misclassified strings
+        :rtype: EvaluationReport
+        """
+        report = EvaluationReport()
+        start = time.perf_counter()
+        for expected_class, test_files in ((1, good_test), (0, bad_test)):
+            for test_file in test_files:
+                strings = read_lines(test_file)
+                predictions = self.predict_strings(strings)
+                report.add(test_file, strings, predictions, expected_class)
+        report.elapsed = time.perf_counter() - start
+        return report
 
     def train_from_text_files(self, class_one_files, class_zero_files, good_test, bad_test):
         """
-        Trains the wrapped neural network
+        Trains the wrapped classifier backend
 
         :param class_one_files: path of files where each line is a class 1 string, used for training
         :param class_zero_files: path of files where each line is a class 0 string, used for training
@@ -100,20 +148,166 @@ class StringBinaryClassifier(object):
         if self.input_mean is not None and self.input_stdev is not None:
             inputs = inputs - self.input_mean
             inputs = inputs / self.input_stdev
-        return self.__neural_network.predict(inputs)
+        return self.backend.predict(inputs)
+
+    def predict_proba(self, inputs):
+        """
+        Estimates the probability of the inserted inputs to be class 1 strings
+
+        :param inputs: matrix where each row contains input features
+        :return: the class 1 probability for each input
+        :rtype: np.array
+        """
+        if self.input_mean is not None and self.input_stdev is not None:
+            inputs = inputs - self.input_mean
+            inputs = inputs / self.input_stdev
+        return self.backend.predict_proba(inputs)
 
     def predict_strings(self, strings):
         """
-        Predicts the class for the inserted inputs
+        Predicts the class for the inserted inputs. Strings for which no feature can be computed
+        (e.g. empty strings) are classified as class 0
 
         :param strings: a list of string whose class should be predicted
         :return: a list of class predictions, one element for each input
         :rtype: list
         """
-        inputs = []
-        for string in strings:
-            inputs.append(calculate_all_features(string))
-        return self.predict(np.array(inputs))
+        inputs, valid = calculate_features_matrix(strings)
+        predictions = np.zeros(len(strings))
+        if inputs.shape[0] > 0:
+            predictions[valid] = self.predict(inputs)
+        return predictions
+
+
+class EvaluationReport(object):
+    """
+    Outcome of a classifier test run, where class 1 (API key) is the positive class
+    """
+
+    def __init__(self):
+        self.true_positives = 0
+        self.false_positives = 0
+        self.true_negatives = 0
+        self.false_negatives = 0
+        # test file path => (number of errors, number of strings)
+        self.file_errors = OrderedDict()
+        # list of (test file path, string, expected class)
+        self.misclassified = []
+        self.elapsed = 0.0
+
+    def add(self, file_path, strings, predictions, expected_class):
+        """
+        Accounts the predictions made for a whole test file
+
+        :param file_path: path of the test file
+        :param strings: the strings contained in the test file
+        :param predictions: the predicted class for each string
+        :param expected_class: the class that every string of the file belongs to
+        """
+        wrong = np.flatnonzero(np.asarray(predictions) != expected_class)
+        correct = len(strings) - len(wrong)
+        if expected_class == 1:
+            self.true_positives += correct
+            self.false_negatives += len(wrong)
+        else:
+            self.true_negatives += correct
+            self.false_positives += len(wrong)
+        self.file_errors[file_path] = (len(wrong), len(strings))
+        for i in wrong:
+            self.misclassified.append((file_path, strings[i], expected_class))
+
+    @property
+    def total(self):
+        return self.true_positives + self.false_positives + self.true_negatives + self.false_negatives
+
+    @property
+    def score(self):
+        if not self.total:
+            return 0.0
+        return (self.true_positives + self.true_negatives) / self.total
+
+    @property
+    def throughput(self):
+        """
+        Number of strings evaluated per second, features computation included
+        """
+        if not self.elapsed:
+            return 0.0
+        return self.total / self.elapsed
+
+    def confusion_matrix(self):
+        """
+        :return: a 2x2 matrix where rows are the expected classes and columns the predicted ones,
+                 i.e. [[true negatives, false positives], [false negatives, true positives]]
+        :rtype: np.array
+        """
+        return np.array([[self.true_negatives, self.false_positives],
+                         [self.false_negatives, self.true_positives]])
+
+    def log(self):
+        for file_path, string, expected_class in self.misclassified:
+            if expected_class == 1:
+                logging.warning("String {0} was not detected as an API key.".format(string))
+            else:
+                logging.warning("String {0} was wrongly detected as an API key.".format(string))
+        for file_path, (err_count, tot_count) in self.file_errors.items():
+            logging.info("{0}: {1} errors out of {2} strings".format(file_path, err_count, tot_count))
+        logging.info("Confusion matrix (rows: expected, columns: predicted):\n{0}".format(self.confusion_matrix()))
+        logging.info("Test finished in {0:.2f}s ({1:.0f} strings/s). Classifier score: {2}".format(
+            self.elapsed, self.throughput, self.score))
+
+
+def read_lines(file_path):
+    """
+    Reads a text file, one string for each line
+
+    :param file_path: path of the file
+    :return: the lines of the file, stripped from line terminators
+    :rtype: list
+    """
+    with open(file_path) as f:
+        return [line.replace('\n', '').replace('\r', '') for line in f]
+
+
+def calculate_features_matrix(strings, count=None):
+    """
+    Batch version of calculate_all_features
+
+    :param strings: a list of strings
+    :param count: the number of strings, needed if strings is a generator
+    :return: a matrix where each row contains the features of a valid string and a boolean mask that
+             tells which strings are valid, i.e. which strings have a row in the matrix
+    :rtype: (np.array, np.array)
+    """
+    if count is None:
+        count = len(strings)
+    matrix = np.empty((count, N_FEATURES))
+    valid = np.zeros(count, dtype=bool)
+    rows = 0
+    for i, string in enumerate(strings):
+        features = calculate_all_features(string)
+        if features is not None:
+            matrix[rows] = features
+            valid[i] = True
+            rows += 1
+    return matrix[:rows], valid
+
+
+def calculate_features_batch(batch, indices):
+    """
+    StringBatch version of calculate_features_matrix. Pure ASCII strings are analyzed all at once by
+    the (vectorized) features_kernel
+
+    :param batch: the strings to be analyzed
+    :type batch: StringBatch
+    :param indices: the indices of the strings of the batch that should be analyzed
+    :return: a matrix where each row contains the features of a valid string and a boolean mask over
+             indices that tells which strings are valid, i.e. which strings have a row in the matrix
+    :rtype: (np.array, np.array)
+    """
+    # imported here, since the kernel depends on this module
+    from .features_kernel import calculate_features_vectorized
+    return calculate_features_vectorized(batch, indices)
 
 
 def generate_all_features(list_of_strings):
@@ -131,7 +325,7 @@ def calculate_all_features(string):
     """
     Computes all the string features, like the normalized entropy, sequentiality and gibberish, for a given string
 
-    :param string: string to be analyzed
+    :param string: string to be analyzed; ASCII bytes take a faster, decoding-free path
     :return: a tuple containing charset-normalized entropy, sequentiality and gibberish for the string
     :rtype: (float, float, float, float)
     """
@@ -192,9 +386,11 @@ def generate_training_set(class_one_files, class_zero_files, return_strings=Fals
     return matrix
 
 
-def load_or_create_trained_instance(class_one_files, class_zero_files, good_test, bad_test, dump_file, rebuild=False):
+def load_or_create_trained_instance(class_one_files, class_zero_files, good_test, bad_test, dump_file, rebuild=False,
+                                    backend=None):
     """
-    Initializes a StringClassifier if not available in dump_file, otherwise it simply loads it from storage
+    Initializes a StringClassifier if not available in dump_file, otherwise it simply loads it from storage.
+    If the dumped instance was trained with a backend different from the requested one, it is re-trained
 
     :param class_one_files: path of files where each line is a class 1 string, used for training
     :param class_zero_files: path of files where each line is a class 0 string, used for training
@@ -202,6 +398,8 @@ def load_or_create_trained_instance(class_one_files, class_zero_files, good_test
     :param bad_test: set of file paths where each line is a class 0 string, used for testing
     :param dump_file: path of the dump file
     :param rebuild: if the instance should be re-created even if a dump file is available
+    :param backend: the (not yet trained) classifier backend; if None, the default Neural Network
+    :type backend: ClassifierBackend
     :return: a ready-to-be-used StringClassifier instance
     :rtype: StringBinaryClassifier
     """
@@ -215,8 +413,11 @@ def load_or_create_trained_instance(class_one_files, class_zero_files, good_test
             logging.info("Restoring dump file '{0}'. There is no need to re-train the algorithm".format(dump_file))
             classifier = pickle.load(open(dump_file, 'rb'))
             logging.info("Dump restored")
-            return classifier
-    classifier = StringBinaryClassifier()
+            if backend is None or classifier.backend.describe() == backend.describe():
+                return classifier
+            logging.info("Dump was trained with backend {0}, while {1} is configured: re-training".format(
+                classifier.backend.describe(), backend.describe()))
+    classifier = StringBinaryClassifier(backend=backend)
     classifier.train_from_text_files(class_one_files, class_zero_files, good_test, bad_test)
     pickle.dump(classifier, open(dump_file, 'wb'))
     logging.info("Object saved to {0}".format(dump_file))
@@ -1,15 +1,49 @@
+import copy
+
+import numpy as np
+
+from .string_batch import ENCODING
 from .words_finder_singleton import finder
 
+HEX_PREFIXES = ('0x', '0X', '-0x', '-0X')
+HEX_PREFIXES_BYTES = tuple(prefix.encode('ascii') for prefix in HEX_PREFIXES)
+
 
 class StringsFilter(object):
-    def __init__(self, min_key_length, max_key_length, word_content_threshold, blacklists):
+    def __init__(self, min_key_length, max_key_length, word_content_threshold, blacklists, blacklist_index=None):
+        """
+        :param min_key_length: the minimum length of an API key
+        :param max_key_length: the maximum length of an API key
+        :param word_content_threshold: strings made of this fraction (or more) of real words aren't API keys
+        :param blacklists: paths of txt files containing strings that should never be considered as API keys
+        :param blacklist_index: a WordsIndex of the blacklisted strings, used instead of blacklists if specified
+        """
         self.min_key_length = min_key_length
         self.max_key_length = max_key_length
         self.word_content_threshold = word_content_threshold
+        if blacklist_index is not None:
+            # the index looks up both str and bytes
+            self.blacklist = self.blacklist_bytes = blacklist_index
+            return
         self.blacklist = set()
         for txt in blacklists:
             for line in open(txt, "r"):
                 self.blacklist.add(line.replace('\n', '').replace('\r', ''))
+        self.blacklist_bytes = set(string.encode(ENCODING) for string in self.blacklist)
+
+    def derive(self, min_key_length=None, max_key_length=None, word_content_threshold=None):
+        """
+        :return: a StringsFilter with the same blacklist (not copied) and the specified settings changed
+        :rtype: StringsFilter
+        """
+        derived = copy.copy(self)
+        if min_key_length is not None:
+            derived.min_key_length = min_key_length
+        if max_key_length is not None:
+            derived.max_key_length = max_key_length
+        if word_content_threshold is not None:
+            derived.word_content_threshold = word_content_threshold
+        return derived
 
     def pre_filter(self, string):
         """
@@ -17,28 +51,38 @@ class StringsFilter(object):
          are directly filtered through this function
 
          :param string: the string that should be evaluated
-         :type string: string
+         :type string: Union[str, bytes]
          :return: False if it can't be an API key, True otherwise
          """
         # filter short, long and invalid strings
         if not string or len(string) < self.min_key_length or len(string) > self.max_key_length:
             return False
         # filter keys in blacklist
-        if self.blacklist and string in self.blacklist:
+        blacklist = self.blacklist_bytes if isinstance(string, bytes) else self.blacklist
+        if blacklist and string in blacklist:
             return False
         # and string that are just hex numbers (e.g. Android's R values)
-        if string.startswith(('0x', '0X', '-0x', '-0X')):
-            if string.endswith('L'):
-                s = string[:-1]
-            else:
-                s = string
-            try:
-                int(s, 16)
-                return False
-            except ValueError:
-                pass
+        if is_hex_number(string):
+            return False
         return True
 
+    def pre_filter_batch(self, batch):
+        """
+        StringBatch version of pre_filter
+
+        :param batch: the strings that should be evaluated
+        :type batch: StringBatch
+        :return: the indices of the strings that can be API keys
+        :rtype: np.array
+        """
+        lengths = batch.lengths
+        indices = np.flatnonzero((lengths > 0) & (lengths >= self.min_key_length) & (lengths <= self.max_key_length))
+        keep = np.ones(len(indices), dtype=bool)
+        for j, string in enumerate(batch.iter_bytes(indices)):
+            if (self.blacklist_bytes and string in self.blacklist_bytes) or is_hex_number(string):
+                keep[j] = False
+        return indices[keep]
+
     def pre_filter_mystring(self, mystring):
         """
         MyString version of pre_filter
@@ -62,3 +106,42 @@ class StringsFilter(object):
             return False
         else:
             return self.post_filter(mystring.value)
+
+    def post_filter_batch(self, batch, indices):
+        """
+        StringBatch version of post_filter
+
+        :param batch: the strings that should be evaluated
+        :type batch: StringBatch
+        :param indices: the indices of the strings of the batch that should be evaluated
+        :return: a boolean mask, True for each index whose string can still be an API key
+        :rtype: np.array
+        """
+        keep = np.empty(len(indices), dtype=bool)
+        for j, string in enumerate(batch.iter_candidates(indices)):
+            keep[j] = self.post_filter(string)
+        return keep
+
+
+def is_hex_number(string):
+    """
+    Checks if a string is just an hex number, like 0x7f0b0001 or -0x1L (e.g. Android's R values)
+
+    :param string: the string that should be evaluated
+    :type string: Union[str, bytes]
+    :return: True if the string is an hex number
+    :rtype: bool
+    """
+    if isinstance(string, bytes):
+        prefixes, suffix = HEX_PREFIXES_BYTES, b'L'
+    else:
+        prefixes, suffix = HEX_PREFIXES, 'L'
+    if string.startswith(prefixes):
+        if string.endswith(suffix):
+            string = string[:-1]
+        try:
+            int(string, 16)
+            return True
+        except ValueError:
+            pass
+    return False
@@ -4,6 +4,7 @@ Singleton implementation for WordsFinder object
 import os
 
 from . import config
+from .bundle_singleton import bundle
 from .strings_filter import StringsFilter
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -12,4 +13,8 @@ blacklists = []
 for path in config.blacklists:
     blacklists.append(os.path.join(__location__, path))
 
-s_filter = StringsFilter(config.min_key_length, config.max_key_length, config.word_content_threshold, blacklists)
+if bundle is not None:
+    s_filter = StringsFilter(bundle.settings["min_key_length"], bundle.settings["max_key_length"],
+                             bundle.settings["word_content_threshold"], None, bundle.blacklist_index())
+else:
+    s_filter = StringsFilter(config.min_key_length, config.max_key_length, config.word_content_threshold, blacklists)
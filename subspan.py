@@ -0,0 +1,297 @@
+"""
+Sub-span detection: finds API keys embedded inside longer strings (e.g. URLs with a key parameter, connection
+strings, JSON blobs), that the whole-string detector misses or dilutes.
+Windows of typical API key lengths slide over each string, one character at a time. The histogram of the characters
+(for the entropy and the narrowest charset) and the histogram of the distances between near characters (for the
+sequentiality) are updated as characters enter and leave the window, instead of being recomputed from scratch.
+Windows go through a cascade of cheap gates first; only the survivors are featurized and submitted to the
+neural network. Overlapping positive windows are reduced to the most likely one, whose span is then aligned to
+the delimiters around the key; windows that can't be aligned are dropped, rather than reported with misaligned
+offsets.
+"""
+import math
+
+import numpy as np
+
+from . import charset as cset
+from .classifier_singleton import classifier
+from .detector import detect_api_keys
+from .gibberish_detector.gibberish_singleton import gib_detector
+from .string_batch import ENCODING
+from .strings_filter_singleton import s_filter
+
+DEFAULT_WINDOW_LENGTHS = (16, 20, 32, 36, 39, 40, 64)
+# cascade gates, calibrated on the API keys learnsets (about 99.5% of them pass both):
+# entropy relative to the maximum one reachable with the window length and charset
+MIN_ENTROPY_RATIO = 0.65
+# sequentiality index, i.e. distance between the window's character distances and its charset's ones
+MAX_SEQUENTIALITY = 0.002
+# characters that usually surround embedded API keys (parameters separators, quotes, brackets...)
+DELIMITERS = frozenset(" \t\r\n\"'`=&?/:;,<>()[]{}|")
+# delimiters that (unlike "/" and "=") are almost never part of an API key: windows containing more than
+# MAX_SEPARATORS of them are discarded before any other gate
+SEPARATOR_CODES = frozenset(ord(c) for c in DELIMITERS - {"/", "="})
+MAX_SEPARATORS = 1
+
+# windows made of printable text (i.e. with spaces) are discarded upfront: almost no API key contains spaces
+CHARSET_IDS = [k for k, charset in enumerate(cset.Charset) if charset is not cset.Charset.PRINT_CHARS]
+CHARSETS = [cset.CHARSETS_BYTES[k][0] for k in CHARSET_IDS]
+# for each character code, the indices (inside CHARSETS) of the charsets that don't contain it
+EXCLUDING_CHARSETS = [tuple(np.flatnonzero(cset.CHARSETS_EXCLUDED_BYTES[CHARSET_IDS, code]).tolist())
+                      for code in range(128)]
+ALL_CHARSETS = tuple(range(len(CHARSETS)))
+
+
+class WindowCandidate(object):
+    def __init__(self, string_index, start, end, charset, entropy, sequentiality):
+        self.string_index = string_index
+        self.start = start
+        self.end = end
+        self.charset = charset
+        self.entropy = entropy
+        self.sequentiality = sequentiality
+
+    def features(self, window):
+        """
+        :return: the same features computed by string_classifier.calculate_all_features for the window
+        :rtype: (float, float, float, float)
+        """
+        return (self.entropy / (self.end - self.start), self.sequentiality, gib_detector.evaluate(window, True),
+                float(len(self.charset)))
+
+
+def _shannon_entropy(counts, length):
+    # same computation of entropy.shannon_entropy: charsets are sorted, so iterating over the sorted
+    # codes of the window's characters adds up the same terms in the same order
+    entropy = 0.0
+    for code in sorted(code for code, count in counts.items() if count):
+        p_x = float(counts[code]) / length
+        entropy = entropy + (p_x * math.log(p_x, 2))
+    return -entropy
+
+
+def _mse(pairs, counter, charset_buckets):
+    # same computation (and order of the operations) of sequentiality.string_sequentiality
+    mse = 0
+    buckets_count = len(charset_buckets)
+    for key, probability in charset_buckets.items():
+        diff = pairs.get(key, 0) / counter - probability
+        mse += diff ** 2 / buckets_count
+    return mse
+
+
+def iter_window_candidates(string, window_length, string_index=0):
+    """
+    Slides a window over a string, yielding the windows that pass the cascade gates:
+    few separators, an API key charset, a high enough entropy and a low enough sequentiality
+
+    :param string: the string to be analyzed
+    :param window_length: the window length, in characters
+    :param string_index: identifier of the string, copied to the candidates
+    :return: a generator over WindowCandidate objects
+    """
+    codes = [ord(c) for c in string]
+    if len(codes) < window_length:
+        return
+    window_size = int(math.floor(math.log(window_length)))
+    counter = sum(min(j, window_size) for j in range(1, window_length))
+    # c * log2(c) for each possible character count, to update the entropy in constant time
+    clogc = [0.0] + [c * math.log2(c) for c in range(1, window_length + 1)]
+    counts = {}
+    excluded = [0] * len(CHARSETS)
+    pairs = {}
+    sum_clogc = 0.0
+    separators = 0
+
+    def add_character(code):
+        nonlocal sum_clogc, separators
+        if code in SEPARATOR_CODES:
+            separators += 1
+        count = counts.get(code, 0)
+        counts[code] = count + 1
+        sum_clogc += clogc[count + 1] - clogc[count]
+        for k in EXCLUDING_CHARSETS[code] if code < 128 else ALL_CHARSETS:
+            excluded[k] += 1
+
+    def remove_character(code):
+        nonlocal sum_clogc, separators
+        if code in SEPARATOR_CODES:
+            separators -= 1
+        count = counts[code]
+        counts[code] = count - 1
+        sum_clogc += clogc[count - 1] - clogc[count]
+        for k in EXCLUDING_CHARSETS[code] if code < 128 else ALL_CHARSETS:
+            excluded[k] -= 1
+
+    for j in range(window_length):
+        add_character(codes[j])
+        for i in range(max(j - window_size, 0), j):
+            diff = abs(codes[j] - codes[i])
+            pairs[diff] = pairs.get(diff, 0) + 1
+
+    log_length = math.log2(window_length)
+    start = 0
+    while True:
+        charset_id = -1
+        if separators <= MAX_SEPARATORS:
+            charset_id = next((k for k, count in enumerate(excluded) if not count), -1)
+        if charset_id >= 0:
+            charset = CHARSETS[charset_id]
+            max_entropy = math.log2(min(window_length, len(charset)))
+            entropy = log_length - sum_clogc / window_length
+            if max_entropy > 0 and entropy / max_entropy >= MIN_ENTROPY_RATIO:
+                sequentiality = _mse(pairs, counter, cset.get_char_distance_distribution(charset))
+                if sequentiality <= MAX_SEQUENTIALITY:
+                    yield WindowCandidate(string_index, start, start + window_length, charset,
+                                          _shannon_entropy(counts, window_length), sequentiality)
+        end = start + window_length
+        if end >= len(codes):
+            return
+        # slide: drop the first character and its pairs, then add the next one and its pairs
+        for i in range(start + 1, start + window_size + 1):
+            diff = abs(codes[i] - codes[start])
+            pairs[diff] -= 1
+        remove_character(codes[start])
+        add_character(codes[end])
+        for i in range(end - window_size, end):
+            diff = abs(codes[end] - codes[i])
+            pairs[diff] = pairs.get(diff, 0) + 1
+        start += 1
+
+
+def _aligned_boundaries(string, start, end):
+    """
+    :return: how many ends of the window (0, 1 or 2) lie on a delimiter or on an end of the string
+    """
+    return int(start == 0 or string[start - 1] in DELIMITERS) + int(end == len(string) or string[end] in DELIMITERS)
+
+
+def _is_delimiter(string, i, delimiters=DELIMITERS):
+    """
+    :return: True if the i-th character of string is a delimiter; "=" is not, when it is (base64) padding
+    """
+    if string[i] == "=":
+        return i + 1 < len(string) and string[i + 1] != "=" and string[i + 1] not in delimiters
+    return string[i] in delimiters or ord(string[i]) >= 128
+
+
+def _refine_span(string, start, end, max_length, delimiters=DELIMITERS):
+    """
+    Aligns a positive window to the key it contains: the window is narrowed to its longest run of
+    characters without delimiters, that is then extended up to the nearest delimiters, so that keys
+    shorter or longer than the window are returned whole
+
+    :return: the refined (start, end) span
+    """
+    best_start, best_end = start, start
+    run_start = start
+    for i in range(start, end + 1):
+        if i == end or _is_delimiter(string, i, delimiters):
+            if i - run_start > best_end - best_start:
+                best_start, best_end = run_start, i
+            run_start = i + 1
+    start, end = best_start, best_end
+    while end < len(string) and end - start < max_length and not _is_delimiter(string, end, delimiters):
+        end += 1
+    while start > 0 and end - start < max_length and not _is_delimiter(string, start - 1, delimiters):
+        start -= 1
+    return start, end
+
+
+def _suppress_overlaps(spans):
+    """
+    :param spans: (start, end, score) tuples of a single string
+    :return: the best scoring spans that don't overlap each other, sorted by position
+    """
+    selected = []
+    for start, end, score in sorted(spans, key=lambda span: span[2], reverse=True):
+        if all(end <= other_start or start >= other_end for other_start, other_end, _ in selected):
+            selected.append((start, end, score))
+    return sorted(selected)
+
+
+def _drop_overlaps(spans):
+    """
+    :param spans: (start, end) pairs of a single string
+    :return: the spans, sorted, where of two overlapping spans only the longest one is kept
+    """
+    selected = []
+    for start, end in sorted(set(spans)):
+        if selected and start < selected[-1][1]:
+            if end - start > selected[-1][1] - selected[-1][0]:
+                selected[-1] = (start, end)
+            continue
+        selected.append((start, end))
+    return selected
+
+
+def detect_api_key_spans(strings, window_lengths=DEFAULT_WINDOW_LENGTHS):
+    """
+    Finds the API keys embedded inside each string
+
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param window_lengths: lengths of the sliding windows, i.e. of the API keys that can be found
+    :return: for each string, a list of (start, end) character offsets of the API keys it contains
+    :rtype: list
+    """
+    strings = [string if isinstance(string, str) else bytes(string).decode(ENCODING, errors="replace")
+               for string in strings]
+    candidates = []
+    for string_index, string in enumerate(strings):
+        for window_length in window_lengths:
+            candidates.extend(iter_window_candidates(string, window_length, string_index))
+
+    spans = [[] for _ in strings]
+    if not candidates:
+        return spans
+    windows = [strings[c.string_index][c.start:c.end] for c in candidates]
+    inputs = np.array([c.features(window) for window, c in zip(windows, candidates)])
+    probabilities = classifier.predict_proba(inputs)
+    for c, window, probability in zip(candidates, windows, probabilities.tolist()):
+        if probability > 0.5 and s_filter.pre_filter(window) and s_filter.post_filter(window):
+            # windows whose ends are aligned to delimiters are preferred, since positive windows shifted by a few
+            # characters around a key are classified as API keys too
+            score = (_aligned_boundaries(strings[c.string_index], c.start, c.end), probability)
+            spans[c.string_index].append((c.start, c.end, score))
+    spans = [[(start, end) for start, end, _ in _suppress_overlaps(string_spans)] for string_spans in spans]
+    windows_spans = set((string_index, start, end)
+                        for string_index, string_spans in enumerate(spans) for start, end in string_spans)
+
+    # refined spans are kept only if the whole-string detector agrees they are still API keys. "/" is part of
+    # some API keys (e.g. base64 ones) but it is a path separator too, so spans including it are tried first
+    for delimiters in (DELIMITERS - {"/"}, DELIMITERS):
+        refinements = []
+        for string_index, string_spans in enumerate(spans):
+            for position, (start, end) in enumerate(string_spans):
+                if (string_index, start, end) not in windows_spans:
+                    # already refined
+                    continue
+                refined = _refine_span(strings[string_index], start, end, s_filter.max_key_length, delimiters)
+                if refined != (start, end):
+                    refinements.append((string_index, position, refined))
+        detection = detect_api_keys([strings[string_index][start:end]
+                                     for string_index, _, (start, end) in refinements])
+        for (string_index, position, refined), is_api_key in zip(refinements, detection):
+            if is_api_key:
+                spans[string_index][position] = refined
+    # a window whose refinement was rejected may cut the key it overlaps, or include part of what surrounds it:
+    # it is kept only if both its ends are aligned to delimiters
+    spans = [[(start, end) for start, end in string_spans if (string_index, start, end) not in windows_spans or
+              _aligned_boundaries(strings[string_index], start, end) == 2]
+             for string_index, string_spans in enumerate(spans)]
+    return [_drop_overlaps(string_spans) for string_spans in spans]
+
+
+def extract_api_keys(strings, window_lengths=DEFAULT_WINDOW_LENGTHS):
+    """
+    :param strings: an iterable of strings, either str or UTF-8 encoded bytes-like objects
+    :param window_lengths: lengths of the sliding windows, i.e. of the API keys that can be found
+    :return: the API keys embedded inside the strings, decoded
+    :rtype: list
+    """
+    strings = [string if isinstance(string, str) else bytes(string).decode(ENCODING, errors="replace")
+               for string in strings]
+    keys = []
+    for string, string_spans in zip(strings, detect_api_key_spans(strings, window_lengths)):
+        keys.extend(string[start:end] for start, end in string_spans)
+    return keys
@@ -0,0 +1,192 @@
+"""
+Lookup-grid surrogate of a trained StringBinaryClassifier.
+The charset length feature only takes one value for each charset, so the classifier is evaluated offline, for each
+charset, on a dense 3-D grid over entropy, sequentiality and gibberish (whose points follow the quantiles of the
+training features, plus evenly spaced ones). At runtime, probabilities are interpolated (trilinearly) from the 8
+grid points around each input, with a few vectorized array reads. Inputs whose grid cell is not entirely on one
+side of the decision boundary, with a margin (or that fall outside the grid), are classified by the real
+classifier. Decisions are an approximation: only the corners of the cells are checked, so a classifier that crosses
+0.5 inside a cell whose corners are all more than BOUNDARY_MARGIN away from it is decided by the interpolation.
+The finer the grid (GRID_POINTS), the rarer such cells.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from itertools import product
+
+import numpy as np
+
+from . import charset as cset
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# features sample used to place the grid points
+DEFAULT_SAMPLE = os.path.join(__location__, "datasets", "classifier_learnset.npy")
+GRID_POINTS = 64
+# cells whose corners are within this distance from 0.5 are considered too close to the decision boundary
+BOUNDARY_MARGIN = 0.02
+N_GRID_FEATURES = 3
+CHARSET_LENGTHS = np.array(sorted(set(len(str(charset)) for charset in cset.Charset)), dtype=np.float64)
+
+
+def classifier_digest(classifier):
+    """
+    :return: hex SHA-256 digest of the pickled classifier, identifying the model a grid was computed from
+    :rtype: str
+    """
+    return hashlib.sha256(pickle.dumps(classifier, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+class SurrogateClassifier(object):
+    """
+    Drop-in replacement of StringBinaryClassifier for predictions
+    """
+
+    def __init__(self, classifier, axes, grid, digest=None):
+        """
+        :param classifier: the classifier the grid was computed from, used as fallback
+        :param axes: the sorted grid points of each of the 3 continuous features
+        :param grid: a (charsets, len(axes[0]), len(axes[1]), len(axes[2])) array of class 1 probabilities
+        :param digest: classifier_digest of classifier
+        """
+        self.classifier = classifier
+        self.axes = [np.asarray(axis, dtype=np.float64) for axis in axes]
+        self.grid = grid
+        self.digest = digest
+        # statistics of the latest calls, for tuning
+        self.lookups = 0
+        self.fallbacks = 0
+        self._statistics_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, classifier, inputs, points=GRID_POINTS):
+        """
+        Evaluates the classifier on the grid
+
+        :param classifier: a trained StringBinaryClassifier
+        :param inputs: a sample of feature rows (e.g. the training set), used to place the grid points
+        :param points: maximum number of grid points along each feature
+        :rtype: SurrogateClassifier
+        """
+        # half of the points follow the quantiles of the features, where most of the strings are, the other half
+        # is evenly spaced, so that no cell (e.g. in the tails of the distributions) is too wide
+        quantiles = np.linspace(0, 1, points // 2)
+        axes = [np.unique(np.concatenate([np.quantile(inputs[:, d], quantiles),
+                                          np.linspace(inputs[:, d].min(), inputs[:, d].max(), points - points // 2)]))
+                for d in range(N_GRID_FEATURES)]
+        shape = tuple(len(axis) for axis in axes)
+        mesh = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, N_GRID_FEATURES)
+        grid = np.empty((len(CHARSET_LENGTHS),) + shape, dtype=np.float32)
+        for k, charset_length in enumerate(CHARSET_LENGTHS):
+            rows = np.column_stack([mesh, np.full(len(mesh), charset_length)])
+            grid[k] = classifier.predict_proba(rows).reshape(shape)
+        return cls(classifier, axes, grid, classifier_digest(classifier))
+
+    def _interpolate(self, inputs):
+        """
+        :return: the interpolated probabilities and a mask of the inputs whose decision can be taken from the grid
+        :rtype: (np.array, np.array)
+        """
+        charset_ids = np.searchsorted(CHARSET_LENGTHS, inputs[:, N_GRID_FEATURES])
+        charset_ids = np.minimum(charset_ids, len(CHARSET_LENGTHS) - 1)
+        exact = CHARSET_LENGTHS[charset_ids] == inputs[:, N_GRID_FEATURES]
+        cells = []
+        fractions = []
+        for d, axis in enumerate(self.axes):
+            x = inputs[:, d]
+            exact &= (x >= axis[0]) & (x <= axis[-1])
+            i = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+            cells.append(i)
+            fractions.append(np.clip((x - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0))
+        probabilities = np.zeros(len(inputs))
+        low = np.ones(len(inputs))
+        high = np.zeros(len(inputs))
+        for corner in product((0, 1), repeat=N_GRID_FEATURES):
+            values = self.grid[charset_ids, cells[0] + corner[0], cells[1] + corner[1], cells[2] + corner[2]]
+            weights = np.ones(len(inputs))
+            for d, offset in enumerate(corner):
+                weights *= fractions[d] if offset else 1.0 - fractions[d]
+            probabilities += weights * values
+            low = np.minimum(low, values)
+            high = np.maximum(high, values)
+        exact &= (low > 0.5 + BOUNDARY_MARGIN) | (high < 0.5 - BOUNDARY_MARGIN)
+        return probabilities, exact
+
+    def predict_proba(self, inputs):
+        """
+        :param inputs: matrix where each row contains input features
+        :return: the (approximate, far from the decision boundary) class 1 probability for each input
+        :rtype: np.array
+        """
+        probabilities, exact = self._interpolate(inputs)
+        if not exact.all():
+            probabilities[~exact] = self.classifier.predict_proba(inputs[~exact])
+        self._count(exact)
+        return probabilities
+
+    def predict(self, inputs):
+        """
+        :param inputs: matrix where each row contains input features
+        :return: a list of class predictions, one element for each input
+        :rtype: np.array
+        """
+        probabilities, exact = self._interpolate(inputs)
+        predictions = (probabilities > 0.5).astype(np.float64)
+        if not exact.all():
+            predictions[~exact] = self.classifier.predict(inputs[~exact])
+        self._count(exact)
+        return predictions
+
+    def _count(self, exact):
+        # predictions can run concurrently, in different threads
+        with self._statistics_lock:
+            self.lookups += int(exact.sum())
+            self.fallbacks += int((~exact).sum())
+
+
+def save_surrogate(surrogate, file_path):
+    # write-then-rename, like the other derived artifacts
+    tmp_path = file_path + ".tmp.npz"
+    np.savez(tmp_path, grid=surrogate.grid, digest=np.array(surrogate.digest),
+             **{"axis{0}".format(d): axis for d, axis in enumerate(surrogate.axes)})
+    os.replace(tmp_path, file_path)
+
+
+def load_surrogate(classifier, file_path):
+    """
+    :return: the surrogate stored in file_path, None if it was computed from a different classifier
+    :rtype: SurrogateClassifier
+    """
+    with np.load(file_path) as data:
+        digest = str(data["digest"])
+        if digest != classifier_digest(classifier):
+            return None
+        axes = [data["axis{0}".format(d)] for d in range(N_GRID_FEATURES)]
+        return SurrogateClassifier(classifier, axes, data["grid"], digest)
+
+
+def load_or_create_surrogate(classifier, file_path, rebuild=False, inputs=None):
+    """
+    Loads the surrogate of classifier stored in file_path, (re)building it if missing or out of date
+
+    :param classifier: a trained StringBinaryClassifier
+    :param file_path: where the surrogate grid is stored
+    :param rebuild: if the surrogate should be re-built even if it is up to date
+    :param inputs: a sample of feature rows, used to place the grid points if the surrogate has to be built;
+                   defaults to the features of the training set in DEFAULT_SAMPLE
+    :rtype: SurrogateClassifier
+    """
+    if os.path.exists(file_path) and not rebuild:
+        surrogate = load_surrogate(classifier, file_path)
+        if surrogate is not None:
+            return surrogate
+        logging.info("Surrogate grid '{0}' is out of date".format(file_path))
+    logging.info("Building surrogate grid '{0}'...".format(file_path))
+    if inputs is None:
+        inputs = np.load(DEFAULT_SAMPLE)[:, 0:-1]
+    surrogate = SurrogateClassifier.build(classifier, inputs)
+    save_surrogate(surrogate, file_path)
+    logging.info("Surrogate grid saved to {0}".format(file_path))
+    return surrogate
@@ -0,0 +1,65 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.neural_network import MLPClassifier
+
+from ..classifier_backends import BACKENDS, ClassifierBackend, MLPBackend, create_backend
+from ..string_classifier import StringBinaryClassifier
+
+PARAMS = {"mlp": {"hidden_layer_sizes": [8], "max_iter": 200},
+          "mlp_minibatch": {"hidden_layer_sizes": [8]},
+          "logistic_regression": {"degree": 2},
+          "random_forest": {"n_estimators": 5, "max_depth": 3},
+          "gradient_boosting": {"n_estimators": 10, "max_depth": 2}}
+
+
+def _data():
+    rng = np.random.RandomState(0)
+    inputs = rng.normal(size=(300, 4))
+    return inputs, (inputs[:, 0] - inputs[:, 2] > 0).astype(float)
+
+
+@pytest.mark.parametrize("name", sorted(BACKENDS))
+def test_backends_round_trip(name):
+    inputs, outputs = _data()
+    backend = create_backend(name, PARAMS[name])
+    backend.train(inputs, outputs)
+    probabilities = backend.predict_proba(inputs)
+    assert probabilities.shape == (len(inputs),)
+    assert np.mean((probabilities > 0.5) == outputs) > 0.8
+    restored = ClassifierBackend.deserialize(backend.serialize())
+    assert type(restored) is type(backend)
+    assert restored.describe() == backend.describe()
+    assert np.array_equal(restored.predict_proba(inputs), probabilities)
+    assert np.array_equal(pickle.loads(pickle.dumps(backend)).predict(inputs), backend.predict(inputs))
+
+
+def test_backend_parameters():
+    assert create_backend("mlp", {"hidden_layer_sizes": [8, 8]}).params == {"hidden_layer_sizes": (8, 8),
+                                                                             "max_iter": 100}
+    assert create_backend().describe() == MLPBackend().describe()
+    with pytest.raises(ValueError):
+        create_backend("svm")
+
+
+def test_partial_train():
+    inputs, outputs = _data()
+    backend = create_backend("mlp_minibatch", PARAMS["mlp_minibatch"])
+    for start in range(0, len(inputs), 100):
+        backend.partial_train(inputs[start:start + 100], outputs[start:start + 100])
+    assert backend.predict(inputs).shape == (len(inputs),)
+    with pytest.raises(ValueError):
+        create_backend("random_forest").partial_train(inputs, outputs)
+
+
+def test_classifiers_pickled_before_backends_are_loaded():
+    inputs, outputs = _data()
+    network = MLPClassifier(hidden_layer_sizes=(8,), solver="lbfgs", max_iter=200, random_state=0)
+    network.fit(inputs, outputs)
+    classifier = StringBinaryClassifier.__new__(StringBinaryClassifier)
+    classifier.__setstate__({"_StringBinaryClassifier__neural_network": network, "input_mean": np.zeros(4),
+                             "input_stdev": np.ones(4)})
+    assert isinstance(classifier.backend, MLPBackend)
+    assert classifier.evaluation_report is None
+    assert np.array_equal(classifier.predict(inputs), network.predict(inputs))
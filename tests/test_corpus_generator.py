@@ -0,0 +1,67 @@
+import importlib
+import os
+import re
+
+import numpy as np
+import pytest
+
+KEYS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datasets", "keys")
+
+
+@pytest.fixture(scope="module")
+def corpus_generator():
+    # a script of the datasets, that imports api_key_generator from its own directory
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.syspath_prepend(KEYS_DIR)
+    yield importlib.import_module("corpus_generator")
+    monkeypatch.undo()
+
+
+def test_samplers_match_their_patterns(corpus_generator):
+    rng = np.random.default_rng(0)
+    for provider, pattern in sorted(corpus_generator.regs.items()):
+        for distribution in corpus_generator.LENGTH_DISTRIBUTIONS:
+            sampler = corpus_generator.PatternSampler(pattern, distribution)
+            keys = corpus_generator.pack_rows(*sampler.sample(rng, 50)).decode("latin-1").split("\n")[:-1]
+            assert len(keys) == 50
+            for key in keys:
+                assert re.fullmatch(pattern, key), (provider, key)
+
+
+def test_unsupported_patterns_are_rejected(corpus_generator):
+    with pytest.raises(ValueError):
+        corpus_generator.PatternSampler("(ab)+")
+    with pytest.raises(ValueError):
+        corpus_generator.PatternSampler("[a-z]{8}", "exponential")
+
+
+def _read_corpus(output_dir, manifest):
+    contents = []
+    for shard in manifest["shards"]:
+        for name in (shard["keys"], shard["texts"]):
+            with open(os.path.join(output_dir, name), "rb") as f:
+                contents.append(f.read())
+    return contents
+
+
+def test_corpus_does_not_depend_on_the_workers(corpus_generator, tmp_path):
+    providers = sorted(corpus_generator.regs)[:5]
+    corpora = []
+    for name, workers in (("one", 1), ("three", 3)):
+        output_dir = str(tmp_path / name)
+        manifest = corpus_generator.generate_corpus(output_dir, 500, 400, shards=3, workers=workers, seed=7,
+                                                    providers=providers, min_length=8, max_length=32)
+        corpora.append(_read_corpus(output_dir, manifest))
+        assert [shard["keys_count"] for shard in manifest["shards"]] == [167, 167, 166]
+        assert sum(shard["texts_count"] for shard in manifest["shards"]) == 400
+    assert corpora[0] == corpora[1]
+    keys = b"".join(corpora[0][0::2]).split(b"\n")[:-1]
+    texts = b"".join(corpora[0][1::2]).split(b"\n")[:-1]
+    assert len(keys) == 500 and len(texts) == 400
+    patterns = [re.compile(corpus_generator.regs[provider].encode("ascii")) for provider in providers]
+    assert all(any(pattern.fullmatch(key) for pattern in patterns) for key in keys)
+    assert all(0 < len(text) <= 32 for text in texts)
+
+    other = corpus_generator.generate_corpus(str(tmp_path / "other"), 500, 400, shards=3, workers=1, seed=8,
+                                             providers=providers, min_length=8, max_length=32)
+    assert _read_corpus(str(tmp_path / "other"), other) != corpora[0]
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from ..decision_surface import classifier_scores, decision_surfaces, grid_ranges
+
+
+class _Probabilities:
+    def predict_proba(self, inputs):
+        probabilities = 1 / (1 + np.exp(-inputs.sum(axis=1)))
+        return np.column_stack([1 - probabilities, probabilities])
+
+
+class _Decisions(_Probabilities):
+    def decision_function(self, inputs):
+        return inputs[:, 0] * inputs[:, 1] - inputs[:, 2] ** 2 + np.sin(inputs[:, 3])
+
+
+def _reference_surfaces(score_function, ranges):
+    # the whole grid at once, with its mean over the other dimensions
+    grid = np.meshgrid(*ranges, indexing="ij")
+    scores = score_function(np.column_stack([axis.ravel() for axis in grid])).reshape(grid[0].shape)
+    surfaces = OrderedDict()
+    for i in range(len(ranges)):
+        for j in range(i + 1, len(ranges)):
+            others = tuple(k for k in range(len(ranges)) if k not in (i, j))
+            surfaces[(i, j)] = scores.mean(axis=others).T
+    return surfaces
+
+
+def test_grid_ranges():
+    inputs = np.array([[0.0, -1.0], [1.0, 1.0], [0.5, 0.0]])
+    ranges = grid_ranges(inputs, 0.25, margin=0.1)
+    assert len(ranges) == 2
+    assert np.allclose(ranges[0], np.arange(-0.1, 1.1, 0.25))
+    assert np.allclose(ranges[1], np.arange(-1.2, 1.2, 0.25))
+
+
+def test_surfaces_match_the_whole_grid():
+    ranges = [np.linspace(-1, 1, 5), np.linspace(0, 2, 7), np.linspace(-2, 1, 4), np.linspace(0, 3, 6)]
+    score_functions = OrderedDict([("decisions", classifier_scores(_Decisions())),
+                                   ("probabilities", classifier_scores(_Probabilities()))])
+    # blocks that don't divide the grid, more blocks than threads
+    surfaces = decision_surfaces(score_functions, ranges, block_size=37, max_workers=3)
+    assert list(surfaces) == ["decisions", "probabilities"]
+    for name, score_function in score_functions.items():
+        reference = _reference_surfaces(score_function, ranges)
+        assert list(surfaces[name]) == list(reference)
+        for pair, surface in reference.items():
+            assert surfaces[name][pair].shape == (len(ranges[pair[1]]), len(ranges[pair[0]]))
+            assert np.allclose(surfaces[name][pair], surface)
+    single = decision_surfaces(score_functions, ranges, block_size=1 << 16, max_workers=1)
+    for name in score_functions:
+        assert all(np.allclose(single[name][pair], surfaces[name][pair]) for pair in surfaces[name])
@@ -0,0 +1,22 @@
+import shutil
+
+import pytest
+
+from ..git_scan import scan_git_history
+from .test_git_objects import KEY, _git, make_repository
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def test_scan_git_history_is_incremental(tmp_path):
+    repository = make_repository(tmp_path)
+    store = str(tmp_path / "store.sqlite")
+    findings = list(scan_git_history(str(repository), store))
+    introduced = _git(repository, "log", "--format=%H", "--", "Config.java").decode().split()[-1]
+    assert [(finding.commit, finding.path, finding.line, finding.value) for finding in findings] == [
+        (introduced, "Config.java", 2, KEY)]
+
+    (repository / "Config.java").write_text("class Config {}\n")
+    _git(repository, "commit", "-q", "-a", "-m", "remove the key")
+    # the key stays in the history
+    assert [finding.value for finding in scan_git_history(str(repository), store)] == [KEY]
@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+from .. import hyperparameter_search
+from ..hyperparameter_search import (RESULT_FIELDS, TEST_FIELDS, VALIDATION_FRACTION, best_configuration,
+                                     dump_results, load_search_space, prepare_matrices, run_search)
+from ..string_classifier import N_FEATURES
+
+
+def _write_matrix(path, rows, seed):
+    # two well separated classes
+    rng = np.random.default_rng(seed)
+    outputs = rng.integers(0, 2, size=rows)
+    inputs = rng.normal(loc=10.0, scale=2.0, size=(rows, N_FEATURES)) + 6.0 * outputs[:, None]
+    np.save(path, np.column_stack([inputs, outputs]).astype(np.float64))
+    return str(path)
+
+
+@pytest.fixture
+def matrices(tmp_path):
+    return _write_matrix(tmp_path / "train.npy", 3000, 0), _write_matrix(tmp_path / "test.npy", 500, 1)
+
+
+def test_load_search_space(tmp_path):
+    file_path = tmp_path / "space.json"
+    file_path.write_text(json.dumps([{"name": "mlp", "params": {"max_iter": 10}}, {"name": "logistic_regression"}]))
+    assert load_search_space(str(file_path)) == [("mlp", {"max_iter": 10}), ("logistic_regression", {})]
+
+
+def test_prepare_matrices_splits_and_standardizes(matrices, tmp_path):
+    training_set, _ = matrices
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    train_path, validation_path, mean, std = prepare_matrices(training_set, str(work_dir), seed=3, block_rows=700)
+    matrix = np.load(training_set)
+    assert np.allclose(mean, matrix[:, :-1].mean(axis=0)) and np.allclose(std, matrix[:, :-1].std(axis=0))
+    train, validation = np.load(train_path), np.load(validation_path)
+    assert len(train) + len(validation) == len(matrix)
+    assert abs(len(validation) - VALIDATION_FRACTION * len(matrix)) < 0.05 * len(matrix)
+    both = np.concatenate([train, validation])
+    assert np.allclose(both[:, :-1].mean(axis=0), 0, atol=1e-9) and np.allclose(both[:, :-1].std(axis=0), 1)
+    # every row is kept once, with its class
+    restored = np.column_stack([both[:, :-1] * std + mean, both[:, -1]])
+    assert np.allclose(np.sort(restored, axis=0), np.sort(matrix, axis=0))
+    again = prepare_matrices(training_set, str(work_dir), seed=3, block_rows=700)
+    assert np.array_equal(np.load(again[1]), validation)
+
+
+def test_unknown_backends_fail_early(matrices):
+    with pytest.raises(ValueError):
+        run_search([("no_such_backend", {})], *matrices, workers=1)
+
+
+def test_run_search(matrices, tmp_path):
+    search_space = [("logistic_regression", {"degree": 2}),
+                    ("mlp_minibatch", {"hidden_layer_sizes": (8,), "learning_rate_init": 0.01})]
+    results, test_result, classifier = run_search(search_space, *matrices, workers=2, time_budget=10.0,
+                                                  max_epochs=5, patience=2, batch_size=128)
+    assert len(results) == 2 and all(list(result) == RESULT_FIELDS for result in results)
+    assert sorted(result["name"] for result in results) == ["logistic_regression", "mlp_minibatch"]
+    assert [result["validation_errors"] for result in results] == sorted(
+        result["validation_errors"] for result in results)
+    minibatch = [result for result in results if result["name"] == "mlp_minibatch"][0]
+    assert 1 <= minibatch["epochs"] <= 5 and minibatch["stopped"] in ("max_epochs", "early_stopping")
+    # the best configuration is the returned classifier, measured on the test set alone (test_measures isn't
+    # imported by name, pytest would collect it)
+    assert classifier.backend.name == results[0]["name"]
+    assert list(test_result) == TEST_FIELDS
+    assert test_result == hyperparameter_search.test_measures(classifier, matrices[1])
+    assert test_result["accuracy"] > 0.95
+    assert test_result["errors"] == test_result["false_positives"] + test_result["false_negatives"]
+    configuration = best_configuration(classifier)["classifier_backend"]
+    assert configuration["name"] == results[0]["name"]
+    json.dumps(configuration)
+
+    file_path = tmp_path / "results.json"
+    dump_results(results, test_result, classifier, str(file_path))
+    dumped = json.loads(file_path.read_text())
+    assert dumped["test"] == test_result and dumped["best"]["classifier_backend"] == configuration
+    assert [result["name"] for result in dumped["results"]] == [result["name"] for result in results]
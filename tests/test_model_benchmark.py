@@ -0,0 +1,59 @@
+import csv
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+from sklearn.dummy import DummyClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from ..model_benchmark import RESULT_FIELDS, dump_results, median_seconds, pareto_front, run_benchmark
+
+
+def _result(name, errors, single, batch):
+    return {"name": name, "errors": errors, "single_latency_us": single, "batch_latency_us": batch}
+
+
+def test_pareto_front():
+    results = [_result("accurate", 1, 50.0, 5.0), _result("fast", 10, 5.0, 1.0), _result("balanced", 5, 10.0, 2.0),
+               _result("dominated", 5, 20.0, 2.0), _result("tie", 5, 10.0, 2.0)]
+    front = pareto_front(results)
+    assert [result["name"] for result in front] == ["accurate", "fast", "balanced", "tie"]
+    assert [result["pareto"] for result in results] == [True, True, True, False, True]
+    assert [result["name"] for result in pareto_front(results, objectives=("errors",))] == ["accurate"]
+
+
+def test_median_seconds():
+    calls = []
+    assert median_seconds(lambda: calls.append(1), 5) >= 0.0
+    assert len(calls) == 5
+
+
+def _write_matrix(path, rng, rows):
+    inputs = rng.normal(size=(rows, 4))
+    outputs = (inputs[:, 0] + inputs[:, 1] > 0).astype(float)
+    np.save(str(path), np.column_stack([inputs, outputs]))
+
+
+def test_run_benchmark_and_dump(tmp_path):
+    rng = np.random.RandomState(0)
+    _write_matrix(tmp_path / "train.npy", rng, 400)
+    _write_matrix(tmp_path / "test.npy", rng, 200)
+    candidates = OrderedDict([("tree", lambda: DecisionTreeClassifier(max_depth=4, random_state=0)),
+                              ("constant", lambda: DummyClassifier(strategy="constant", constant=0))])
+    results = run_benchmark(candidates, str(tmp_path / "train.npy"), str(tmp_path / "test.npy"))
+    assert [result["name"] for result in results] == ["tree", "constant"]
+    tree, constant = results
+    assert list(tree) == RESULT_FIELDS
+    assert tree["errors"] == tree["false_positives"] + tree["false_negatives"]
+    assert tree["accuracy"] == pytest.approx(1 - tree["errors"] / 200)
+    assert tree["errors"] < constant["errors"] and constant["false_positives"] == 0
+    assert tree["pareto"]
+
+    dump_results(results, str(tmp_path / "results.csv"))
+    with open(str(tmp_path / "results.csv"), newline="") as f:
+        assert [row["name"] for row in csv.DictReader(f)] == ["tree", "constant"]
+    dump_results(results, str(tmp_path / "results.json"))
+    with open(str(tmp_path / "results.json")) as f:
+        report = json.load(f)
+    assert report["pareto_front"] == [result["name"] for result in results if result["pareto"]]
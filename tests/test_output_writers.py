@@ -0,0 +1,61 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from ..output_writers import COLUMNS, create_writer, read_columnar
+from ..string_batch import StringBatch
+
+
+def _write(output_format, file_path):
+    with create_writer(output_format, file_path, sources=["a.txt", "b.txt"]) as writer:
+        writer.write_batch(StringBatch.from_strings(["one", "two", "three"]), np.array([False, True, False]),
+                           np.array([0.1, 0.9, 0.2]), offsets=[0, 4, 8], source_id=0)
+        writer.write_batch(StringBatch.from_strings(["four", "fïve"]), np.array([True, False]),
+                           np.array([0.75, 0.5]), source_id=1, indices=[0])
+
+
+def test_read_columnar_round_trip(tmp_path):
+    file_path = str(tmp_path / "results.bin")
+    _write("columnar", file_path)
+    sources, columns = read_columnar(file_path)
+    assert sources == ["a.txt", "b.txt"]
+    assert list(columns) == [name for name, _ in COLUMNS]
+    assert columns["index"].tolist() == [0, 1, 2, 3]
+    assert np.allclose(columns["score"], [0.1, 0.9, 0.2, 0.75])
+    assert columns["verdict"].tolist() == [0, 1, 0, 1]
+    assert columns["source"].tolist() == [0, 0, 0, 1]
+    assert columns["offset"].tolist() == [0, 4, 8, -1]
+
+
+def test_read_columnar_empty(tmp_path):
+    file_path = str(tmp_path / "results.bin")
+    create_writer("columnar", file_path).close()
+    sources, columns = read_columnar(file_path)
+    assert sources == ["<stdin>"]
+    assert all(len(values) == 0 for values in columns.values())
+
+
+def test_read_columnar_rejects_other_files(tmp_path):
+    file_path = tmp_path / "results.jsonl"
+    file_path.write_bytes(b"{}\n")
+    with pytest.raises(ValueError):
+        read_columnar(str(file_path))
+
+
+def test_jsonl_and_csv_records(tmp_path):
+    jsonl_path = str(tmp_path / "results.jsonl")
+    _write("jsonl", jsonl_path)
+    with open(jsonl_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["string"] for record in records] == ["one", "two", "three", "four"]
+    assert [record["source"] for record in records] == ["a.txt"] * 3 + ["b.txt"]
+    assert [record["api_key"] for record in records] == [False, True, False, True]
+
+    csv_path = str(tmp_path / "results.csv")
+    _write("csv", csv_path)
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["string"] for row in rows] == ["one", "two", "three", "four"]
+    assert [row["index"] for row in rows] == ["0", "1", "2", "3"]
@@ -0,0 +1,31 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from ..detector import detect_api_keys, filter_api_keys
+from ..parallel_detector import benchmark_threads, detect_api_keys_parallel, filter_api_keys_parallel
+from ..string_classifier import read_lines
+
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datasets")
+
+
+def _strings():
+    strings = read_lines(os.path.join(DATASETS, "keys", "api_test.txt"))[:500]
+    strings += read_lines(os.path.join(DATASETS, "text", "non_api_test.txt"))[:500]
+    return strings
+
+
+def test_parallel_detection_matches_the_detector():
+    strings = _strings()
+    expected = detect_api_keys(strings)
+    assert detect_api_keys_parallel(strings, max_workers=4, chunk_size=37) == expected
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert detect_api_keys_parallel(strings, executor, chunk_size=100) == expected
+        assert filter_api_keys_parallel(strings, executor, chunk_size=100) == filter_api_keys(strings)
+    assert detect_api_keys_parallel([], max_workers=2) == []
+
+
+def test_benchmark_threads():
+    strings = _strings()[:200]
+    report = benchmark_threads(strings, thread_counts=(1, 2), chunk_size=50, repeat=1)
+    assert [result["threads"] for result in report["results"]] == [1, 2]
+    assert report["strings"] == len(strings) and report["results"][0]["speedup"] == 1.0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from ..classifier_singleton import classifier
+from ..model_benchmark import TEST_SET, load_matrix
+from ..string_classifier import StringBinaryClassifier
+from ..surrogate import DEFAULT_SAMPLE, SurrogateClassifier, load_or_create_surrogate, load_surrogate, save_surrogate
+
+# real classifiers may be surrogates themselves
+CLASSIFIER = getattr(classifier, "classifier", classifier)
+
+
+@pytest.fixture(scope="module")
+def surrogate():
+    return SurrogateClassifier.build(CLASSIFIER, np.load(DEFAULT_SAMPLE)[:, 0:-1], points=24)
+
+
+def test_surrogate_agrees_with_the_classifier(surrogate):
+    inputs, _ = load_matrix(TEST_SET)
+    surrogate.lookups = surrogate.fallbacks = 0
+    predictions = surrogate.predict(inputs)
+    assert np.mean(predictions != CLASSIFIER.predict(inputs)) <= 0.001
+    assert surrogate.lookups + surrogate.fallbacks == len(inputs)
+    assert surrogate.lookups > surrogate.fallbacks
+    probabilities = surrogate.predict_proba(inputs)
+    assert np.array_equal(probabilities > 0.5, predictions == 1)
+
+
+def test_inputs_outside_the_grid_fall_back_to_the_classifier(surrogate):
+    inputs = np.array([[100.0, 100.0, 100.0, 16.0], [0.5, 0.01, 0.5, 17.0]])
+    surrogate.lookups = surrogate.fallbacks = 0
+    assert np.array_equal(surrogate.predict_proba(inputs), CLASSIFIER.predict_proba(inputs))
+    assert surrogate.fallbacks == len(inputs)
+
+
+def test_surrogate_round_trip(surrogate, tmp_path):
+    file_path = str(tmp_path / "surrogate.npz")
+    save_surrogate(surrogate, file_path)
+    loaded = load_surrogate(CLASSIFIER, file_path)
+    assert np.array_equal(loaded.grid, surrogate.grid)
+    assert all(np.array_equal(a, b) for a, b in zip(loaded.axes, surrogate.axes))
+    assert load_surrogate(StringBinaryClassifier(), file_path) is None
+    assert load_or_create_surrogate(CLASSIFIER, file_path).digest == surrogate.digest
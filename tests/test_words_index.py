@@ -0,0 +1,79 @@
+import os
+import stat
+
+import pytest
+
+from ..words_finder import WordsFinder, filter_characters
+from ..words_index import WordsIndex, atomic_writer, build_index, load_or_create_index
+
+WORDS = ["password", "pass", "word", "secret", "key", "café", "token", "tok"]
+STRINGS = ["mypassword123", "secretkeytoken", "cafébabe", "xyz", "tokenpass", "PASSWORD_Key", ""]
+
+
+@pytest.fixture
+def wordlist(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_text("\n".join(WORDS) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_index_contains_the_words(wordlist):
+    index = WordsIndex(build_index([wordlist]))
+    assert len(index) == len(WORDS)
+    assert index.max_length == max(len(word) for word in WORDS)
+    for word in map(filter_characters, WORDS):
+        assert word in index
+        assert word.encode("utf-8") in index
+    assert "café" not in index
+    assert "passwor" not in index and "keys" not in index and "" not in index
+    assert index.longest_prefix("passwordx", 0, 3, 16) == len("password")
+    assert index.longest_prefix(b"xpassx", 1, 3, 16) == len("pass")
+    assert index.longest_prefix("password", 0, 3, 6) == len("pass")
+
+
+def test_index_finds_the_same_words_as_the_set(wordlist, tmp_path):
+    in_memory = WordsFinder([wordlist])
+    indexed = WordsFinder([wordlist], str(tmp_path / "words.idx"))
+    assert indexed.index is not None
+    for string in STRINGS:
+        assert list(indexed.get_words_indexes(string)) == list(in_memory.get_words_indexes(string))
+
+
+def test_out_of_date_index_is_rebuilt(wordlist, tmp_path):
+    index_path = str(tmp_path / "words.idx")
+    assert "apikey" not in load_or_create_index([wordlist], index_path)
+    with open(wordlist, "a") as f:
+        f.write("apikey\n")
+    assert "apikey" in load_or_create_index([wordlist], index_path)
+
+
+def test_index_file_gets_the_default_permissions(wordlist, tmp_path):
+    index_path = str(tmp_path / "words.idx")
+    umask = os.umask(0o027)
+    try:
+        load_or_create_index([wordlist], index_path)
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(index_path).st_mode) == 0o640
+    assert sorted(os.listdir(str(tmp_path))) == ["words.idx", "words.txt"]
+
+
+def test_atomic_writer_keeps_the_previous_file_on_failure(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"previous")
+    with pytest.raises(RuntimeError):
+        with atomic_writer(str(path)) as f:
+            f.write(b"partial")
+            raise RuntimeError("interrupted")
+    assert path.read_bytes() == b"previous"
+    assert os.listdir(str(tmp_path)) == ["file.bin"]
+
+
+def test_read_only_directory_falls_back_to_the_set(wordlist, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise PermissionError("read-only")
+
+    monkeypatch.setattr("tempfile.mkstemp", fail)
+    finder = WordsFinder([wordlist], str(tmp_path / "words.idx"))
+    assert finder.index is None
+    assert list(finder.get_words_indexes("mypassword")) == [(2, 8, "password")]
@@ -0,0 +1,367 @@
+"""
+Continuous scan of directories (e.g. build outputs, artifact drops), driven by Linux inotify events.
+Created, modified and moved in files are queued and rescanned once their events stop for a debounce period, so that
+a burst of writes triggers a single rescan. Each file is scanned as a list of strings, one for each line, and its
+scan state (identity, size, offset of the last complete line scanned, digest of the bytes just before it) is kept:
+if the file only grew, i.e. it is the same file and the bytes before the offset didn't change, only the appended
+region is scanned, otherwise the whole file. Each API key is reported once for each file.
+The detection models are loaded once, when this module is imported, and stay loaded for the life of the watcher.
+"""
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import logging
+import os
+import select
+import struct
+import time
+
+from .detector import detect_api_keys_batch
+from .scan_job import MAX_LINE_BYTES, list_input_files, read_chunk
+from .string_batch import StringBatch
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_DEBOUNCE = 0.5
+# files that keep changing are rescanned at least this often
+DEFAULT_MAX_DELAY = 5.0
+# bytes before the scanned offset whose digest tells whether a file was only appended to
+TAIL_BYTES = 4096
+READ_SIZE = 1 << 16
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """
+    Minimal ctypes binding of the Linux inotify API
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        :return: the watch descriptor of path
+        :rtype: int
+        """
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self, timeout=None):
+        """
+        :param timeout: seconds to wait for the first event, None to wait forever
+        :return: the (watch descriptor, mask, name) of the available events, empty if the timeout expired
+        :rtype: list
+        """
+        if not self.poller.poll(None if timeout is None else max(0, int(timeout * 1000))):
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        position = 0
+        while position < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, position)
+            position += _EVENT.size
+            name = data[position:position + length].rstrip(b"\0")
+            position += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileState(object):
+    def __init__(self, identity):
+        """
+        :param identity: (device, inode) of the file
+        """
+        self.identity = identity
+        self.offset = 0
+        self.line = 0
+        self.tail_digest = None
+        self.findings = set()
+
+
+class WatchFinding(object):
+    def __init__(self, path, line, offset, value):
+        """
+        :param path: path of the file
+        :param line: line of the API key, 1-based
+        :param offset: byte offset of the line inside the file
+        :param value: the API key
+        """
+        self.path = path
+        self.line = line
+        self.offset = offset
+        self.value = value
+
+    def __str__(self):
+        return "{0}:{1}: {2}".format(self.path, self.line, self.value)
+
+
+def _tail_digest(f, offset):
+    f.seek(max(0, offset - TAIL_BYTES))
+    return hashlib.sha1(f.read(min(offset, TAIL_BYTES))).digest()
+
+
+class DirectoryWatcher(object):
+    def __init__(self, inputs, debounce=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param inputs: paths of files and/or directories to be watched, the latter recursively
+        :param debounce: seconds without events after which a changed file is rescanned
+        :param max_delay: maximum seconds between the first event of a file and its rescan
+        :param chunk_size: number of lines submitted to the detector at once
+        """
+        self.inputs = [os.path.abspath(path) for path in inputs]
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.chunk_size = chunk_size
+        self.inotify = None
+        self.directories = {}
+        # directories watched with all their files, and files watched through their directory alone
+        self.trees = set()
+        self.single_files = set()
+        self.states = {}
+        self.pending = {}
+
+    def start(self):
+        """
+        Watches the inputs
+
+        :return: the files that already exist
+        :rtype: list
+        """
+        self.inotify = Inotify()
+        for path in self.inputs:
+            if os.path.isdir(path):
+                self._watch_tree(path)
+            else:
+                self.single_files.add(path)
+                self._watch_directory(os.path.dirname(path))
+        return [path for path in list_input_files(self.inputs) if os.path.isfile(path)]
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _watch_directory(self, path):
+        try:
+            self.directories[self.inotify.add_watch(path)] = path
+        except OSError as e:
+            logging.warning("Cannot watch {0}: {1}".format(path, e))
+
+    def _watch_tree(self, path):
+        """
+        :return: the files inside path, that may have been created before the watch
+        :rtype: list
+        """
+        files = []
+        for root, dirs, file_names in os.walk(path):
+            self.trees.add(root)
+            self._watch_directory(root)
+            files.extend(os.path.join(root, file_name) for file_name in file_names)
+        return files
+
+    def _is_watched(self, directory, path):
+        return directory in self.trees or path in self.single_files
+
+    def handle_events(self, events, now):
+        """
+        Queues the files changed by events
+        """
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("inotify queue overflow: every file will be rescanned")
+                for path in list_input_files(self.inputs):
+                    self._queue(path, now)
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if not self._is_watched(directory, path):
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for file in self._watch_tree(path):
+                        self._queue(file, now)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.states.pop(path, None)
+                self.pending.pop(path, None)
+            else:
+                self._queue(path, now)
+
+    def _queue(self, path, now):
+        first, _ = self.pending.get(path, (now, now))
+        self.pending[path] = (first, now)
+
+    def due_files(self, now):
+        """
+        :return: the queued files whose events stopped for the debounce period (or waited for too long),
+                 removed from the queue
+        :rtype: list
+        """
+        due = [path for path, (first, last) in self.pending.items()
+               if now - last >= self.debounce or now - first >= self.max_delay]
+        for path in due:
+            del self.pending[path]
+        return sorted(due)
+
+    def next_deadline(self):
+        """
+        :return: when the next queued file will be due, None if the queue is empty
+        """
+        if not self.pending:
+            return None
+        return min(min(last + self.debounce, first + self.max_delay) for first, last in self.pending.values())
+
+    def scan_file(self, path):
+        """
+        Scans the region of path that changed since its last scan
+
+        :return: the findings not reported yet for path
+        :rtype: list
+        """
+        try:
+            f = open(path, "rb")
+        except OSError as e:
+            logging.debug("Skipping {0}: {1}".format(path, e))
+            self.states.pop(path, None)
+            return []
+        with f:
+            stat = os.fstat(f.fileno())
+            identity = (stat.st_dev, stat.st_ino)
+            state = self.states.get(path)
+            if state is None or state.identity != identity:
+                state = self.states[path] = FileState(identity)
+            elif stat.st_size < state.offset or _tail_digest(f, state.offset) != state.tail_digest:
+                # rewritten, not appended to
+                state.offset = state.line = 0
+            else:
+                logging.debug("Scanning {0} from offset {1}".format(path, state.offset))
+            f.seek(state.offset)
+            findings = []
+            while True:
+                lines = read_chunk(f, self.chunk_size)
+                if not lines:
+                    break
+                end = f.tell()
+                f.seek(end - 1)
+                if f.read(1) == b"\n" or end - lines[-1][0] >= MAX_LINE_BYTES:
+                    state.offset = end
+                else:
+                    # the last line may still be written: it is scanned next time, once complete
+                    state.offset = lines[-1][0]
+                    lines.pop()
+                if lines:
+                    findings.extend(self._detect(path, state, lines))
+                state.line += len(lines)
+                f.seek(end)
+            state.tail_digest = _tail_digest(f, state.offset)
+        return findings
+
+    def _detect(self, path, state, lines):
+        batch = StringBatch.from_strings([line for _, line in lines])
+        findings = []
+        for index in detect_api_keys_batch(batch).nonzero()[0].tolist():
+            value = batch[index]
+            if value not in state.findings:
+                state.findings.add(value)
+                findings.append(WatchFinding(path, state.line + index + 1, lines[index][0], value))
+        return findings
+
+    def run(self, initial_scan=True, duration=None):
+        """
+        Watches the inputs until duration expires
+
+        :param initial_scan: if True, the files that already exist are scanned first; otherwise, only what is
+                             appended to them (or the files created afterwards) is scanned
+        :param duration: seconds to watch for, None to watch forever
+        :return: a generator over the WatchFinding objects, as soon as they are found
+        """
+        files = self.start()
+        try:
+            for path in files:
+                if initial_scan:
+                    yield from self.scan_file(path)
+                else:
+                    self._skip_file(path)
+            end = None if duration is None else time.monotonic() + duration
+            while end is None or time.monotonic() < end:
+                deadline = self.next_deadline()
+                if end is not None:
+                    deadline = end if deadline is None else min(deadline, end)
+                timeout = None if deadline is None else deadline - time.monotonic()
+                events = self.inotify.read_events(timeout)
+                now = time.monotonic()
+                self.handle_events(events, now)
+                for path in self.due_files(now):
+                    yield from self.scan_file(path)
+        finally:
+            self.close()
+
+    def _skip_file(self, path):
+        """
+        Marks the current contents of path as scanned
+        """
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                state = self.states[path] = FileState((stat.st_dev, stat.st_ino))
+                for line in iter(lambda: f.readline(MAX_LINE_BYTES), b""):
+                    if line.endswith(b"\n") or len(line) >= MAX_LINE_BYTES:
+                        state.offset += len(line)
+                        state.line += 1
+                state.tail_digest = _tail_digest(f, state.offset)
+        except OSError as e:
+            logging.debug("Skipping {0}: {1}".format(path, e))
+
+
+def watch(inputs, debounce=DEFAULT_DEBOUNCE, initial_scan=True, duration=None):
+    """
+    Detects API keys inside files and directories as they change
+
+    :param inputs: paths of files and/or directories to be watched, the latter recursively
+    :param debounce: seconds without events after which a changed file is rescanned
+    :param initial_scan: if True, the files that already exist are scanned first
+    :param duration: seconds to watch for, None to watch forever
+    :return: a generator over the WatchFinding objects
+    """
+    return DirectoryWatcher(inputs, debounce).run(initial_scan, duration)
@@ -2,6 +2,7 @@ import logging
 import unicodedata
 
 INVALID_CHARS = " !\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~\n\r"
+INVALID_BYTES = INVALID_CHARS.encode('ascii')
 MIN_WORD_LENGTH = 3
 
 
@@ -9,11 +10,15 @@ def filter_characters(string, invalid_chars=INVALID_CHARS):
     """
     Removes invalid characters from a string
 
-    :param string: String to be sanitized
+    :param string: String to be sanitized; if ASCII bytes, it takes a faster path that skips
+                   the Unicode normalization (which would leave ASCII characters untouched anyway)
     :param invalid_chars: a string containing all invalid characters
     :return: the submitted string stripped from all the invalid characters
     :rtype: str
     """
+    if isinstance(string, bytes):
+        invalid_bytes = INVALID_BYTES if invalid_chars is INVALID_CHARS else invalid_chars.encode('ascii')
+        return string.translate(None, invalid_bytes).lower().decode('ascii')
     # remove invalid characters
     chars = []
     for c in string:
@@ -28,11 +33,29 @@ def filter_characters(string, invalid_chars=INVALID_CHARS):
 
 
 class WordsFinder(object):
-    def __init__(self, wordlists):
+    def __init__(self, wordlists, index_path=None, rebuild_index=False):
+        """
+        :param wordlists: paths of txt files containing one word for each line
+        :param index_path: if specified, the dictionary is memory-mapped from this prebuilt index
+                           (see words_index), built on the fly if missing or out of date
+        :param rebuild_index: if the index should be re-built even if it is up to date
+        """
         # initializing dictionary set
         self.dictionary = None
+        self.index = None
         self.max_length = 0
-        if wordlists:
+        if wordlists and index_path:
+            # imported here, since words_index depends on this module
+            from .words_index import load_or_create_index
+            try:
+                self.index = load_or_create_index(wordlists, index_path, rebuild_index)
+                self.dictionary = self.index
+                self.max_length = self.index.max_length
+            except OSError as e:
+                # e.g. a read-only installation, without a prebuilt index
+                logging.warning("Cannot use the words index '{0}', loading the wordlists in memory: {1}".format(
+                    index_path, e))
+        if wordlists and self.dictionary is None:
             self.dictionary = set()
             for txt in wordlists:
                 for line in open(txt, "r"):
@@ -41,6 +64,19 @@ class WordsFinder(object):
                         self.max_length = len(word)
                     self.dictionary.add(word)
 
+    @classmethod
+    def from_index(cls, index):
+        """
+        :param index: an already loaded WordsIndex
+        :return: a WordsFinder that uses the index as dictionary
+        :rtype: WordsFinder
+        """
+        finder = cls(None)
+        finder.index = index
+        finder.dictionary = index
+        finder.max_length = index.max_length
+        return finder
+
     def get_words_indexes(self, string):
         """
         Given a string, detects the largest substring that are dictionary words and returns
@@ -57,6 +93,18 @@ class WordsFinder(object):
         if not self.dictionary:
             logging.error("Dictionary uninitalized!")
             return
+        if self.index is not None:
+            # walk the trie just once for each position, looking for the longest word
+            data = string.encode("ascii") if string.isascii() else string
+            i = 0
+            while i < len(string) - (MIN_WORD_LENGTH - 1):
+                j = self.index.longest_prefix(data, i, MIN_WORD_LENGTH, self.max_length)
+                if j:
+                    yield (i, j, string[i:i + j])
+                    i += j
+                else:
+                    i += 1
+            return
         i = 0
         while i < len(string) - (MIN_WORD_LENGTH - 1):
             chunk = string[i:i + self.max_length]
@@ -4,6 +4,7 @@ Singleton implementation for WordsFinder object
 import os
 
 from . import config
+from .bundle_singleton import bundle
 from .words_finder import WordsFinder
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -12,4 +13,11 @@ wordlists = []
 for path in config.wordlists:
     wordlists.append(os.path.join(__location__, path))
 
-finder = WordsFinder(wordlists)
+index_path = None
+if config.words_index:
+    index_path = os.path.join(__location__, config.words_index)
+
+if bundle is not None:
+    finder = WordsFinder.from_index(bundle.words_index())
+else:
+    finder = WordsFinder(wordlists, index_path)
@@ -0,0 +1,239 @@
+"""
+Compact, memory-mappable dictionary index used by WordsFinder.
+Words are stored as a trie over their UTF-8 bytes, flattened into arrays: the children of each node are
+contiguous and sorted by label, so that a lookup step is a single (C-level) find over the labels array.
+The index is built once from the wordlists and then memory-mapped read-only, so loading it is instantaneous
+and its pages are shared among all the processes using it.
+"""
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from collections import deque
+
+from .words_finder import filter_characters
+
+MAGIC = b"AKDWORDS"
+VERSION = 1
+# magic, version, max word length, nodes count, padding, wordlists digest
+HEADER = struct.Struct("<8sIIII32s")
+HEADER_SIZE = 64
+BYTES = [bytes([i]) for i in range(256)]
+
+
+def wordlists_digest(wordlists):
+    """
+    :param wordlists: paths of the wordlists
+    :return: SHA-256 digest of the wordlists content
+    :rtype: bytes
+    """
+    digest = hashlib.sha256()
+    for txt in wordlists:
+        with open(txt, "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def _align(size):
+    return (size + 7) // 8 * 8
+
+
+def strip_line_terminators(line):
+    return line.replace('\n', '').replace('\r', '')
+
+
+def build_index(wordlists, sanitize=filter_characters):
+    """
+    Builds the index for the words contained in the wordlists
+
+    :param wordlists: paths of txt files containing one word for each line
+    :param sanitize: function applied to each line before indexing it
+    :return: the serialized index
+    :rtype: bytes
+    """
+    max_length = 0
+    root = {}
+    # marks the end of a word inside the nested dictionaries
+    end = None
+    for txt in wordlists:
+        for line in open(txt, "r"):
+            word = sanitize(line)
+            max_length = max(max_length, len(word))
+            node = root
+            for b in word.encode("utf-8"):
+                node = node.setdefault(b, {})
+            node[end] = True
+
+    # breadth-first numbering, so that the children of each node are contiguous and sorted
+    first_child = []
+    child_count = []
+    is_word = []
+    labels = []
+    queue = deque([(0, root)])
+    next_id = 1
+    while queue:
+        label, node = queue.popleft()
+        children = sorted(b for b in node if b is not end)
+        first_child.append(next_id)
+        child_count.append(len(children))
+        is_word.append(1 if end in node else 0)
+        labels.append(label)
+        for b in children:
+            queue.append((b, node[b]))
+        next_id += len(children)
+
+    nodes = len(labels)
+    header = HEADER.pack(MAGIC, VERSION, max_length, nodes, 0, wordlists_digest(wordlists))
+    parts = [header.ljust(HEADER_SIZE, b"\0"),
+             struct.pack("<{0}I".format(nodes), *first_child).ljust(_align(4 * nodes), b"\0"),
+             struct.pack("<{0}I".format(nodes), *child_count).ljust(_align(4 * nodes), b"\0"),
+             bytes(is_word).ljust(_align(nodes), b"\0"),
+             bytes(labels)]
+    return b"".join(parts)
+
+
+class WordsIndex(object):
+    """
+    Read-only view over a serialized index. Supports the "in" operator, like the set of words it replaces
+    """
+
+    def __init__(self, buffer, offset=0):
+        """
+        :param buffer: the serialized index, or a larger buffer containing it (e.g. a mmap)
+        :param offset: where the index starts inside buffer
+        """
+        magic, version, self.max_length, nodes, _, self.digest = HEADER.unpack_from(buffer, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Invalid words index")
+        self.buffer = buffer
+        view = memoryview(buffer)
+        position = offset + HEADER_SIZE
+        self.first_child = view[position:position + 4 * nodes].cast("I")
+        position += _align(4 * nodes)
+        self.child_count = view[position:position + 4 * nodes].cast("I")
+        position += _align(4 * nodes)
+        self.is_word = view[position:position + nodes]
+        position += _align(nodes)
+        self.labels_offset = position
+        self.size = position + nodes - offset
+
+    @classmethod
+    def open(cls, index_path):
+        """
+        Memory-maps an index file, read-only
+        """
+        with open(index_path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _child(self, node, b):
+        """
+        :return: the child of node whose label is the byte b, or -1
+        """
+        first = self.labels_offset + self.first_child[node]
+        found = self.buffer.find(BYTES[b], first, first + self.child_count[node])
+        if found < 0:
+            return -1
+        return found - self.labels_offset
+
+    def longest_prefix(self, string, start, min_length, max_length):
+        """
+        Finds the longest dictionary word that is a prefix of string[start:]
+
+        :param string: a (filtered) string; ASCII strings can be passed as bytes, for speed
+        :param start: index of the first character
+        :param min_length: minimum length of the word
+        :param max_length: maximum length of the word
+        :return: the length of the longest word, 0 if none was found
+        :rtype: int
+        """
+        node = 0
+        longest = 0
+        if isinstance(string, bytes):
+            for length, b in enumerate(string[start:start + max_length], 1):
+                node = self._child(node, b)
+                if node < 0:
+                    return longest
+                if length >= min_length and self.is_word[node]:
+                    longest = length
+            return longest
+        for length, c in enumerate(string[start:start + max_length], 1):
+            for b in c.encode("utf-8"):
+                node = self._child(node, b)
+                if node < 0:
+                    return longest
+            if length >= min_length and self.is_word[node]:
+                longest = length
+        return longest
+
+    def __contains__(self, word):
+        node = 0
+        for b in word if isinstance(word, bytes) else word.encode("utf-8"):
+            node = self._child(node, b)
+            if node < 0:
+                return False
+        return bool(self.is_word[node])
+
+    def __len__(self):
+        return sum(self.is_word)
+
+    def __bool__(self):
+        return len(self.is_word) > 1
+
+
+@contextlib.contextmanager
+def atomic_writer(path):
+    """
+    Writes a file with a rename, so that its readers (including the processes that already mapped it) see either
+    the whole previous file or the whole new one. The temporary file is unique, so that processes writing the same
+    file at the same time don't clash, and gets the permissions of a file created by open() (mkstemp creates it
+    readable by its owner only); it is removed if writing fails
+
+    :param path: path of the file
+    :return: a context manager over the binary file object to write to
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            os.fchmod(f.fileno(), 0o666 & ~_umask())
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _umask():
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def save_index(data, index_path):
+    with atomic_writer(index_path) as f:
+        f.write(data)
+
+
+def load_or_create_index(wordlists, index_path, rebuild=False):
+    """
+    Memory-maps the index stored in index_path, (re)building it if missing or out of date with respect to
+    the wordlists
+
+    :param wordlists: paths of txt files containing one word for each line
+    :param index_path: path of the index file
+    :param rebuild: if the index should be re-built even if it is up to date
+    :return: a ready-to-be-used index
+    :rtype: WordsIndex
+    """
+    if os.path.exists(index_path) and not rebuild:
+        index = WordsIndex.open(index_path)
+        if index.digest == wordlists_digest(wordlists):
+            return index
+        logging.info("Words index '{0}' is out of date".format(index_path))
+    logging.info("Building words index '{0}'...".format(index_path))
+    save_index(build_index(wordlists), index_path)
+    logging.info("Words index saved to {0}".format(index_path))
+    return WordsIndex.open(index_path)